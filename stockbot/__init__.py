@@ -1,3 +1,3 @@
 #!/usr/bin/env python3
 
-__all__ = ["alphavantage", "financial", "metrics", "query"]
+__all__ = ["alphavantage", "features", "filelock", "financial", "httpclient", "instrumentation", "intents", "metrics", "nightly", "numpymodel", "predictbatcher", "predictioncache", "pricestore", "qrcache", "qrrender", "query", "quota", "responsecache", "symbolindex", "warmup"]
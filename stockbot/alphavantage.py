@@ -1,14 +1,28 @@
-import urllib.request, json
+from .responsecache import cachedJSON, acachedJSON, secondsUntilWeeklyClose, SYMBOL_SEARCH_TTL
+from .quota import alphaVantageQuota, INTERACTIVE
 
 #Makes use of the alphavantage api to return data about a specific stock
 
 def jsonReturn(keyword):
+    return jsonStrip(symbolSearch(keyword))
+
+async def ajsonReturn(keyword):
+    """Same as jsonReturn, but doesn't block the event loop"""
+    return jsonStrip(await asymbolSearch(keyword))
+
+def symbolSearch(keyword, priority = INTERACTIVE):
+    """Returns the full search results for a keyword, best match first"""
     keyword = spaceCheck(keyword)
-    url = "https://www.alphavantage.co/query?function=SYMBOL_SEARCH&keywords=" + keyword + "&apikey=VUUG2MG0ELJZOOGF"
-    with urllib.request.urlopen(url) as url:
-        data = json.loads(url.read().decode())
-        results = data["bestMatches"]
-        return jsonStrip(results)
+    url = "https://www.alphavantage.co/query?function=SYMBOL_SEARCH&keywords=" + keyword
+    data = cachedJSON(url, SYMBOL_SEARCH_TTL, "bestMatches", alphaVantageQuota, priority)
+    return data["bestMatches"]
+
+async def asymbolSearch(keyword, priority = INTERACTIVE):
+    """Same as symbolSearch, but doesn't block the event loop"""
+    keyword = spaceCheck(keyword)
+    url = "https://www.alphavantage.co/query?function=SYMBOL_SEARCH&keywords=" + keyword
+    data = await acachedJSON(url, SYMBOL_SEARCH_TTL, "bestMatches", alphaVantageQuota, priority)
+    return data["bestMatches"]
 
 def jsonStrip(results):
     acronyms = []
@@ -16,18 +30,28 @@ def jsonStrip(results):
         acronyms.append(results[i]["1. symbol"])
     return acronyms
 
+def jsonListings(results):
+    """Returns search results as (symbol, name, region) tuples"""
+    return [(result["1. symbol"], result["2. name"], result["4. region"]) for result in results]
+
 def spaceCheck(keyword):
     if (' ' in keyword):
         keyword = keyword.replace(' ','+')
     return keyword
 
-def time_series_weekly(stock):
-    """Returns weekly time series for a stock"""
-    url = "https://www.alphavantage.co/query?function=TIME_SERIES_WEEKLY&symbol=" + stock + "&apikey=VUUG2MG0ELJZOOGF"
-    with urllib.request.urlopen(url) as url:
-        data = json.loads(url.read().decode())
-        results = data["Weekly Time Series"]
-        return results
+def time_series_weekly(stock, priority = INTERACTIVE):
+    """Returns weekly time series for a stock. Background callers should pass quota.BACKGROUND as the priority"""
+    url = "https://www.alphavantage.co/query?function=TIME_SERIES_WEEKLY&symbol=" + stock
+    data = cachedJSON(url, secondsUntilWeeklyClose, "Weekly Time Series", alphaVantageQuota, priority)
+    results = data["Weekly Time Series"]
+    return results
+
+async def atime_series_weekly(stock, priority = INTERACTIVE):
+    """Same as time_series_weekly, but doesn't block the event loop"""
+    url = "https://www.alphavantage.co/query?function=TIME_SERIES_WEEKLY&symbol=" + stock
+    data = await acachedJSON(url, secondsUntilWeeklyClose, "Weekly Time Series", alphaVantageQuota, priority)
+    results = data["Weekly Time Series"]
+    return results
 
 
         
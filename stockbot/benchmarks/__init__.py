@@ -0,0 +1,3 @@
+#!/usr/bin/env python3
+
+__all__ = ["featureBenchmark", "httpClientBenchmark", "intentsBenchmark", "modelStartupBenchmark", "predictBatchBenchmark", "predictionCacheBenchmark", "qrMaskBenchmark", "qrPayloadBenchmark", "qrPngBenchmark", "quotaBenchmark", "responseCacheBenchmark", "webServerBenchmark", "workerPoolBenchmark"]
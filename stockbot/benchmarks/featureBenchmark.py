@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+from timeit import timeit
+import numpy as np
+from ..features import FeatureWindows, WINDOW_SIZE
+from ..predict import series_to_input
+
+
+# About 25 years of weekly bars
+WEEKS = 1300
+
+
+def makeSeries(weeks):
+    """ A weekly series shaped like Alpha Vantage's, newest first with closes as strings """
+    dates = np.datetime64("2019-12-27") - np.arange(weeks) * 7
+    closes = 100 + 20 * np.sin(np.arange(weeks)[::-1] / 10)
+    return {str(date): {"1. open": "0", "4. close": "{:.4f}".format(close)} for date, close in zip(dates, closes)}
+
+
+def legacySeriesToInput(t):
+    """ The old input builder: a head insert per bar, then the first 200 closes """
+    inTimeseries = []
+    for timestamp, data in t.items():
+        clos=float(data['4. close'])
+        inTimeseries.insert(0, clos)
+    inTimeseries = inTimeseries[:200]
+    return np.atleast_3d(inTimeseries)
+
+
+def runBenchmark(rounds = 200):
+    series = makeSeries(WEEKS)
+    dates = np.array(sorted(series.keys()), dtype="datetime64[D]")
+    closes = np.array([series[str(date)]["4. close"] for date in dates], dtype=np.float64)
+
+    # The window must be the latest closes, oldest first
+    window = FeatureWindows().getWindow("TEST", dates, closes)
+    if not np.array_equal(window[:, 0], closes[-WINDOW_SIZE:].astype(np.float32)) or not np.array_equal(series_to_input(series)[0], window):
+        raise Exception("Feature builders disagree")
+
+    legacyTime = timeit(lambda: legacySeriesToInput(series), number=rounds)
+    parseTime = timeit(lambda: series_to_input(series), number=rounds)
+
+    windows = FeatureWindows()
+    windows.getWindow("TEST", dates, closes)
+    cachedTime = timeit(lambda: windows.getWindow("TEST", dates, closes), number=rounds)
+
+    # Every call sees one more weekly bar than the last
+    grownDates = np.concatenate((dates, dates[-1] + 7 * np.arange(1, rounds + 1)))
+    grownCloses = np.concatenate((closes, closes[-1] + np.arange(1, rounds + 1)))
+    windows = FeatureWindows()
+    windows.getWindow("TEST", grownDates[:len(dates)], grownCloses[:len(dates)])
+    lengths = iter(range(len(dates) + 1, len(grownDates) + 1))
+
+    def roll():
+        length = next(lengths)
+        windows.getWindow("TEST", grownDates[:length], grownCloses[:length])
+    rollTime = timeit(roll, number=rounds)
+    if windows.getStats()["rolls"] != rounds:
+        raise Exception("Windows were rebuilt instead of rolled")
+
+    buildTime = timeit(lambda: FeatureWindows().getWindow("TEST", dates, closes), number=rounds)
+
+    print("Weekly series of {} bars, {} requests per builder".format(WEEKS, rounds))
+    print("Legacy dict loop with head inserts: {:.1f} us/request".format(legacyTime / rounds * 1e6))
+    print("Vectorised parse of the series dict: {:.1f} us/request".format(parseTime / rounds * 1e6))
+    print("Window built from stored closes: {:.1f} us/request".format(buildTime / rounds * 1e6))
+    print("Window rolled by one new bar: {:.1f} us/request".format(rollTime / rounds * 1e6))
+    print("Cached window, no new bars: {:.1f} us/request".format(cachedTime / rounds * 1e6))
+    print("Speedup of the cached path over the legacy loop: {:.0f}x".format(legacyTime / cachedTime))
+
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from time import perf_counter
+import urllib.request
+import gzip
+import json
+from ..httpclient import HTTPClient
+
+
+# A response roughly the size of a SYMBOL_SEARCH answer
+RESPONSE_BODY = json.dumps({"bestMatches": [{"1. symbol": "SYM{}".format(i), "2. name": "Company {}".format(i)} for i in range(10)]}).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ Answers every GET with the same JSON body, keeping the connection open """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = RESPONSE_BODY
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def timePerCall(function, calls):
+    start = perf_counter()
+    for i in range(calls):
+        function()
+    return (perf_counter() - start) / calls
+
+
+def runBenchmark(calls = 2000):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/query?function=SYMBOL_SEARCH&keywords=apple".format(httpd.server_address[1])
+
+    def oneShot():
+        with urllib.request.urlopen(url) as response:
+            return json.loads(response.read().decode())
+
+    client = HTTPClient()
+    if oneShot() != client.getJSON(url):
+        raise Exception("Clients returned different responses")
+
+    oneShotTime = timePerCall(oneShot, calls)
+    pooledTime = timePerCall(lambda: client.getJSON(url), calls)
+    httpd.shutdown()
+    httpd.server_close()
+
+    print("{} GET requests per client against a local stand-in server (plain HTTP, so no TLS handshake is saved)".format(calls))
+    print("urllib.request.urlopen: {:.1f} us/call".format(oneShotTime * 1e6))
+    print("Pooled HTTPClient: {:.1f} us/call".format(pooledTime * 1e6))
+    print("Speedup: {:.2f}x, connections {}".format(oneShotTime / pooledTime, client.getStats()))
+
+
+if __name__ == '__main__':
+    runBenchmark()
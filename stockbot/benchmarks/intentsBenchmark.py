@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+from timeit import timeit
+import re
+from ..intents import *
+
+
+# Statements covering every intent, plus statements that match nothing
+CORPUS = (
+    "What's the stock symbol for Microsoft?",
+    "what is the symbol of apple in 3rd/may/2019",
+    "Whats tesla's stock code?",
+    "What is General Electric's symbol",
+    "Should I invest in AAPL?",
+    "do you recommend my brother buys shares in tsla",
+    "what do you predict for this company msft",
+    "what are the stock predictions for this company amzn",
+    "What's 100 usd converted to gbp?",
+    "what is 5 eur in jpy",
+    "hello there",
+    "How are you doing today?",
+    "What is the weather like in london",
+    "tell me a joke about the stock market and its many symbols",
+    "what what what what what what what what what what what what what",
+)
+
+
+def legacyMatch(statement):
+    """ The old queryChatbot matching: builds every expression per call and tries them one by one """
+    flags = re.IGNORECASE
+    matches = re.match(whatRegex + optionalTheRegex + stockSymbolRegex + prepositionRegex + nameRegex + optionalDateRegex + questionEndRegex, statement, flags)
+    if matches != None:
+        return "stockSymbol", matches.groups()
+    matches = re.match(whatRegex + nameRegex + apostropheSRegex + stockSymbolRegex + optionalDateRegex + questionEndRegex, statement, flags)
+    if matches != None:
+        return "stockSymbol", matches.groups()
+    matches = re.match(recommendRegex + optionalNameRegex + investRegex + nameRegex + questionEndRegex, statement, flags)
+    if matches != None:
+        return "recommendation", matches.groups()
+    matches = re.match(predictRegex, statement, flags)
+    if matches != None:
+        return "prediction", matches.groups()
+    matches = re.match(whatRegex + numRegex + nameRegex + apostropheSRegex + convertRegex + nameRegex + questionEndRegex, statement, flags)
+    if matches != None:
+        return "currency", matches.groups()
+    return None, ()
+
+
+def runBenchmark(rounds = 2000):
+    # Both matchers must agree before timing means anything
+    for statement in CORPUS:
+        if legacyMatch(statement) != INTENT_MATCHER.match(statement):
+            raise Exception("Matchers disagree on {!r}".format(statement))
+
+    def legacyRun():
+        for statement in CORPUS:
+            legacyMatch(statement)
+
+    def compiledRun():
+        for statement in CORPUS:
+            INTENT_MATCHER.match(statement)
+
+    queries = rounds * len(CORPUS)
+    legacyTime = timeit(legacyRun, number=rounds)
+    compiledTime = timeit(compiledRun, number=rounds)
+    print("Corpus of {} statements, {} queries per matcher".format(len(CORPUS), queries))
+    print("Legacy sequential re.match: {:.2f} us/query".format(legacyTime / queries * 1e6))
+    print("Compiled single alternation: {:.2f} us/query".format(compiledTime / queries * 1e6))
+    print("Speedup: {:.2f}x".format(legacyTime / compiledTime))
+
+
+if __name__ == '__main__':
+    runBenchmark()
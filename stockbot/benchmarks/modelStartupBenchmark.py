@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+from os.path import dirname, realpath
+import subprocess
+import json
+import sys
+import numpy as np
+
+
+# Loads the model with one backend in a fresh interpreter, then reports load time, peak RSS and a prediction
+CHILD_SCRIPT = """
+from time import perf_counter
+start = perf_counter()
+from stockbot.predict import load_predict_model
+import numpy as np
+import resource
+import json
+import sys
+model = load_predict_model(sys.argv[1])
+loadTime = perf_counter() - start
+window = np.atleast_3d(np.linspace(100, 200, 200))
+output = float(np.asarray(model.predict(window))[0][0])
+peakKB = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"loadTime": loadTime, "peakRSS": peakKB / 1024, "output": output}))
+"""
+
+
+def measure(backend):
+    """ Cold-start the model in a subprocess and return its measurements """
+    repoRoot = dirname(dirname(dirname(realpath(__file__))))
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, backend], cwd=repoRoot, stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode().strip().splitlines()[-1])
+
+
+def runBenchmark():
+    numpyResult = measure("numpy")
+    try:
+        kerasResult = measure("keras")
+    except subprocess.CalledProcessError:
+        kerasResult = None
+
+    print("{:>8} {:>14} {:>14} {:>14}".format("backend", "cold start s", "peak RSS MiB", "prediction"))
+    for name, result in (("numpy", numpyResult), ("keras", kerasResult)):
+        if result == None:
+            print("{:>8} {:>14}".format(name, "unavailable"))
+        else:
+            print("{:>8} {:>14.2f} {:>14.1f} {:>14.5f}".format(name, result["loadTime"], result["peakRSS"], result["output"]))
+
+    if kerasResult != None:
+        if not np.isclose(numpyResult["output"], kerasResult["output"], rtol=1e-4):
+            raise Exception("NumPy and Keras predictions differ")
+        print("Cold start {:.1f}x faster, peak RSS {:.1f}x smaller".format(kerasResult["loadTime"] / numpyResult["loadTime"], kerasResult["peakRSS"] / numpyResult["peakRSS"]))
+
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+from threading import Thread
+from time import perf_counter
+import numpy as np
+from ..predict import load_predict_model
+from ..predictbatcher import PredictionBatcher
+
+
+def throughput(predict, callers, callsPerCaller):
+    """ Predictions per second with callers threads each predicting callsPerCaller single inputs """
+    window = np.atleast_3d(np.linspace(100, 200, 200))
+
+    def caller():
+        for i in range(callsPerCaller):
+            predict(window)
+
+    threads = [Thread(target=caller) for i in range(callers)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return callers * callsPerCaller / (perf_counter() - start)
+
+
+def runBenchmark(backend, maxWait, callerCounts = (1, 8, 64), totalCalls = 512):
+    model = load_predict_model(backend)
+    batcher = PredictionBatcher(model, maxWait=maxWait)
+
+    # Warm both paths up so graph building isn't timed
+    window = np.atleast_3d(np.linspace(100, 200, 200))
+    direct = np.asarray(model.predict_on_batch(window))[0][0]
+    batched = batcher.predict(window)[0][0]
+    if not np.isclose(direct, batched, rtol=1e-5):
+        raise Exception("Batched prediction {} differs from direct prediction {}".format(batched, direct))
+
+    print("Backend {}, max wait {} ms".format(backend, maxWait * 1000))
+    print("{:>7} {:>16} {:>16} {:>8} {:>10}".format("callers", "direct pred/s", "batched pred/s", "speedup", "mean batch"))
+    for callers in callerCounts:
+        callsPerCaller = max(1, totalCalls // callers)
+        batcher.batches = batcher.predictions = 0
+        directRate = throughput(model.predict_on_batch, callers, callsPerCaller)
+        batchedRate = throughput(batcher.predict, callers, callsPerCaller)
+        print("{:>7} {:>16.1f} {:>16.1f} {:>7.1f}x {:>10.1f}".format(callers, directRate, batchedRate, batchedRate / directRate, batcher.getStats()["meanBatchSize"]))
+    batcher.close()
+
+
+if __name__ == '__main__':
+    # Keras has a high per-call overhead, so it is worth waiting a little for a batch to fill
+    runBenchmark("keras", 0.005)
+    runBenchmark("numpy", 0)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+from timeit import timeit
+import tempfile
+import shutil
+import numpy as np
+from ..predictioncache import PredictionCache
+
+
+LAST_BAR = np.datetime64("2024-01-05")
+
+
+def checkCache(directory):
+    """ Check keying on the latest bar, reuse from disk, model invalidation and falling back to memory.
+        Raises an Exception describing the first thing that is wrong """
+    path = directory + "/predictions.sqlite"
+    cache = PredictionCache(path)
+    cache.setModel("model-a")
+    cache.put("MSFT", LAST_BAR, 1.5)
+    if cache.get("MSFT", LAST_BAR) != 1.5:
+        raise Exception("A stored prediction wasn't found")
+    if cache.get("MSFT", LAST_BAR + 7) != None:
+        raise Exception("A prediction was used for a newer weekly bar")
+
+    # A new process with the same model picks the prediction up from disk
+    reopened = PredictionCache(path)
+    reopened.setModel("model-a")
+    if reopened.get("MSFT", LAST_BAR) != 1.5:
+        raise Exception("A prediction wasn't reused from disk")
+
+    # Another model version drops it, in memory and on disk
+    reopened.setModel("model-b")
+    if reopened.get("MSFT", LAST_BAR) != None:
+        raise Exception("A prediction of an older model version was used")
+    cache.modelHash = "model-a"
+    cache._entries.clear()
+    if cache.get("MSFT", LAST_BAR) != None:
+        raise Exception("Setting a new model version left older predictions on disk")
+
+    # A cache file which can't be created leaves the cache working in memory
+    memoryOnly = PredictionCache(path + "/not-a-directory/predictions.sqlite")
+    memoryOnly.setModel("model-a")
+    memoryOnly.put("MSFT", LAST_BAR, 2.5)
+    if memoryOnly.get("MSFT", LAST_BAR) != 2.5:
+        raise Exception("The cache didn't fall back to memory")
+
+
+def runBenchmark(rounds = 10000):
+    directory = tempfile.mkdtemp()
+    try:
+        checkCache(directory)
+        print("Prediction cache checks passed")
+
+        cache = PredictionCache(directory + "/timing.sqlite")
+        cache.setModel("model")
+        cache.putMany(("SYM{}".format(i), LAST_BAR, float(i)) for i in range(1000))
+        hitTime = timeit(lambda: cache.get("SYM1", LAST_BAR), number=rounds)
+        missTime = timeit(lambda: cache.get("NONE", LAST_BAR), number=rounds // 10)
+        print("get() hit in memory: {:.2f} us, miss (asks SQLite): {:.2f} us".format(hitTime / rounds * 1e6, missTime / (rounds // 10) * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    runBenchmark()
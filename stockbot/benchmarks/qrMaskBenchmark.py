@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+from timeit import timeit
+from math import floor
+from ..qr_pil import QRCode, QR_ECC, Module, ModuleMatrix
+
+
+class LegacyModuleMatrix:
+    """ The old nested-list module matrix, kept only for comparing masking and penalty scoring """
+    def __init__(self, matrix):
+        self._width, self._height = matrix.getDimensions()
+        self._modules = [[matrix[x, y] for x in range(self._width)] for y in range(self._height)]
+
+    def copy(self):
+        matrixCopy = LegacyModuleMatrix.__new__(LegacyModuleMatrix)
+        matrixCopy._width = self._width
+        matrixCopy._height = self._height
+        matrixCopy._modules = [row.copy() for row in self._modules]
+        return matrixCopy
+
+    def __getitem__(self, pos):
+        return self._modules[pos[1]][pos[0]]
+
+    def __setitem__(self, pos, module):
+        self._modules[pos[1]][pos[0]] = module
+
+    def applyMask(self, mask):
+        for y in range(self._height):
+            for x in range(self._width):
+                thisModule = mask[x, y]
+                if thisModule == Module.Unset or self[x, y] == Module.Unset:
+                    continue
+                if thisModule == Module.Black:
+                    self[x, y] = Module.White if self[x, y] == Module.Black else Module.Black
+
+    def getPenaltyScore(self):
+        score = 0
+        for y in range(self._height):
+            length = 0
+            lastModule = Module.Unset
+            for x in range(self._width):
+                thisModule = self[x, y]
+                if thisModule == lastModule:
+                    length += 1
+                    if length == 5:
+                        score += 3
+                    elif length > 5:
+                        score += 1
+                else:
+                    length = 1
+                lastModule = thisModule
+        for x in range(self._width):
+            length = 0
+            lastModule = Module.Unset
+            for y in range(self._height):
+                thisModule = self[x, y]
+                if thisModule == lastModule:
+                    length += 1
+                    if length == 5:
+                        score += 3
+                    elif length > 5:
+                        score += 1
+                else:
+                    length = 1
+                lastModule = thisModule
+        for x in range(self._width - 1):
+            for y in range(self._height - 1):
+                expectedModule = self[x, y]
+                if expectedModule == self[x + 1, y] and expectedModule == self[x, y + 1] and expectedModule == self[x + 1, y + 1]:
+                    score += 3
+        firstSequence = [Module.Black, Module.White, Module.Black, Module.Black, Module.Black, Module.White, Module.Black, Module.White, Module.White, Module.White, Module.White]
+        secondSequence = list(reversed(firstSequence))
+        for x in range(self._width - 10):
+            for y in range(self._height):
+                for sequence in (firstSequence, secondSequence):
+                    if all(self[x + d, y] == sequence[d] for d in range(11)):
+                        score += 40
+        for y in range(self._height - 10):
+            for x in range(self._width):
+                for sequence in (firstSequence, secondSequence):
+                    if all(self[x, y + d] == sequence[d] for d in range(11)):
+                        score += 40
+        black = 0
+        white = 0
+        for x in range(self._width):
+            for y in range(self._height):
+                if self[x, y] == Module.Black:
+                    black += 1
+                else:
+                    white += 1
+        bwRatio = (black / white) * 100
+        prevMulPenalty = abs(floor(bwRatio / 5) * 5 - 50) // 5
+        nextMulPenalty = abs(floor((bwRatio + 5) / 5) * 5 - 50) // 5
+        score += min(prevMulPenalty, nextMulPenalty) * 10
+        return score
+
+
+def unmaskedCode(version, ecc):
+    """ Runs the QRCode pipeline up to (but not including) masking. Returns the code and its final masks """
+    code = QRCode.__new__(QRCode)
+    code.data_bytes = b'x' * QRCode.VERSION_LIST[version - 1][ecc]
+    code.ecc = ecc
+    code._findVersion()
+    payload = code._interleaveGroups(*code._genErrorCorrection(code._genEncodedData()))
+    qrLength = 21 + ((code.version - 1) * 4)
+    ModuleMatrix.__init__(code, qrLength, qrLength)
+    code._genBaseMatrix()
+    finalMasks = code._genFinalMasks()
+    code._populateBaseMatrix(payload)
+    return code, finalMasks
+
+
+def runBenchmark(versions = range(1, 41), ecc = QR_ECC.M):
+    print("Mask selection (8 masks + penalty scores), ECC {}".format(QR_ECC.asString(ecc)))
+    print("{:>7} {:>12} {:>12} {:>8}".format("version", "legacy ms", "array ms", "speedup"))
+    for version in versions:
+        code, finalMasks = unmaskedCode(version, ecc)
+        legacyCode = LegacyModuleMatrix(code)
+        legacyMasks = [LegacyModuleMatrix(mask) for mask in finalMasks]
+
+        def legacyRun():
+            scores = []
+            for mask in legacyMasks:
+                matrixCopy = legacyCode.copy()
+                matrixCopy.applyMask(mask)
+                scores.append(matrixCopy.getPenaltyScore())
+            return scores
+
+        def arrayRun():
+            return [matrix.getPenaltyScore() for matrix in code._maskAll()]
+
+        if legacyRun() != arrayRun():
+            raise Exception("Penalty scores differ for version {}".format(version))
+
+        rounds = max(1, 20 // version)
+        legacyTime = timeit(legacyRun, number=rounds) / rounds
+        arrayTime = timeit(arrayRun, number=rounds * 10) / (rounds * 10)
+        print("{:>7} {:>12.2f} {:>12.3f} {:>7.1f}x".format(version, legacyTime * 1e3, arrayTime * 1e3, legacyTime / arrayTime))
+
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+from timeit import timeit
+from math import ceil
+from bitstream import BitStream
+from numpy import uint8, uint16
+from reedsolo import RSCodec
+from ..qr_pil import QRCode, QR_ECC, ModuleMatrix
+
+
+def legacyPayload(code):
+    """ The old BitStream and RSCodec payload path, kept only for comparison. Returns the payload bits as a list of bools """
+    output = BitStream()
+    output.write([False, True, False, False], bool)
+    output.write(len(code.data_bytes), uint8 if code.version <= 9 else uint16)
+    output.write(code.data_bytes, bytes)
+    block_info = QRCode.BLOCK_LIST[code.version - 1][code.ecc]
+    req_bytes = code._dataCodewordCount()
+    output.write([False] * min(4, req_bytes * 8 - len(output)), bool)
+    output.write([False] * (ceil(len(output) / 8) * 8 - len(output)), bool)
+    for i in range(req_bytes - len(output) // 8):
+        output.write(17 if i % 2 else 236, uint8)
+    codewords = output.read(bytes)
+
+    sizes = [block_info[2]] * block_info[1] + ([block_info[4]] * block_info[3] if len(block_info) == 5 else [])
+    blocks = []
+    offset = 0
+    for size in sizes:
+        blocks.append(codewords[offset:offset + size])
+        offset += size
+    rscodec = RSCodec(block_info[0])
+    ecBlocks = [rscodec.encode(block)[len(block):] for block in blocks]
+
+    payload = BitStream()
+    for group in (blocks, ecBlocks):
+        for cw in range(max(len(block) for block in group)):
+            for block in group:
+                if cw < len(block):
+                    payload.write(block[cw], uint8)
+    payload.write([False] * QRCode.REMAINDER_LIST[code.version - 1], bool)
+    return [payload.read(bool) for _ in range(len(payload))]
+
+
+def legacyPopulate(code, bits):
+    """ The old per-module zigzag fill, kept only for comparison """
+    bits = iter(bits)
+    goingUp = True
+    for x in list(range(code._width - 2, 6, -2)) + list(range(4, -1, -2)):
+        yRange = range(code._height - 1, -1, -1) if goingUp else range(code._height)
+        for y in yRange:
+            for cx in (x + 1, x):
+                if code._modules[y, cx] == ModuleMatrix.UNSET:
+                    code._modules[y, cx] = ModuleMatrix.BLACK if next(bits) else ModuleMatrix.WHITE
+        goingUp = not goingUp
+
+
+def baseCode(version, ecc):
+    """ A code holding the most bytes the version takes, with its base matrix drawn but no payload yet """
+    code = QRCode.__new__(QRCode)
+    code.data_bytes = bytes(range(256)) * 12
+    code.data_bytes = code.data_bytes[:QRCode.VERSION_LIST[version - 1][ecc]]
+    code.ecc = ecc
+    code._findVersion()
+    qrLength = 21 + ((code.version - 1) * 4)
+    ModuleMatrix.__init__(code, qrLength, qrLength)
+    code._genBaseMatrix()
+    return code
+
+
+def runBenchmark(versions = (1, 5, 10, 20, 30, 40)):
+    # Every version and ECC level must match the old path bit for bit before timing means anything
+    for version in range(1, 41):
+        for ecc in QR_ECC:
+            code = baseCode(version, ecc)
+            payload = code._interleaveGroups(*code._genErrorCorrection(code._genEncodedData()))
+            legacyBits = legacyPayload(code)
+            if [bool(bit) for bit in payload] != legacyBits:
+                raise Exception("Payloads differ for version {} ECC {}".format(version, QR_ECC.asString(ecc)))
+            legacyCode = code.copy()
+            code._populateBaseMatrix(payload)
+            legacyPopulate(legacyCode, legacyBits)
+            if (code.getArray() != legacyCode.getArray()).any():
+                raise Exception("Module placement differs for version {} ECC {}".format(version, QR_ECC.asString(ecc)))
+    print("Payloads and placement match the old path for every version and ECC level")
+
+    print("Payload generation and placement, ECC M, largest payload per version")
+    print("{:>7} {:>12} {:>12} {:>8}".format("version", "legacy ms", "fast ms", "speedup"))
+    for version in versions:
+        code = baseCode(version, QR_ECC.M)
+        base = code.getArray().copy()
+
+        def legacyRun():
+            code._modules = base.copy()
+            legacyPopulate(code, legacyPayload(code))
+
+        def fastRun():
+            code._modules = base.copy()
+            code._populateBaseMatrix(code._interleaveGroups(*code._genErrorCorrection(code._genEncodedData())))
+
+        rounds = max(1, 40 // version)
+        legacyTime = timeit(legacyRun, number=rounds) / rounds
+        fastTime = timeit(fastRun, number=rounds * 10) / (rounds * 10)
+        print("{:>7} {:>12.2f} {:>12.3f} {:>7.1f}x".format(version, legacyTime * 1e3, fastTime * 1e3, legacyTime / fastTime))
+
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+from timeit import timeit
+from io import BytesIO
+from PIL import Image
+import numpy as np
+from ..qr_pil import QRCode, QR_ECC
+from ..qrrender import DEFAULT_SCALE, DEFAULT_BORDER
+
+
+PAYLOADS = (
+    "https://www.google.com/search?q=MSFT",
+    "https://www.google.com/search?q=" + "A" * 120,
+    "x" * 600,
+)
+
+
+def pilPNG(code, scale, border):
+    """ The PIL route: an image of the modules, grown to the same scale and quiet zone, saved as PNG """
+    image = code.toImage()
+    width, height = image.size
+    framed = Image.new("1", (width + 2 * border, height + 2 * border), 1)
+    framed.paste(image, (border, border))
+    framed = framed.resize((framed.size[0] * scale, framed.size[1] * scale), Image.NEAREST)
+    byteBuffer = BytesIO()
+    framed.save(byteBuffer, format="PNG")
+    return byteBuffer.getvalue()
+
+
+def runBenchmark(rounds = 200, scale = DEFAULT_SCALE, border = DEFAULT_BORDER):
+    print("{} pixels per module with a {} module quiet zone, {} rounds".format(scale, border, rounds))
+    for payload in PAYLOADS:
+        code = QRCode(payload, QR_ECC.M)
+        pilBytes = pilPNG(code, scale, border)
+        directBytes = code.toPNG(scale, border)
+
+        # Both files must decode to the same pixels before timing means anything
+        if not np.array_equal(np.asarray(Image.open(BytesIO(pilBytes))), np.asarray(Image.open(BytesIO(directBytes)))):
+            raise Exception("PNG writers disagree for version {}".format(code.version))
+
+        pilTime = timeit(lambda: pilPNG(code, scale, border), number=rounds)
+        directTime = timeit(lambda: code.toPNG(scale, border), number=rounds)
+        svgTime = timeit(lambda: code.toSVG(scale, border), number=rounds)
+        print("Version {:2}: PIL {:7.1f} us, {:5} bytes | direct {:7.1f} us, {:5} bytes | SVG {:7.1f} us, {:5} bytes | {:.1f}x faster".format(
+            code.version, pilTime / rounds * 1e6, len(pilBytes), directTime / rounds * 1e6, len(directBytes),
+            svgTime / rounds * 1e6, len(code.toSVG(scale, border)), pilTime / directTime))
+
+
+if __name__ == '__main__':
+    runBenchmark()
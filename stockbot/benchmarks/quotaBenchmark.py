@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+from timeit import timeit
+from .. import quota
+from ..quota import QuotaScheduler, QuotaExceededError, INTERACTIVE, BACKGROUND
+
+
+class FakeClock:
+    """ Stands in for time.monotonic, so the checks don't depend on how fast they run """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def checkScheduler():
+    """ Check background reserves, priority ordering and waits past a bucket's capacity on a fake clock.
+        Raises an Exception describing the first thing that is wrong """
+    realMonotonic = quota.monotonic
+    clock = quota.monotonic = FakeClock()
+    try:
+        # Background calls leave 40% of the 5 calls a minute to interactive ones
+        scheduler = QuotaScheduler(["key"], 5, 500, maxWait=0)
+        granted = 0
+        try:
+            while granted < 10:
+                scheduler.acquire(BACKGROUND)
+                granted += 1
+        except QuotaExceededError:
+            pass
+        if granted != 3:
+            raise Exception("Background calls got {} of 5 tokens instead of 3".format(granted))
+        for _ in range(2):
+            scheduler.acquire(INTERACTIVE)
+
+        # A background caller queued first still gets its key after an interactive caller queued later
+        _, background = scheduler._enqueue(BACKGROUND, clock.now + 120, None)
+        _, interactive = scheduler._enqueue(INTERACTIVE, clock.now + 120, None)
+        clock.now += 12
+        scheduler._poll(background, clock.now + 108)
+        if interactive.key == None or background.key != None:
+            raise Exception("The first refilled token didn't go to the interactive caller")
+
+        # A second queued background call needs more than a bucket holds in total, but gets it as tokens refill
+        scheduler = QuotaScheduler(["key"], 5, 500, maxWait=0)
+        scheduler.share(4)
+        scheduler.acquire(BACKGROUND)
+        scheduler._enqueue(BACKGROUND, clock.now + 120, None)
+        try:
+            scheduler._enqueue(BACKGROUND, clock.now + 120, None)
+        except QuotaExceededError:
+            raise Exception("A wait within the deadline was rejected because it exceeds a bucket's capacity")
+
+        # A priority whose reserve leaves no room for a call is a configuration error, not a quota rejection
+        try:
+            QuotaScheduler(["key"], 1, 500, maxWait=0, backgroundReserve=0.5).acquire(BACKGROUND)
+            raise Exception("A call which can never get a key was granted one")
+        except ValueError:
+            pass
+    finally:
+        quota.monotonic = realMonotonic
+
+
+def runBenchmark(rounds = 100000):
+    checkScheduler()
+    print("Scheduler checks passed")
+
+    # Enough quota that every call gets a key straight away, to time the bookkeeping alone
+    keys = ["key{}".format(i) for i in range(8)]
+    scheduler = QuotaScheduler(keys, rounds, rounds * 10)
+    acquireTime = timeit(lambda: scheduler.acquire(BACKGROUND), number=rounds)
+    print("acquire() with 8 keys: {:.2f} us per call".format(acquireTime / rounds * 1e6))
+
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+from threading import Thread, Event
+from timeit import timeit
+import tempfile
+import sqlite3
+import shutil
+import time
+from .. import responsecache
+from ..responsecache import ResponseCache, normaliseURL
+
+
+# Callers sharing one fetch in the single-flight check
+FOLLOWERS = 8
+
+
+class FakeClock:
+    """ Stands in for time.time, so TTLs expire without waiting """
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+class _LockedDB:
+    """ Wraps an SQLite connection so every write fails like a file locked by another process """
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, *args):
+        if not query.startswith("SELECT"):
+            raise sqlite3.OperationalError("database is locked")
+        return self.db.execute(query, *args)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+
+def checkCache(directory):
+    """ Check cache keys, TTL expiry, that errors aren't cached, single-flight fetches and surviving SQLite errors.
+        Raises an Exception describing the first thing that is wrong """
+    if normaliseURL("https://x.co/q?b=2&A=1&apikey=SECRET") != normaliseURL("https://X.co/q?a=1&b=2"):
+        raise Exception("URLs differing only in API key and parameter order got different keys")
+
+    realTime = responsecache.time
+    clock = responsecache.time = FakeClock()
+    try:
+        cache = ResponseCache()
+        fetches = []
+        fetch = lambda: fetches.append(1) or len(fetches)
+        cache.get("key", 60, fetch)
+        clock.now += 59
+        if cache.get("key", 60, fetch) != 1:
+            raise Exception("A response was fetched again before its TTL ran out")
+        clock.now += 2
+        if cache.get("key", 60, fetch) != 2:
+            raise Exception("A response was used after its TTL ran out")
+
+        def failingFetch():
+            raise KeyError("Note")
+        for _ in range(2):
+            try:
+                cache.get("failing", 60, failingFetch)
+                raise Exception("A failed fetch returned a value")
+            except KeyError:
+                pass
+        if cache.getStats()["misses"] != 4:
+            raise Exception("A failed fetch was cached")
+    finally:
+        responsecache.time = realTime
+
+    # Callers asking for a key while it is being fetched share the fetch
+    cache = ResponseCache()
+    release = Event()
+    fetches = []
+
+    def slowFetch():
+        fetches.append(1)
+        release.wait(10)
+        return "value"
+    results = []
+    threads = [Thread(target=lambda: results.append(cache.get("slow", 60, slowFetch))) for _ in range(FOLLOWERS + 1)]
+    threads[0].start()
+    while len(fetches) == 0:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.getStats()["coalesced"] < FOLLOWERS:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    if len(fetches) != 1 or results != ["value"] * (FOLLOWERS + 1):
+        raise Exception("{} callers made {} fetches instead of sharing one".format(FOLLOWERS + 1, len(fetches)))
+
+    # A file other processes hold locked neither fails the fetch nor leaves its key in flight
+    cache = ResponseCache()
+    cache.enablePersistence(directory + "/responses.sqlite")
+    cache._db = _LockedDB(cache._db)
+    if cache.get("locked", 60, lambda: "value") != "value" or len(cache._inFlight) != 0:
+        raise Exception("A failed write to the cache file broke the fetch")
+
+
+def runBenchmark(rounds = 100000):
+    directory = tempfile.mkdtemp()
+    try:
+        checkCache(directory)
+        print("Response cache checks passed")
+
+        cache = ResponseCache()
+        cache.get("key", 60, lambda: "value")
+        hitTime = timeit(lambda: cache.get("key", 60, lambda: "value"), number=rounds)
+        print("get() hit in memory: {:.2f} us".format(hitTime / rounds * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    runBenchmark()
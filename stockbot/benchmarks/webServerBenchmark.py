@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+from http.server import ThreadingHTTPServer
+from os.path import dirname, realpath
+from time import perf_counter, sleep
+from argparse import ArgumentParser
+import subprocess
+import asyncio
+import socket
+import time
+import sys
+import os
+from ..web_frontend.httpHandler import HTTPApiHandler
+from ..web_frontend.asyncServer import AsyncHTTPServer
+from ..web_frontend.fileCacher import cacheFile
+
+
+# How long a stand-in query waits on "upstream", in seconds
+UPSTREAM_DELAY = 0.05
+FILES_PATH = dirname(dirname(realpath(__file__))) + "/web_frontend/files"
+
+
+class StubQueryHandler:
+    """ Answers every query after UPSTREAM_DELAY, like a query waiting on an upstream API, without using the network """
+    def queryChatbot(self, statement):
+        time.sleep(UPSTREAM_DELAY)
+        return "I predict the stocks for next week are worth 42", None
+
+    async def aqueryChatbot(self, statement):
+        await asyncio.sleep(UPSTREAM_DELAY)
+        return "I predict the stocks for next week are worth 42", None
+
+
+class QuietHTTPApiHandler(HTTPApiHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(kind, port):
+    """ Run a server with the stand-in query handler until killed """
+    cacheFile(None, FILES_PATH + "/404.html", "text/html")
+    cacheFile("/index.html", FILES_PATH + "/index.html", "text/html")
+    if kind == "threaded":
+        HTTPApiHandler.queryHandler = StubQueryHandler()
+        ThreadingHTTPServer.request_queue_size = 1024
+        ThreadingHTTPServer(("127.0.0.1", port), QuietHTTPApiHandler).serve_forever()
+    else:
+        asyncio.run(AsyncHTTPServer(StubQueryHandler(), "127.0.0.1", port, quiet=True).serveForever())
+
+
+async def _request(connection, host, path):
+    """ Do one GET on a (reader, writer) pair, opening a new one if needed. Returns (status, connection or None if closed) """
+    if connection == None:
+        connection = await asyncio.open_connection(host[0], host[1])
+    reader, writer = connection
+    writer.write("GET {} HTTP/1.1\r\nHost: {}:{}\r\nConnection: keep-alive\r\n\r\n".format(path, *host).encode())
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    version, status = head[0].split(" ")[:2]
+    headers = {name.lower(): value.strip() for name, _, value in (line.partition(":") for line in head[1:] if line)}
+    await reader.readexactly(int(headers.get("content-length", "0")))
+    if version == "HTTP/1.0" or headers.get("connection", "").lower() == "close":
+        writer.close()
+        connection = None
+    return int(status), connection
+
+
+async def _client(host, path, requests, latencies, errors):
+    connection = None
+    for _ in range(requests):
+        start = perf_counter()
+        try:
+            status, connection = await _request(connection, host, path)
+            if status != 200:
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            errors.append(type(e).__name__)
+            connection = None
+            continue
+        latencies.append(perf_counter() - start)
+    if connection != None:
+        connection[1].close()
+
+
+def _serverThreads(pid):
+    try:
+        with open("/proc/{}/status".format(pid)) as fd:
+            for line in fd:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+async def _load(host, path, clients, requestsPerClient, pid):
+    latencies = []
+    errors = []
+    start = perf_counter()
+    tasks = [asyncio.ensure_future(_client(host, path, requestsPerClient, latencies, errors)) for _ in range(clients)]
+    peakThreads = 0
+    while not all(task.done() for task in tasks):
+        peakThreads = max(peakThreads, _serverThreads(pid) or 0)
+        await asyncio.sleep(0.01)
+    elapsed = perf_counter() - start
+    latencies.sort()
+    return elapsed, latencies, errors, peakThreads
+
+
+def _freePort():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def runBenchmark(clients = 200, requestsPerClient = 20):
+    scenarios = (("static file", "/index.html"), ("REST query", "/api/query?query=what+do+you+predict+for+msft"))
+    print("{} concurrent keep-alive clients, {} requests each. Queries wait {:.0f} ms on a stand-in upstream".format(clients, requestsPerClient, UPSTREAM_DELAY * 1000))
+    for kind in ("threaded", "async"):
+        port = _freePort()
+        server = subprocess.Popen([sys.executable, "-m", "stockbot.benchmarks.webServerBenchmark", "--serve", kind, "--port", str(port)])
+        try:
+            for _ in range(200):
+                try:
+                    socket.create_connection(("127.0.0.1", port), 0.1).close()
+                    break
+                except OSError:
+                    sleep(0.05)
+            for name, path in scenarios:
+                elapsed, latencies, errors, peakThreads = asyncio.run(_load(("127.0.0.1", port), path, clients, requestsPerClient, server.pid))
+                if len(latencies) == 0:
+                    print("{:>8} {:<11}: every request failed ({})".format(kind, name, errors[:3]))
+                    continue
+                print("{:>8} {:<11}: {:7.0f} req/s, p50 {:6.1f} ms, p99 {:6.1f} ms, {} errors, peak {} server threads".format(
+                    kind, name, len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+                    latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, len(errors), peakThreads))
+        finally:
+            server.kill()
+            server.wait()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Load test the threaded and asyncio web servers against each other")
+    parser.add_argument("--serve", choices=("threaded", "async"), help="run a server instead of the load test")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    if args.serve != None:
+        serve(args.serve, args.port)
+    else:
+        runBenchmark(args.clients, args.requests)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+from http.server import ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from argparse import ArgumentParser
+from itertools import count
+from time import sleep
+import subprocess
+import tempfile
+import asyncio
+import socket
+import sys
+import os
+from ..qrcache import qrCodeCache
+from ..web_frontend.httpHandler import HTTPApiHandler
+from ..web_frontend.asyncServer import AsyncHTTPServer
+from ..web_frontend.fileCacher import cacheFile
+from ..web_frontend.imageStore import imageStore
+from ..web_frontend.workerPool import WorkerPool, listeningSocket
+from .webServerBenchmark import QuietHTTPApiHandler, FILES_PATH, _load, _freePort
+
+
+QUERY_PATH = "/api/query?query=what+is+the+stock+symbol+of+microsoft"
+
+
+class QRQueryHandler:
+    """ Answers every query with the QR code of a symbol it hasn't seen before, like stock symbol queries which miss the
+        QR code cache, without using the network. All of the time goes to CPU-bound QR encoding """
+    def __init__(self, cpuWorkers = 2):
+        self.executor = ThreadPoolExecutor(cpuWorkers)
+        self._symbols = count()
+
+    def queryChatbot(self, statement):
+        symbol = "X{}N{}".format(os.getpid(), next(self._symbols))
+        return "The stock symbol is " + symbol, qrCodeCache.getPNG("https://www.google.com/search?q=" + symbol)
+
+    async def aqueryChatbot(self, statement):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.queryChatbot, statement)
+
+
+def serve(kind, port, processes):
+    """ Run a server with the QR query handler in a pool of worker processes until terminated """
+    cacheFile(None, FILES_PATH + "/404.html", "text/html")
+    imagesDir = tempfile.mkdtemp()
+
+    def serveWorker(sock, index):
+        imageStore.enableSharing(imagesDir)
+        if kind == "threaded":
+            HTTPApiHandler.queryHandler = QRQueryHandler()
+            ThreadingHTTPServer.request_queue_size = 1024
+            httpd = ThreadingHTTPServer(sock.getsockname(), QuietHTTPApiHandler, bind_and_activate=False)
+            httpd.socket.close()
+            httpd.socket = sock
+            httpd.serve_forever()
+        else:
+            asyncio.run(AsyncHTTPServer(QRQueryHandler(), quiet=True, sock=sock).serveForever())
+
+    WorkerPool(serveWorker, processes, listeningSocket("127.0.0.1", port)).serveForever()
+
+
+def _processCounts(maxProcesses):
+    counts = [1]
+    while counts[-1] * 2 < maxProcesses:
+        counts.append(counts[-1] * 2)
+    if maxProcesses > 1:
+        counts.append(maxProcesses)
+    return counts
+
+
+def runBenchmark(maxProcesses = None, clients = 64, requestsPerClient = 50):
+    maxProcesses = maxProcesses or os.cpu_count()
+    print("{} concurrent keep-alive clients, {} requests each, {} cores. Every query encodes a new QR code".format(clients, requestsPerClient, os.cpu_count()))
+    for kind in ("threaded", "async"):
+        baseline = None
+        for processes in _processCounts(maxProcesses):
+            port = _freePort()
+            server = subprocess.Popen([sys.executable, "-m", "stockbot.benchmarks.workerPoolBenchmark", "--serve", kind,
+                                       "--processes", str(processes), "--port", str(port)])
+            try:
+                for _ in range(200):
+                    try:
+                        socket.create_connection(("127.0.0.1", port), 0.1).close()
+                        break
+                    except OSError:
+                        sleep(0.05)
+                elapsed, latencies, errors, _ = asyncio.run(_load(("127.0.0.1", port), QUERY_PATH, clients, requestsPerClient, server.pid))
+                if len(latencies) == 0:
+                    print("{:>8} x{:<3}: every request failed ({})".format(kind, processes, errors[:3]))
+                    continue
+                throughput = len(latencies) / elapsed
+                baseline = baseline or throughput
+                print("{:>8} x{:<3}: {:7.0f} req/s ({:4.2f}x one process), p50 {:6.1f} ms, p99 {:6.1f} ms, {} errors".format(
+                    kind, processes, throughput, throughput / baseline, latencies[len(latencies) // 2] * 1000,
+                    latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, len(errors)))
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Measure how QR-heavy query throughput scales with worker processes")
+    parser.add_argument("--serve", choices=("threaded", "async"), help="run a server instead of the load test")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--processes", type=int, help="most worker processes to measure (default: one per core)")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    if args.serve != None:
+        serve(args.serve, args.port, args.processes)
+    else:
+        runBenchmark(args.processes, args.clients, args.requests)
@@ -1,10 +1,16 @@
-import urllib.request, json
+from .responsecache import cachedJSON, acachedJSON, FX_RATE_TTL
+from .quota import alphaVantageQuota
 
 def convert(currency1,currency2):
-    url = "https://www.alphavantage.co/query?function=CURRENCY_EXCHANGE_RATE&from_currency=" + currency1 + "&to_currency=" + currency2 + "&apikey=VUUG2MG0ELJZOOGF"
-    with urllib.request.urlopen(url) as url:
-        data = json.loads(url.read().decode())
-        results = data["Realtime Currency Exchange Rate"]
+    url = "https://www.alphavantage.co/query?function=CURRENCY_EXCHANGE_RATE&from_currency=" + currency1 + "&to_currency=" + currency2
+    data = cachedJSON(url, FX_RATE_TTL, "Realtime Currency Exchange Rate", alphaVantageQuota)
+    results = data["Realtime Currency Exchange Rate"]
+    return results
+
+async def aconvert(currency1,currency2):
+    url = "https://www.alphavantage.co/query?function=CURRENCY_EXCHANGE_RATE&from_currency=" + currency1 + "&to_currency=" + currency2
+    data = await acachedJSON(url, FX_RATE_TTL, "Realtime Currency Exchange Rate", alphaVantageQuota)
+    results = data["Realtime Currency Exchange Rate"]
     return results
 
 def getCurrencyData(results, key):
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import os
 import discord
+from io import BytesIO
 
 from ..query import QueryHandler
 
@@ -53,14 +54,12 @@ async def on_message(message):
 
     # Get query response
     messageSlice = message.content[1:]
-    responseText, image = queryHandler.queryChatbot(messageSlice)
+    responseText, image = await queryHandler.aqueryChatbot(messageSlice)
     
     # Prepare image if any
     imageFile = None
     if image != None:
-        byteBuffer = BytesIO()
-        image.save(byteBuffer, format='PNG')
-        imageFile = discord.File(byteBuffer)
+        imageFile = discord.File(BytesIO(image), filename="image.png")
     
     # Send response
     await message.channel.send(responseText, file=imageFile)
@@ -32,7 +32,7 @@ def receive_message():
                 recipient_id = message['sender']['id']
                 if message['message'].get('text'):
                     querRes, querImage = queryHandler.queryChatbot(message['message'].get('text'))
-                    # TODO, yo baljot, add image support by sending querImage. Its a python pillow Image object
+                    # TODO, yo baljot, add image support by sending querImage. Its PNG file bytes
                     send_message(recipient_id, querRes)
     
                 """#if user sends us a GIF, photo,video, or any other non-text item
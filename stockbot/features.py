@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+
+
+# The model reads the latest WINDOW_SIZE weekly closes, oldest first (batch_input_shape [null, 200, 1])
+WINDOW_SIZE = 200
+# Histories shorter than the window but at least this long are padded; shorter ones are rejected
+MIN_HISTORY = 50
+
+
+class ShortHistoryError(ValueError):
+    """ Raised when there are too few closes to build a model input """
+    pass
+
+
+def closesToWindow(closes, windowSize = WINDOW_SIZE, minHistory = MIN_HISTORY):
+    """ Build a (windowSize, 1) float32 model input from closes, oldest first, using the latest windowSize of them.
+        Histories of at least minHistory closes are padded at the start by repeating their oldest close """
+    count = len(closes)
+    if count < minHistory:
+        raise ShortHistoryError("Need at least {} closes, got {}".format(minHistory, count))
+    take = min(count, windowSize)
+    window = np.empty((windowSize, 1), np.float32)
+    window[windowSize - take:, 0] = closes[count - take:]
+    window[:windowSize - take, 0] = closes[count - take]
+    return window
+
+
+def parseWeeklySeries(series):
+    """ Parse an Alpha Vantage weekly time series dictionary into (dates, closes) arrays, oldest first """
+    dates = np.array(list(series.keys()), dtype="datetime64[D]")
+    closes = np.array([bar["4. close"] for bar in series.values()], dtype=np.float64)
+    order = np.argsort(dates, kind="stable")
+    return dates[order], closes[order]
+
+
+class FeatureWindows:
+    """ Model input windows per symbol, rolled forward by the new bars when a series grows instead of rebuilt """
+    def __init__(self, windowSize = WINDOW_SIZE, minHistory = MIN_HISTORY, maxSymbols = 1024):
+        """ Constructor. Keeps the windows of at most maxSymbols symbols """
+        self.windowSize = windowSize
+        self.minHistory = minHistory
+        self.maxSymbols = maxSymbols
+        self.hits = 0
+        self.rolls = 0
+        self.builds = 0
+        # Symbol to (last date, number of closes, window)
+        self._windows = OrderedDict()
+        self._lock = Lock()
+
+    def getWindow(self, symbol, dates, closes):
+        """ Get the read-only model input window for a symbol's (dates, closes) series, oldest first """
+        if len(dates) == 0:
+            raise ShortHistoryError("No closes for '{}'".format(symbol))
+        lastDate = dates[-1]
+        with self._lock:
+            cached = self._windows.get(symbol)
+            if cached != None:
+                self._windows.move_to_end(symbol)
+                if cached[0] == lastDate and cached[1] == len(dates):
+                    self.hits += 1
+                    return cached[2]
+
+        window = None
+        if cached != None and cached[1] >= self.windowSize:
+            # Roll forward only if the series just grew at the end, as an append-only store does
+            start = cached[1]
+            newCount = len(dates) - start
+            if 0 < newCount < self.windowSize and dates[start - 1] == cached[0]:
+                window = np.empty((self.windowSize, 1), np.float32)
+                window[:-newCount] = cached[2][newCount:]
+                window[-newCount:, 0] = closes[start:]
+                rolled = True
+        if window is None:
+            window = closesToWindow(closes, self.windowSize, self.minHistory)
+            rolled = False
+        window.flags.writeable = False
+
+        with self._lock:
+            if rolled:
+                self.rolls += 1
+            else:
+                self.builds += 1
+            self._windows[symbol] = (lastDate, len(dates), window)
+            self._windows.move_to_end(symbol)
+            while len(self._windows) > self.maxSymbols:
+                self._windows.popitem(last=False)
+        return window
+
+    def getStats(self):
+        """ Get counters and occupancy as a dictionary """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "rolls": self.rolls,
+                "builds": self.builds,
+                "size": len(self._windows),
+                "maxSymbols": self.maxSymbols
+            }
+
+
+featureWindows = FeatureWindows()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+
+try:
+    import fcntl
+
+    def lockFile(fd):
+        """ Block until this process holds an exclusive lock on an open file """
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def unlockFile(fd):
+        """ Release a lock taken with lockFile """
+        fcntl.flock(fd, fcntl.LOCK_UN)
+except ImportError:
+    import msvcrt
+
+    def lockFile(fd):
+        """ Block until this process holds an exclusive lock on an open file """
+        fd.seek(0)
+        msvcrt.locking(fd.fileno(), msvcrt.LK_LOCK, 1)
+
+    def unlockFile(fd):
+        """ Release a lock taken with lockFile """
+        fd.seek(0)
+        msvcrt.locking(fd.fileno(), msvcrt.LK_UNLCK, 1)
@@ -1,24 +1,36 @@
-import urllib.request
-import json
-from .alphavantage import jsonReturn, jsonStrip, spaceCheck
+from .responsecache import cachedJSON, MARKET_STATUS_TTL, MARKET_MOVERS_TTL, REALTIME_PRICE_TTL, COMPANY_PROFILE_TTL, HISTORICAL_PRICES_TTL, FINANCIAL_STATEMENTS_TTL
+from .alphavantage import jsonReturn, ajsonReturn, jsonStrip, spaceCheck, symbolSearch, asymbolSearch, jsonListings
+from .symbolindex import symbolIndex
+from .pricestore import dailyPrices
+from .quota import INTERACTIVE
 import matplotlib.pyplot as plt
 
-def company_name_to_stock(company):
-    """Returns the stock code of a company"""
-    stock = jsonReturn(company)
+def company_name_to_stock(company, priority = INTERACTIVE):
+    """Returns the stock codes matching a company name, best first. Alpha Vantage is only asked when the local index has no match"""
+    stock = symbolIndex.lookup(company)
+    if len(stock) == 0:
+        results = symbolSearch(company, priority)
+        symbolIndex.learn(company, jsonListings(results))
+        stock = jsonStrip(results)
     return stock
 
-def get_stock_json(urlGiven):
-    """Returns json data from api"""
-    url = urlGiven
-    with urllib.request.urlopen(url) as url:
-        data = json.loads(url.read().decode())
-        return data
+async def acompany_name_to_stock(company, priority = INTERACTIVE):
+    """Same as company_name_to_stock, but doesn't block the event loop"""
+    stock = symbolIndex.lookup(company)
+    if len(stock) == 0:
+        results = await asymbolSearch(company, priority)
+        symbolIndex.learn(company, jsonListings(results))
+        stock = jsonStrip(results)
+    return stock
+
+def get_stock_json(urlGiven, ttl):
+    """Returns json data from api, reusing responses younger than ttl seconds"""
+    return cachedJSON(urlGiven, ttl)
 
 def market_open_check():
     """Checks if the stock markets are currently open"""
     url = "https://financialmodelingprep.com/api/v3/is-the-market-open"
-    data = get_stock_json(url)
+    data = get_stock_json(url, MARKET_STATUS_TTL)
     marketState = data["isTheStockMarketOpen"]
     if marketState:
         return True
@@ -28,7 +40,7 @@ def market_open_check():
 def market_holidays():
     """Shows the market holidays of the previous, current and next year"""
     url = "https://financialmodelingprep.com/api/v3/is-the-market-open"
-    data = get_stock_json(url)
+    data = get_stock_json(url, MARKET_STATUS_TTL)
     allYearData = data["stockMarketHolidays"]
     return allYearData
     
@@ -36,7 +48,7 @@ def market_holidays():
 def most_gainer_companies(dataRequired):
     """Returns specified data about the 10 most gainer stocks"""
     url = "https://financialmodelingprep.com/api/v3/stock/gainers"
-    data = get_stock_json(url)
+    data = get_stock_json(url, MARKET_MOVERS_TTL)
     stockList = data["mostGainerStock"]
     dataRequired = dataRequired.split(' ')
     return stockList, dataRequired
@@ -44,7 +56,7 @@ def most_gainer_companies(dataRequired):
 def most_active_companies(dataRequired):
     """Returns specified data about the 10 most active stocks"""
     url = "https://financialmodelingprep.com/api/v3/stock/actives"
-    data = get_stock_json(url)
+    data = get_stock_json(url, MARKET_MOVERS_TTL)
     stockList = data["mostActiveStock"]
     dataRequired = dataRequired.split(' ')
     return stockList, dataRequired
@@ -52,7 +64,7 @@ def most_active_companies(dataRequired):
 def most_loser_companies(dataRequired):
     """Returns specified data about the 10 most loser stocks"""
     url = "https://financialmodelingprep.com/api/v3/stock/losers"
-    data = get_stock_json(url)
+    data = get_stock_json(url, MARKET_MOVERS_TTL)
     stockList = data["mostLoserStock"]
     dataRequired = dataRequired.split(' ')
     return stockList, dataRequired
@@ -60,24 +72,24 @@ def most_loser_companies(dataRequired):
 def major_indexes(dataRequired):
     """Returns specified data about the major indexes"""
     url = "https://financialmodelingprep.com/api/v3/majors-indexes"
-    data = get_stock_json(url)
+    data = get_stock_json(url, MARKET_MOVERS_TTL)
     stockList = data["majorIndexesList"]
     dataRequired = dataRequired.split(' ')
     return stockList, dataRequired
 
 def stock_historical_price_data(company, days):
     """Shows a graph of a specific stocks closes for the specified number of days prior to the current date"""
-    acronyms = jsonReturn(company)
+    acronyms = company_name_to_stock(company)
     stock = acronyms[0]
-    url = "https://financialmodelingprep.com/api/v3/historical-price-full/" + stock + "?serietype=line"
-    data = get_stock_json(url)
-    allDays = data["historical"]
-    requestedDays = allDays[:days]
+    allDates, allCloses = dailyPrices.get(stock)
+    # Newest first, like the upstream response
+    requestedDates = allDates[::-1][:days]
+    requestedCloses = allCloses[::-1][:days]
     closes = []
     dates = []
-    for i in range( len(requestedDays)):
-        closes.append(requestedDays[i]["close"])
-        date = requestedDays[i]["date"]
+    for i in range( len(requestedDates)):
+        closes.append(requestedCloses[i])
+        date = str(requestedDates[i])
         dates.append(date[5:])
     plt.plot(dates, closes)
     plt.xticks(rotation = 45)
@@ -87,14 +99,14 @@ def stock_historical_price_data(company, days):
 def stock_sectors():
     """Shows the change in percentage of the 11 stock market sectors"""
     url = "https://financialmodelingprep.com/api/v3/stock/sectors-performance"
-    data = get_stock_json(url)
+    data = get_stock_json(url, MARKET_MOVERS_TTL)
     sectorInfo = data["sectorPerformance"]
     return sectorInfo
 
 def stock_profile(stock):
     """Returns the profile of a stock"""
     url = "https://financialmodelingprep.com/api/v3/company/profile/" + stock
-    data = get_stock_json(url)
+    data = get_stock_json(url, COMPANY_PROFILE_TTL)
     profile = data["profile"]
     profileTypes = ["price", "beta", "volAvg", "mktCap", "lastDiv", "range", "changes", "changesPercentage", "companyName", "exchange", "industry", "website", "description", "ceo", "sector"]
     return profile, profileTypes
@@ -102,14 +114,14 @@ def stock_profile(stock):
 def stock_price(stock):
     """Returns the price of a stock in realtime"""
     url = "https://financialmodelingprep.com/api/v3/stock/real-time-price/" + stock
-    data = get_stock_json(url)
+    data = get_stock_json(url, REALTIME_PRICE_TTL)
     price = data["price"]
     return price
 
 def annual_income_statements(stock, year):
     """Returns annual income statements of a stock for a specified year"""
     url = "https://financialmodelingprep.com/api/v3/financials/income-statement/" + stock
-    data = get_stock_json(url)
+    data = get_stock_json(url, FINANCIAL_STATEMENTS_TTL)
     incomeSheets = data["financials"]
     return incomeSheets
 
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+from http.client import HTTPConnection, HTTPSConnection, HTTPException, RemoteDisconnected
+from urllib.parse import urlsplit
+from urllib.error import HTTPError
+from queue import LifoQueue, Empty, Full
+from threading import Lock
+from .instrumentation import instrumentation
+import asyncio
+import gzip
+import json
+
+
+class HTTPClient:
+    """ A thread-safe HTTP(S) client which keeps persistent connections to each host and reuses them """
+    def __init__(self, poolSize = 4, timeout = 10, userAgent = "stockbot"):
+        """ Constructor. Keeps at most poolSize idle connections per host. timeout is in seconds """
+        self.poolSize = poolSize
+        self.timeout = timeout
+        self.userAgent = userAgent
+        self.connectionsOpened = 0
+        self.connectionsReused = 0
+        self._pools = dict()
+        self._lock = Lock()
+
+    def _getPool(self, scheme, host):
+        """ Get the queue of idle connections for a host """
+        with self._lock:
+            pool = self._pools.get((scheme, host))
+            if pool == None:
+                pool = LifoQueue(self.poolSize)
+                self._pools[(scheme, host)] = pool
+            return pool
+
+    def _newConnection(self, scheme, host):
+        """ Open a new connection to a host """
+        with self._lock:
+            self.connectionsOpened += 1
+        if scheme == "https":
+            return HTTPSConnection(host, timeout=self.timeout)
+        elif scheme == "http":
+            return HTTPConnection(host, timeout=self.timeout)
+        else:
+            raise ValueError("Unsupported URL scheme: {}".format(scheme))
+
+    def _request(self, connection, path, headers):
+        """ Do a GET request on a connection and read the whole response """
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        return response, response.read()
+
+    def get(self, url, headers = None):
+        """ Do a GET request and return the (decompressed) response body as bytes. Raises urllib's HTTPError on error statuses """
+        with instrumentation.timed("upstream:" + urlsplit(url).netloc):
+            return self._get(url, headers)
+
+    def _get(self, url, headers):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        requestHeaders = {"Accept-Encoding": "gzip", "User-Agent": self.userAgent}
+        if headers != None:
+            requestHeaders.update(headers)
+
+        pool = self._getPool(parts.scheme, parts.netloc)
+        try:
+            connection = pool.get_nowait()
+            reused = True
+        except Empty:
+            connection = self._newConnection(parts.scheme, parts.netloc)
+            reused = False
+
+        try:
+            response, body = self._request(connection, path, requestHeaders)
+        except (RemoteDisconnected, ConnectionError, HTTPException):
+            connection.close()
+            # Idle connections can be closed by the server at any time. Retry once on a fresh one
+            if not reused:
+                raise
+            connection = self._newConnection(parts.scheme, parts.netloc)
+            reused = False
+            try:
+                response, body = self._request(connection, path, requestHeaders)
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+
+        if reused:
+            with self._lock:
+                self.connectionsReused += 1
+
+        # Return the connection to the pool unless the server is closing it
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                pool.put_nowait(connection)
+            except Full:
+                connection.close()
+
+        if response.status >= 400:
+            raise HTTPError(url, response.status, response.reason, response.headers, None)
+
+        if response.getheader("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def getJSON(self, url, headers = None):
+        """ Do a GET request and decode the response body as JSON """
+        return json.loads(self.get(url, headers).decode())
+
+    def getStats(self):
+        """ Get connection counters as a dictionary """
+        with self._lock:
+            return {
+                "connectionsOpened": self.connectionsOpened,
+                "connectionsReused": self.connectionsReused,
+                "idleConnections": sum(pool.qsize() for pool in self._pools.values())
+            }
+
+    def close(self):
+        """ Close all idle connections """
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except Empty:
+                    break
+
+
+httpClient = HTTPClient()
+
+
+class AsyncHTTPClient:
+    """ An asyncio HTTP(S) client with persistent connections. Uses aiohttp when it is installed
+        (discord.py depends on it), otherwise runs the blocking client in the default executor """
+    def __init__(self, poolSize = 4, timeout = 10, userAgent = "stockbot", fallbackClient = httpClient):
+        """ Constructor. Keeps at most poolSize connections per host. timeout is in seconds """
+        self.poolSize = poolSize
+        self.timeout = timeout
+        self.userAgent = userAgent
+        self._fallbackClient = fallbackClient
+        self._session = None
+        self._sessionLoop = None
+
+    def _getSession(self):
+        """ Get the aiohttp session for the running event loop, or None if aiohttp isn't available """
+        try:
+            import aiohttp
+        except ImportError:
+            return None
+
+        loop = asyncio.get_running_loop()
+        if self._session == None or self._sessionLoop != loop or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.poolSize),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": self.userAgent}
+            )
+            self._sessionLoop = loop
+        return self._session
+
+    async def get(self, url, headers = None):
+        """ Do a GET request and return the (decompressed) response body as bytes. Raises urllib's HTTPError on error statuses """
+        session = self._getSession()
+        if session == None:
+            return await asyncio.get_running_loop().run_in_executor(None, self._fallbackClient.get, url, headers)
+
+        with instrumentation.timed("upstream:" + urlsplit(url).netloc):
+            async with session.get(url, headers=headers) as response:
+                body = await response.read()
+                if response.status >= 400:
+                    raise HTTPError(url, response.status, response.reason, response.headers, None)
+                return body
+
+    async def getJSON(self, url, headers = None):
+        """ Do a GET request and decode the response body as JSON """
+        return json.loads((await self.get(url, headers)).decode())
+
+    async def close(self):
+        """ Close the aiohttp session, if any """
+        if self._session != None:
+            await self._session.close()
+            self._session = None
+
+
+asyncHTTPClient = AsyncHTTPClient()
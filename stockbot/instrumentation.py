@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+from time import perf_counter
+from functools import wraps
+from bisect import bisect_left
+from threading import Lock
+import asyncio
+
+
+# Histogram bucket upper bounds in seconds. The last bucket catches everything slower
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+
+
+class LatencyHistogram:
+    """ A fixed-bucket latency histogram with an error counter """
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def record(self, seconds, error):
+        """ Count one observation. Not thread-safe; Instrumentation serialises calls """
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+
+    def percentile(self, fraction):
+        """ Estimate a percentile (0 to 1) in seconds, interpolating linearly inside the bucket it falls in """
+        if self.total == 0:
+            return None
+        rank = fraction * self.total
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count != 0 and cumulative + count >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) - 1 else lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return BUCKETS[-2]
+
+
+class _Timer:
+    """ Context manager which records how long its block took """
+    __slots__ = ("_instrumentation", "_stage", "_start")
+
+    def __init__(self, instrumentation, stage):
+        self._instrumentation = instrumentation
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self._instrumentation.record(self._stage, perf_counter() - self._start, excType != None)
+        return False
+
+
+class _NullTimer:
+    """ Context manager which does nothing, used while instrumentation is disabled """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Instrumentation:
+    """ Per-stage latency histograms and error counts for the query hot path, plus cache statistics """
+    def __init__(self, enabled = True):
+        self.enabled = enabled
+        self._histograms = dict()
+        self._cacheStats = dict()
+        self._lock = Lock()
+
+    def record(self, stage, seconds, error = False):
+        """ Record how long a stage took and whether it failed """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram == None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.record(seconds, error)
+
+    def timed(self, stage):
+        """ Context manager which times its block as a stage. Exceptions escaping the block count as errors """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+    def registerCache(self, name, getStats):
+        """ Register a cache whose getStats() dictionary has 'hits' and 'misses' counters """
+        self._cacheStats[name] = getStats
+
+    def reset(self):
+        """ Forget all recorded latencies """
+        with self._lock:
+            self._histograms.clear()
+
+    def toDict(self):
+        """ Get a JSON-friendly summary of every stage and cache """
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": histogram.total,
+                    "errors": histogram.errors,
+                    "mean": histogram.sum / histogram.total,
+                    "p50": histogram.percentile(0.5),
+                    "p95": histogram.percentile(0.95),
+                    "p99": histogram.percentile(0.99)
+                } for stage, histogram in self._histograms.items()
+            }
+
+        caches = dict()
+        for name, getStats in self._cacheStats.items():
+            stats = dict(getStats())
+            lookups = stats["hits"] + stats["misses"]
+            stats["hitRate"] = stats["hits"] / lookups if lookups else None
+            caches[name] = stats
+
+        return {"stages": stages, "caches": caches}
+
+    def toPrometheus(self, prefix = "stockbot"):
+        """ Get every stage and cache in the Prometheus text exposition format """
+        lines = [
+            "# HELP {}_stage_latency_seconds Time spent in each stage of answering a query".format(prefix),
+            "# TYPE {}_stage_latency_seconds histogram".format(prefix)
+        ]
+        errorLines = [
+            "# HELP {}_stage_errors_total Exceptions raised out of each stage".format(prefix),
+            "# TYPE {}_stage_errors_total counter".format(prefix)
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                label = _escapeLabel(stage)
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append('{}_stage_latency_seconds_bucket{{stage="{}",le="{}"}} {}'.format(prefix, label, le, cumulative))
+                lines.append('{}_stage_latency_seconds_sum{{stage="{}"}} {!r}'.format(prefix, label, histogram.sum))
+                lines.append('{}_stage_latency_seconds_count{{stage="{}"}} {}'.format(prefix, label, histogram.total))
+                errorLines.append('{}_stage_errors_total{{stage="{}"}} {}'.format(prefix, label, histogram.errors))
+
+        lines += errorLines
+        for counter in ("hits", "misses"):
+            lines.append("# TYPE {}_cache_{}_total counter".format(prefix, counter))
+            for name, getStats in sorted(self._cacheStats.items()):
+                lines.append('{}_cache_{}_total{{cache="{}"}} {}'.format(prefix, counter, _escapeLabel(name), getStats()[counter]))
+        return "\n".join(lines) + "\n"
+
+
+def _escapeLabel(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+instrumentation = Instrumentation()
+
+
+def instrumented(stage):
+    """ Decorator which times every call of a function or coroutine function as a stage """
+    def decorator(function):
+        if asyncio.iscoroutinefunction(function):
+            @wraps(function)
+            async def asyncWrapper(*args, **kwargs):
+                with instrumentation.timed(stage):
+                    return await function(*args, **kwargs)
+            return asyncWrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with instrumentation.timed(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
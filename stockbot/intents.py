@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import re
+
+
+# Regular expression parts. These are concatenated to generate the final expressions
+# Most of these expressions are big due to matching broken english or unreasonable input
+optionalDateRegex = r'(?:\s+in\s+(?:[0-9]+|[0-9]+\s*(?:st|nd|rd|th)?(?:\s+|\s*\/\s*)(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may?|june?|july?|aug(?:ust)?|sep(?:tember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?|0*[1-9]|0*1[0-2])(?:(?:\s+|\s*\/\s*)[0-9]+)?))?'
+nameRegex = r'\s+((?!\s).+?)'
+questionEndRegex = r'[?!.\s]*$'
+stockSymbolRegex = r'(?:\s+stock)?\s+(?:symbol|code)'
+apostropheSRegex = r'(?:\'|\'?s)?'
+whatRegex = r'^wh?at(?:\'?s|\s+is)'
+prepositionRegex = r'\s+(?:for|of)'
+optionalTheRegex = r'(?:\s*the)?'
+recommendRegex = r'^(?:should|(?:do\s+)?(?:you\s+)?(?:recommend|think))'
+optionalNameRegex = r'(?:' + nameRegex + r')?'
+investRegex = r'\s+(?:(?:to\s+)?invests?|(?:buys?|gets?)\s+(?:stocks?|shares?))\s+(?:in|for)'
+convertRegex = r'\s(?:converted to|in)'
+numRegex = r'\s([0-9]*)'
+predictRegex = r'^\s*what\s+(?:are\s+the\s+stock\s+predictions\s+for\s+this|do\s+you\s+predict\s+for\s+this)\s+company\s+([a-z]+?)\s*$'
+
+
+# Intent list. Order matters; the first intent that matches wins
+INTENTS = (
+    # Stock symbol (first variant)
+    # (What's|What is) [the] [stock] symbol|code for|of ... [in (XX(/(XX|month)/XXXX))][?!.]
+    ("stockSymbol", whatRegex + optionalTheRegex + stockSymbolRegex + prepositionRegex + nameRegex + optionalDateRegex + questionEndRegex),
+    # Stock symbol (second variant)
+    # (What's|What is) ...['s] [stock] symbol|code [in (XX(/(XX|month)/XXXX))][?!.]
+    ("stockSymbol", whatRegex + nameRegex + apostropheSRegex + stockSymbolRegex + optionalDateRegex + questionEndRegex),
+    # Recommendation
+    # (Should|[Do ][you ]recommend) [...] (to invest|invests|buys (stocks|shares)) in|for ...[?!.]
+    ("recommendation", recommendRegex + optionalNameRegex + investRegex + nameRegex + questionEndRegex),
+    # Stock prediction
+    # what do you predict for this company ...
+    ("prediction", predictRegex),
+    # Currency Conversion
+    # (What's|What is) ...['s] [value] in ...?
+    ("currency", whatRegex + numRegex + nameRegex + apostropheSRegex + convertRegex + nameRegex + questionEndRegex),
+)
+
+
+class IntentMatcher:
+    """ Matches statements against a list of intents using a single precompiled alternation """
+    def __init__(self, intents, flags = re.IGNORECASE):
+        """ Constructor. Compiles the (name, regex) intent list into one expression """
+        alternatives = []
+        # Maps the index of each alternative's wrapping group to its intent name and group span
+        self._groupInfo = {}
+        groupIndex = 1
+        for name, regex in intents:
+            groupCount = re.compile(regex, flags).groups
+            self._groupInfo[groupIndex] = (name, groupIndex + 1, groupIndex + 1 + groupCount)
+            alternatives.append('(' + regex + ')')
+            groupIndex += 1 + groupCount
+
+        self._regex = re.compile('|'.join(alternatives), flags)
+
+    def match(self, statement):
+        """ Returns the matched intent name and its captured groups as a tuple, or (None, ()) if nothing matches """
+        matches = self._regex.match(statement)
+        if matches == None:
+            return None, ()
+
+        # The wrapping group of the matched alternative is always the last one to close
+        name, first, end = self._groupInfo[matches.lastindex]
+        return name, matches.groups()[first - 1:end - 1]
+
+
+INTENT_MATCHER = IntentMatcher(INTENTS)
@@ -1,22 +1,116 @@
 #!/usr/bin/env python3
 from os.path import dirname, realpath
+from threading import Thread, Event, Lock
+from .filelock import lockFile, unlockFile
+import atexit
+import os
 
 
 METRICS_FILE = dirname(realpath(__file__)) + "/metrics/apiMetrics.txt"
 
 
+class MetricsCounter:
+    """ A query counter kept in memory and flushed to a file in the background.
+        Several processes can share the file; each one adds its own increments to it under a file lock """
+    def __init__(self, path = METRICS_FILE, flushInterval = 5):
+        """ Constructor. Increments are written to path every flushInterval seconds and at exit """
+        self.path = path
+        self.flushInterval = flushInterval
+        # Count in the file as of the last flush, and increments made by this process since then
+        self._fileCount = None
+        self._pending = 0
+        self._lock = Lock()
+        self._flushLock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def _readFile(self):
+        """ Read the count in the file, treating a missing or broken file as 0 """
+        try:
+            with open(self.path, "r") as fd:
+                return int(fd.readline().strip())
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            print("Exception while reading metrics file: ", e)
+            return 0
+
+    def _ensureStarted(self):
+        """ Load the count from disk and start the flushing thread on first use """
+        if self._thread != None:
+            return
+        with self._flushLock:
+            if self._thread != None:
+                return
+            self._fileCount = self._readFile()
+            self._thread = Thread(target=self._run, name="MetricsFlusher", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.wait(self.flushInterval):
+            try:
+                self.flush()
+            except Exception as e:
+                print("Exception while flushing metrics file: ", e)
+
+    def add(self, amount = 1):
+        """ Count queries. Returns the new total """
+        self._ensureStarted()
+        with self._lock:
+            self._pending += amount
+            return self._fileCount + self._pending
+
+    def get(self):
+        """ Get the total, including increments not yet flushed """
+        self._ensureStarted()
+        with self._lock:
+            return self._fileCount + self._pending
+
+    def flush(self):
+        """ Add pending increments to the file and pick up increments flushed by other processes """
+        with self._flushLock:
+            with self._lock:
+                pending = self._pending
+                self._pending = 0
+
+            try:
+                with open(self.path + ".lock", "a+") as lockFd:
+                    lockFile(lockFd)
+                    try:
+                        count = self._readFile() + pending
+                        if pending != 0:
+                            # Write a temporary file and rename it over the old one, so readers never see a partial file
+                            tempPath = "{}.{}.tmp".format(self.path, os.getpid())
+                            with open(tempPath, "w") as fd:
+                                fd.write(str(count))
+                            os.replace(tempPath, self.path)
+                    finally:
+                        unlockFile(lockFd)
+            except BaseException:
+                # Keep the increments for the next attempt
+                with self._lock:
+                    self._pending += pending
+                raise
+
+            with self._lock:
+                self._fileCount = count
+
+    def stop(self):
+        """ Stop the flushing thread and do a final flush """
+        self._stopped.set()
+        if self._thread != None:
+            self.flush()
+
+
+queryCounter = MetricsCounter()
+
+
 def getMetrics():
-    count = 0
-    try:
-        with open(METRICS_FILE, "r") as fd:
-            countLine = fd.readline()
-            count = int(countLine.strip())
-    except Exception as e:
-        print("Exception while reading metrics file: ", e)
-    return count
+    return queryCounter.get()
 
 def addQueryToMetrics():
-    count = getMetrics() + 1
-    with open(METRICS_FILE, "w") as fd:
-        fd.write(str(count))
-    return count
+    return queryCounter.add()
+
+def flushMetrics():
+    queryCounter.flush()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+from os.path import dirname, realpath
+from argparse import ArgumentParser
+from time import sleep, monotonic
+from .predict import load_predict_model, precompute_predictions
+from .pricestore import weeklyPrices
+from .quota import BACKGROUND, QuotaExceededError
+from .warmup import hotSymbols
+
+
+WATCHLIST_FILE = dirname(realpath(__file__)) + "/data/watchlist.txt"
+
+
+def loadWatchlist(path = WATCHLIST_FILE):
+    """ Read a watchlist file: one symbol per line, with # comments """
+    symbols = []
+    with open(path, "r") as fd:
+        for line in fd:
+            symbol = line.split("#")[0].strip().upper()
+            if symbol != "" and symbol not in symbols:
+                symbols.append(symbol)
+    return symbols
+
+
+def fetchSeries(symbols, maxWait = 30 * 60):
+    """ Bring the weekly series of symbols up to date, waiting for Alpha Vantage quota as long as it takes, up to maxWait seconds in total """
+    deadline = monotonic() + maxWait
+    for symbol in symbols:
+        while True:
+            try:
+                weeklyPrices.get(symbol, BACKGROUND)
+                break
+            except QuotaExceededError as e:
+                if monotonic() >= deadline:
+                    print("Out of time waiting for quota, the remaining symbols use the stored series")
+                    return
+                sleep(min(max(e.retryAfter or 1, 1), max(0, deadline - monotonic())))
+            except Exception as e:
+                print("Can't fetch the series of '{}':".format(symbol), e)
+                break
+
+
+def runNightly(watchlistPath = WATCHLIST_FILE, hotCount = 20):
+    """ Precompute predictions for the watchlist and the hotCount most requested symbols, in one model call """
+    symbols = loadWatchlist(watchlistPath)
+    hotSymbols.load()
+    for symbol, _ in hotSymbols.top(hotCount):
+        if symbol not in symbols:
+            symbols.append(symbol)
+
+    model = load_predict_model()
+    fetchSeries(symbols)
+    predictions = precompute_predictions(model, symbols, BACKGROUND)
+    print("Precomputed predictions for {} of {} symbols".format(len(predictions), len(symbols)))
+    return predictions
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(prog="python3 -m stockbot.nightly", description="Precompute predictions for a watchlist, e.g. nightly from cron")
+    parser.add_argument("--watchlist", default=WATCHLIST_FILE, help="file with one symbol per line")
+    parser.add_argument("--hot", type=int, default=20, help="also precompute the most requested symbols, up to this many")
+    args = parser.parse_args()
+    runNightly(args.watchlist, args.hot)
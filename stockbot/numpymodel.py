@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+import numpy as np
+import json
+
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "tanh": np.tanh,
+}
+
+
+class _Layer:
+    """ Base class for forward-pass-only layers built from a Keras layer config """
+    weightCount = 0
+
+    def __init__(self, config):
+        self.name = config["name"]
+
+    def setWeights(self, weights):
+        pass
+
+
+class _Conv1D(_Layer):
+    def __init__(self, config):
+        super().__init__(config)
+        if config.get("padding", "valid") != "valid" or config.get("data_format", "channels_last") != "channels_last":
+            raise NotImplementedError("Conv1D layer '{}' must use valid padding and channels_last".format(self.name))
+        self.stride = config["strides"][0]
+        self.dilation = config["dilation_rate"][0]
+        self.activation = _getActivation(config)
+        self.useBias = config.get("use_bias", True)
+        self.weightCount = 2 if self.useBias else 1
+
+    def setWeights(self, weights):
+        # Kernel shape is (kernel size, input channels, filters)
+        self.kernel = weights[0]
+        self.bias = weights[1] if self.useBias else None
+
+    def __call__(self, x):
+        kernelSize = self.kernel.shape[0]
+        outLength = (x.shape[1] - self.dilation * (kernelSize - 1) - 1) // self.stride + 1
+        span = self.stride * (outLength - 1) + 1
+        out = x[:, 0:span:self.stride, :] @ self.kernel[0]
+        for k in range(1, kernelSize):
+            start = k * self.dilation
+            out += x[:, start:start + span:self.stride, :] @ self.kernel[k]
+        if self.bias is not None:
+            out += self.bias
+        return self.activation(out)
+
+
+class _MaxPooling1D(_Layer):
+    def __init__(self, config):
+        super().__init__(config)
+        if config.get("padding", "valid") != "valid" or config.get("data_format", "channels_last") != "channels_last":
+            raise NotImplementedError("MaxPooling1D layer '{}' must use valid padding and channels_last".format(self.name))
+        self.poolSize = config["pool_size"][0]
+        self.stride = config["strides"][0] if config.get("strides") else self.poolSize
+
+    def __call__(self, x):
+        outLength = (x.shape[1] - self.poolSize) // self.stride + 1
+        span = self.stride * (outLength - 1) + 1
+        out = x[:, 0:span:self.stride, :]
+        for i in range(1, self.poolSize):
+            out = np.maximum(out, x[:, i:i + span:self.stride, :])
+        return out
+
+
+class _Flatten(_Layer):
+    def __call__(self, x):
+        return x.reshape(x.shape[0], -1)
+
+
+class _Dropout(_Layer):
+    def __call__(self, x):
+        return x
+
+
+class _Dense(_Layer):
+    def __init__(self, config):
+        super().__init__(config)
+        self.activation = _getActivation(config)
+        self.useBias = config.get("use_bias", True)
+        self.weightCount = 2 if self.useBias else 1
+
+    def setWeights(self, weights):
+        self.kernel = weights[0]
+        self.bias = weights[1] if self.useBias else None
+
+    def __call__(self, x):
+        out = x @ self.kernel
+        if self.bias is not None:
+            out += self.bias
+        return self.activation(out)
+
+
+LAYERS = {
+    "Conv1D": _Conv1D,
+    "MaxPooling1D": _MaxPooling1D,
+    "Flatten": _Flatten,
+    "Dropout": _Dropout,
+    "Dense": _Dense,
+}
+
+
+def _getActivation(config):
+    activation = config.get("activation", "linear")
+    if activation not in ACTIVATIONS:
+        raise NotImplementedError("Unsupported activation '{}' in layer '{}'".format(activation, config["name"]))
+    return ACTIVATIONS[activation]
+
+
+class NumpyModel:
+    """ Forward-pass-only evaluator for small Keras Sequential models, using NumPy instead of TensorFlow.
+        Supports Conv1D, MaxPooling1D, Flatten, Dropout and Dense layers; raises NotImplementedError otherwise """
+    def __init__(self, modelJSON, weightsPath):
+        """ Constructor. Takes the architecture JSON string (as saved by model.to_json()) and a Keras HDF5 weights file """
+        import h5py
+
+        architecture = json.loads(modelJSON)
+        if architecture["class_name"] != "Sequential":
+            raise NotImplementedError("Only Sequential models are supported, not {}".format(architecture["class_name"]))
+        layerConfigs = architecture["config"]
+        # Keras 2.2.3+ wraps the layer list in a dict
+        if isinstance(layerConfigs, dict):
+            layerConfigs = layerConfigs["layers"]
+
+        self.layers = []
+        for layerConfig in layerConfigs:
+            layerClass = LAYERS.get(layerConfig["class_name"])
+            if layerClass == None:
+                raise NotImplementedError("Unsupported layer type {}".format(layerConfig["class_name"]))
+            self.layers.append(layerClass(layerConfig["config"]))
+
+        with h5py.File(weightsPath, "r") as weightsFile:
+            # Full model files keep the weights in a subgroup
+            if "model_weights" in weightsFile:
+                weightsFile = weightsFile["model_weights"]
+            for layer in self.layers:
+                if layer.weightCount == 0:
+                    continue
+                group = weightsFile[layer.name]
+                weightNames = [name.decode() if isinstance(name, bytes) else name for name in group.attrs["weight_names"]]
+                layer.setWeights([np.asarray(group[name], dtype=np.float32) for name in weightNames])
+
+    def predict_on_batch(self, x):
+        """ Run the model on a batch of inputs """
+        out = np.asarray(x, dtype=np.float32)
+        for layer in self.layers:
+            out = layer(out)
+        return out
+
+    def predict(self, x, batch_size = None, verbose = 0):
+        """ Same as predict_on_batch. Arguments match Keras' Model.predict """
+        return self.predict_on_batch(x)
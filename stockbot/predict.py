@@ -1,24 +1,227 @@
 #!/usr/bin/env python3
-from .alphavantage import time_series_weekly
-from keras.models import model_from_json
+from .pricestore import weeklyPrices
+from .features import featureWindows, closesToWindow, parseWeeklySeries
+from .predictbatcher import PredictionBatcher
+from .numpymodel import NumpyModel
+from .quota import INTERACTIVE, BACKGROUND, QuotaExceededError
+from .predictioncache import predictionCache, hashFiles
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os.path import dirname, realpath
+from argparse import ArgumentParser
+from time import monotonic, sleep
 import numpy as np
+import asyncio
+import json
+import sys
 
 
-def load_predict_model():
-    json_file = open(dirname(realpath(__file__)) + '/model/model.json', 'r')
+MODEL_JSON = dirname(realpath(__file__)) + '/model/model.json'
+MODEL_WEIGHTS = dirname(realpath(__file__)) + '/model/model.h5'
+
+
+def load_predict_model(backend='auto'):
+    """Loads the prediction model. backend is 'numpy' (no TensorFlow needed), 'keras', or 'auto' to try numpy first.
+    Cached predictions of other versions of the model files are dropped"""
+    predictionCache.setModel(hashFiles((MODEL_JSON, MODEL_WEIGHTS)))
+    json_file = open(MODEL_JSON, 'r')
     loaded_model_json = json_file.read()
     json_file.close()
+    if backend != 'keras':
+        try:
+            return NumpyModel(loaded_model_json, MODEL_WEIGHTS)
+        except (NotImplementedError, ImportError) as e:
+            if backend == 'numpy':
+                raise
+            print("Can't evaluate the model with NumPy, falling back to Keras:", e)
+    from keras.models import model_from_json
     loaded_model=model_from_json(loaded_model_json)
-    loaded_model.load_weights(dirname(realpath(__file__)) + '/model/model.h5')
+    loaded_model.load_weights(MODEL_WEIGHTS)
     return loaded_model
 
 
-def predict(loaded_model, symbol):
-    t=time_series_weekly(symbol)
-    inTimeseries = []
-    for timestamp, data in t.items():
-        clos=float(data['4. close'])
-        inTimeseries.insert(0, clos)
-    inTimeseries = inTimeseries[:200]
-    return loaded_model.predict(np.atleast_3d(inTimeseries))[0][0]
+def _cached(symbol, dates):
+    """Get the cached prediction for a symbol's series, or None"""
+    if len(dates) == 0:
+        return None
+    value = predictionCache.get(symbol, dates[-1])
+    return np.float32(value) if value != None else None
+
+
+def predict(loaded_model, symbol, priority=INTERACTIVE):
+    """Predicts next week's close for a symbol. Weekly closes missing from the price store are fetched with a quota priority.
+    The model only runs when the symbol has a new weekly bar since its last prediction"""
+    symbol = symbol.upper()
+    dates, closes = weeklyPrices.get(symbol, priority)
+    pred = _cached(symbol, dates)
+    if pred == None:
+        window = featureWindows.getWindow(symbol, dates, closes)
+        pred = loaded_model.predict(window[np.newaxis])[0][0]
+        predictionCache.put(symbol, dates[-1], pred)
+    return pred
+
+
+async def apredict(loaded_model, symbol, executor):
+    """Same as predict, but fetches without blocking the event loop and runs the model in executor.
+    A PredictionBatcher is awaited directly instead, so the executor isn't held while the batch fills"""
+    symbol = symbol.upper()
+    dates, closes = await weeklyPrices.aget(symbol)
+    pred = _cached(symbol, dates)
+    if pred == None:
+        window = featureWindows.getWindow(symbol, dates, closes)
+        if isinstance(loaded_model, PredictionBatcher):
+            pred = (await asyncio.wrap_future(loaded_model.submit(window)))[0]
+        else:
+            pred = (await asyncio.get_running_loop().run_in_executor(executor, loaded_model.predict, window[np.newaxis]))[0][0]
+        predictionCache.put(symbol, dates[-1], pred)
+    return pred
+
+
+def _result(symbol, lastBar, pred, cached):
+    return {"symbol": symbol, "prediction": float(pred), "lastBar": str(lastBar), "cached": cached}
+
+
+def _errorResult(symbol, error):
+    result = {"symbol": symbol, "error": str(error)}
+    if isinstance(error, QuotaExceededError) and error.retryAfter != None:
+        result["retryAfter"] = round(error.retryAfter, 1)
+    return result
+
+
+def _uniqueSymbols(symbols):
+    return list(dict.fromkeys(symbol.upper() for symbol in symbols))
+
+
+def _checkSeries(symbol, dates, closes, pending):
+    """Get the result for a fetched series if its prediction is cached, otherwise queue its model input in pending and return None"""
+    pred = _cached(symbol, dates)
+    if pred != None:
+        return _result(symbol, dates[-1], pred, True)
+    pending.append((symbol, dates[-1], featureWindows.getWindow(symbol, dates, closes)))
+    return None
+
+
+def _predictPending(loaded_model, pending):
+    """Runs the queued model inputs through the model as one (N, 200, 1) batch. Returns their results"""
+    if len(pending) == 0:
+        return []
+    # A PredictionBatcher would split the batch up, so the model it wraps is called directly
+    model = loaded_model.model if isinstance(loaded_model, PredictionBatcher) else loaded_model
+    outputs = model.predict(np.stack([window for _, _, window in pending]))
+    predictionCache.putMany((symbol, lastBar, output[0]) for (symbol, lastBar, _), output in zip(pending, outputs))
+    return [_result(symbol, lastBar, output[0], False) for (symbol, lastBar, _), output in zip(pending, outputs)]
+
+
+def predict_stream(loaded_model, symbols, priority=INTERACTIVE, workers=8):
+    """Predicts for many symbols, yielding a result dictionary per symbol as soon as it is known. Series are fetched
+    concurrently on up to workers threads, within the upstream quota; cached predictions are yielded as their series
+    arrive, and the rest come from a single batched model call once every series is in. Failed symbols get an "error" result"""
+    symbols = _uniqueSymbols(symbols)
+    if len(symbols) == 0:
+        return
+    pending = []
+    pool = ThreadPoolExecutor(min(workers, len(symbols)), thread_name_prefix="PredictFetch")
+    try:
+        futures = {pool.submit(weeklyPrices.get, symbol, priority): symbol for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                result = _checkSeries(symbol, *future.result(), pending)
+            except Exception as e:
+                result = _errorResult(symbol, e)
+            if result != None:
+                yield result
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    yield from _predictPending(loaded_model, pending)
+
+
+async def apredict_stream(loaded_model, symbols, executor, priority=INTERACTIVE):
+    """Same as predict_stream, but series are fetched concurrently on the event loop and the model runs in executor"""
+    symbols = _uniqueSymbols(symbols)
+    pending = []
+
+    async def fetch(symbol):
+        try:
+            return symbol, await weeklyPrices.aget(symbol, priority), None
+        except Exception as e:
+            return symbol, None, e
+
+    tasks = [asyncio.ensure_future(fetch(symbol)) for symbol in symbols]
+    try:
+        for task in asyncio.as_completed(tasks):
+            symbol, series, error = await task
+            try:
+                if error != None:
+                    raise error
+                result = _checkSeries(symbol, *series, pending)
+            except Exception as e:
+                result = _errorResult(symbol, e)
+            if result != None:
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+    for result in await asyncio.get_running_loop().run_in_executor(executor, _predictPending, loaded_model, pending):
+        yield result
+
+
+def precompute_predictions(loaded_model, symbols, priority=INTERACTIVE):
+    """Predicts for many symbols with a single model call, skipping symbols with a cached prediction for their latest bar.
+    Returns a symbol to prediction dictionary; symbols which can't be predicted for are left out"""
+    predictions = dict()
+    for result in predict_stream(loaded_model, symbols, priority):
+        if "error" in result:
+            print("Can't predict for '{}':".format(result["symbol"]), result["error"])
+        else:
+            predictions[result["symbol"]] = result["prediction"]
+    return predictions
+
+
+def series_to_input(t):
+    """Turns a weekly time series into a model input batch of one"""
+    _, closes = parseWeeklySeries(t)
+    return closes_to_input(closes)
+
+
+def closes_to_input(closes):
+    """Turns weekly closes, oldest first, into a model input batch of one holding the latest 200 of them.
+    Shorter histories are padded with their oldest close, or rejected with ShortHistoryError if very short"""
+    return closesToWindow(closes)[np.newaxis]
+
+
+def _main():
+    parser = ArgumentParser(prog="python3 -m stockbot.predict", description="Predict next week's close for a list of symbols. Prints one JSON object per symbol as it completes")
+    parser.add_argument("symbols", nargs="*", help="stock symbols, e.g. AAPL MSFT")
+    parser.add_argument("--file", help="also read symbols from a file, one per line, with # comments")
+    parser.add_argument("--backend", choices=("auto", "numpy", "keras"), default="auto")
+    parser.add_argument("--wait", type=float, default=0, metavar="SECONDS",
+                        help="retry symbols refused for upstream quota for up to this long, instead of reporting them as errors")
+    args = parser.parse_args()
+
+    symbols = list(args.symbols)
+    if args.file != None:
+        with open(args.file, "r") as fd:
+            symbols += [line.split("#")[0].strip() for line in fd if line.split("#")[0].strip() != ""]
+    if len(symbols) == 0:
+        parser.error("no symbols given")
+
+    model = load_predict_model(args.backend)
+    deadline = monotonic() + args.wait
+    while len(symbols) != 0:
+        retry = []
+        retryAfter = 0
+        # At background priority, so a long list doesn't use up the quota reserved for chat queries
+        for result in predict_stream(model, symbols, BACKGROUND):
+            if "retryAfter" in result and monotonic() + result["retryAfter"] < deadline:
+                retry.append(result["symbol"])
+                retryAfter = max(retryAfter, result["retryAfter"])
+                continue
+            sys.stdout.write(json.dumps(result) + "\n")
+            sys.stdout.flush()
+        symbols = retry
+        if len(symbols) != 0:
+            sleep(retryAfter)
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+from concurrent.futures import Future
+from threading import Thread, Lock
+from queue import Queue, Empty
+from time import monotonic
+from .instrumentation import instrumentation
+import numpy as np
+
+
+class PredictionBatcher:
+    """ Collects concurrent prediction requests for a short while and runs them through the model as one batch.
+        Has the same predict() interface as a Keras model, so it can be used in place of one """
+    def __init__(self, model, maxBatchSize = 64, maxWait = 0.005):
+        """ Constructor. A batch is run once it has maxBatchSize inputs or its first input has waited maxWait seconds """
+        self.model = model
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWait
+        self.batches = 0
+        self.predictions = 0
+        self._queue = Queue()
+        self._lock = Lock()
+        self._thread = Thread(target=self._run, name="PredictionBatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, window):
+        """ Queue a single model input (e.g. shape (200, 1)). Returns a Future for the model's output row """
+        future = Future()
+        self._queue.put((np.asarray(window, dtype=np.float32), future))
+        return future
+
+    def predict(self, inputs):
+        """ Predict a batch of inputs like Keras' Model.predict, sharing the model call with other threads """
+        futures = [self.submit(window) for window in inputs]
+        return np.stack([future.result() for future in futures])
+
+    def _collect(self):
+        """ Block until a request arrives, then gather more until the batch is full or the wait is over.
+            Requests that are already queued are always taken, so maxWait = 0 still batches under load """
+        batch = [self._queue.get()]
+        deadline = monotonic() + self.maxWait
+        while len(batch) < self.maxBatchSize:
+            try:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch[0] == None:
+                return
+
+            # Inputs of different shapes can't share a model call
+            byShape = dict()
+            for request in batch:
+                if request == None:
+                    self._queue.put(None)
+                    continue
+                byShape.setdefault(request[0].shape, []).append(request)
+
+            for requests in byShape.values():
+                # Skip requests whose callers cancelled them
+                requests = [request for request in requests if request[1].set_running_or_notify_cancel()]
+                if len(requests) == 0:
+                    continue
+                try:
+                    with instrumentation.timed("predict.model"):
+                        outputs = np.asarray(self.model.predict_on_batch(np.stack([window for window, _ in requests])))
+                except Exception as e:
+                    for _, future in requests:
+                        future.set_exception(e)
+                    continue
+
+                with self._lock:
+                    self.batches += 1
+                    self.predictions += len(requests)
+                for (_, future), output in zip(requests, outputs):
+                    future.set_result(output)
+
+    def getStats(self):
+        """ Get batch counters as a dictionary """
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "predictions": self.predictions,
+                "meanBatchSize": self.predictions / self.batches if self.batches else 0
+            }
+
+    def close(self):
+        """ Stop the batching thread once queued requests are done """
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+from os.path import dirname, realpath
+from collections import OrderedDict
+from threading import Lock
+from hashlib import sha256
+from .instrumentation import instrumentation
+import sqlite3
+import os
+
+
+PREDICTION_CACHE_FILE = dirname(realpath(__file__)) + "/cache/predictions.sqlite"
+
+
+def hashFiles(paths):
+    """ Get a short hash of the contents of some files, e.g. to tell model versions apart """
+    digest = sha256()
+    for path in paths:
+        with open(path, "rb") as fd:
+            for chunk in iter(lambda: fd.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class PredictionCache:
+    """ Predictions keyed on (symbol, model version, date of the latest weekly bar), kept in memory and in an SQLite file.
+        A model's input only changes when a new weekly bar is stored, so a prediction holds until then. Entries of
+        other model versions are dropped when the model is set. The file is best-effort: SQLite errors, e.g. another
+        process holding it locked, are logged and the in-memory entries are used """
+    def __init__(self, path = PREDICTION_CACHE_FILE, maxEntries = 4096):
+        """ Constructor. Keeps at most maxEntries predictions in memory. If path is None, nothing is written to disk """
+        self.path = path
+        self.maxEntries = maxEntries
+        self.modelHash = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._db = None
+        self._dbLock = Lock()
+
+    def _getDB(self):
+        """ Open the SQLite file on first use. Call with the database lock held. If it can't be opened, e.g. because the
+            cache directory is read-only, the cache is kept in memory only from then on and None is returned """
+        if self._db == None and self.path != None:
+            try:
+                os.makedirs(dirname(self.path), exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+                db.execute("CREATE TABLE IF NOT EXISTS predictions (symbol TEXT NOT NULL, model TEXT NOT NULL, lastBar TEXT NOT NULL, value REAL NOT NULL, PRIMARY KEY (symbol, model, lastBar))")
+                db.commit()
+            except (OSError, sqlite3.Error) as e:
+                print("Exception while opening the prediction cache file, keeping predictions in memory only: ", e)
+                self.path = None
+                return None
+            self._db = db
+        return self._db
+
+    def setModel(self, modelHash):
+        """ Use the predictions of a model version from now on, dropping every other version's """
+        with self._lock:
+            self.modelHash = modelHash
+            self._entries.clear()
+        with self._dbLock:
+            try:
+                db = self._getDB()
+                if db != None:
+                    db.execute("DELETE FROM predictions WHERE model != ?", (modelHash,))
+                    db.commit()
+            except sqlite3.Error as e:
+                self._rollback()
+                print("Exception while writing the prediction cache file: ", e)
+
+    def get(self, symbol, lastBar):
+        """ Get the prediction for a symbol whose latest weekly bar is lastBar (a datetime64[D]), or None """
+        if self.modelHash == None:
+            return None
+        key = (symbol, str(lastBar))
+        with self._lock:
+            value = self._entries.get(key)
+            if value != None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        with self._dbLock:
+            try:
+                db = self._getDB()
+                row = db.execute("SELECT value FROM predictions WHERE symbol = ? AND model = ? AND lastBar = ?", (key[0], self.modelHash, key[1])).fetchone() if db != None else None
+            except sqlite3.Error as e:
+                print("Exception while reading the prediction cache file: ", e)
+                row = None
+        if row == None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        self._store(key, row[0])
+        return row[0]
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+    def putMany(self, predictions):
+        """ Store (symbol, lastBar, value) predictions. Older predictions of the same symbols are dropped from disk """
+        if self.modelHash == None:
+            return
+        rows = [(symbol, str(lastBar), float(value)) for symbol, lastBar, value in predictions]
+        for symbol, lastBar, value in rows:
+            self._store((symbol, lastBar), value)
+        with self._dbLock:
+            try:
+                db = self._getDB()
+                if db == None:
+                    return
+                db.executemany("DELETE FROM predictions WHERE symbol = ? AND lastBar != ?", [(symbol, lastBar) for symbol, lastBar, _ in rows])
+                db.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)", [(symbol, self.modelHash, lastBar, value) for symbol, lastBar, value in rows])
+                db.commit()
+            except sqlite3.Error as e:
+                self._rollback()
+                print("Exception while writing the prediction cache file: ", e)
+
+    def _rollback(self):
+        """ Undo a failed write, if the file is open. Call with the database lock held """
+        if self._db != None:
+            self._db.rollback()
+
+    def put(self, symbol, lastBar, value):
+        """ Store the prediction for a symbol whose latest weekly bar is lastBar """
+        self.putMany(((symbol, lastBar, value),))
+
+    def getStats(self):
+        """ Get hit/miss counters and occupancy as a dictionary """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxEntries": self.maxEntries,
+                "model": self.modelHash
+            }
+
+
+predictionCache = PredictionCache()
+instrumentation.registerCache("predictions", predictionCache.getStats)
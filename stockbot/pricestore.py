@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+from os.path import dirname, realpath
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from .alphavantage import time_series_weekly, atime_series_weekly
+from .responsecache import cachedJSON, acachedJSON, HISTORICAL_PRICES_TTL
+from .filelock import lockFile, unlockFile
+from .quota import INTERACTIVE
+import numpy as np
+import os
+import re
+
+
+PRICE_STORE_DIR = dirname(realpath(__file__)) + "/cache/prices"
+
+# Dates are stored as numpy days (days since 1970-01-01 as 64 bit integers), closes as doubles
+DATE_DTYPE = np.dtype("<M8[D]")
+CLOSE_DTYPE = np.dtype("<f8")
+
+_SYMBOL_RE = re.compile(r"^[A-Z0-9.^-]{1,20}$")
+# Bars are treated as final at this time (UTC) on their last trading day, after the US close all year round
+_CLOSE_HOUR = 22
+
+
+def _dayStart(day):
+    return datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(days=int(day.astype(np.int64)))
+
+
+def dailyBarClose(day):
+    """ When the daily bar of a day is final """
+    return _dayStart(day) + timedelta(hours=_CLOSE_HOUR)
+
+
+def weeklyBarClose(day):
+    """ When the weekly bar containing a day is final. Weekly bars close on Friday """
+    start = _dayStart(day)
+    return start + timedelta(days=(4 - start.weekday()) % 7, hours=_CLOSE_HOUR)
+
+
+class PriceStore:
+    """ An append-only columnar store of closing prices, with one date file and one close file per symbol.
+        Series are read as memory maps, so repeat reads don't copy or parse anything. Only final bars are stored,
+        and upstream is only asked for bars newer than the last stored one once a newer one could exist """
+    def __init__(self, directory, fetchBars, afetchBars, barClose, period):
+        """ Constructor. fetchBars(symbol, afterDay, priority) returns (date string, close) pairs which include every bar after afterDay
+            (None for the full history), asking upstream with a quota priority; afetchBars is the same as a coroutine. barClose(day) is when the bar of a day is final,
+            and a new bar is expected period after the last one's barClose """
+        self.directory = directory
+        self.fetchBars = fetchBars
+        self.afetchBars = afetchBars
+        self.barClose = barClose
+        self.period = period
+        self._maps = dict()
+        self._lock = Lock()
+
+    def _paths(self, symbol):
+        if _SYMBOL_RE.match(symbol) == None:
+            raise ValueError("Invalid symbol '{}'".format(symbol))
+        base = os.path.join(self.directory, symbol)
+        return base + ".date", base + ".close"
+
+    def read(self, symbol):
+        """ Get the stored (dates, closes) of a symbol, oldest first, without asking upstream.
+            Both are read-only memory maps """
+        symbol = symbol.upper()
+        datePath, closePath = self._paths(symbol)
+        try:
+            # Closes are appended before dates, so a row only counts once both columns have it
+            length = min(os.path.getsize(datePath) // DATE_DTYPE.itemsize, os.path.getsize(closePath) // CLOSE_DTYPE.itemsize)
+        except FileNotFoundError:
+            length = 0
+
+        with self._lock:
+            cached = self._maps.get(symbol)
+            if cached != None and cached[0] == length:
+                return cached[1], cached[2]
+
+        if length == 0:
+            dates, closes = np.empty(0, DATE_DTYPE), np.empty(0, CLOSE_DTYPE)
+        else:
+            dates = np.memmap(datePath, DATE_DTYPE, mode="r", shape=(length,))
+            closes = np.memmap(closePath, CLOSE_DTYPE, mode="r", shape=(length,))
+
+        with self._lock:
+            self._maps[symbol] = (length, dates, closes)
+        return dates, closes
+
+    def _lastDay(self, symbol):
+        dates, _ = self.read(symbol)
+        return dates[-1] if len(dates) != 0 else None
+
+    def _isDue(self, lastDay):
+        """ Whether upstream could have a final bar newer than lastDay """
+        return lastDay == None or datetime.now(timezone.utc) >= self.barClose(lastDay) + self.period
+
+    def _append(self, symbol, bars):
+        """ Append the final bars newer than the last stored one """
+        now = datetime.now(timezone.utc)
+        bars = sorted((np.datetime64(date[:10], "D"), float(close)) for date, close in bars)
+        datePath, closePath = self._paths(symbol)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(datePath + ".lock", "a+") as lockFd:
+            lockFile(lockFd)
+            try:
+                # Another thread or process may have appended since the fetch started
+                lastDay = self._lastDay(symbol)
+                newBars = [bar for bar in bars if (lastDay == None or bar[0] > lastDay) and self.barClose(bar[0]) <= now]
+                if len(newBars) == 0:
+                    return
+                days = np.array([day for day, _ in newBars], DATE_DTYPE)
+                closes = np.array([close for _, close in newBars], CLOSE_DTYPE)
+                # Trim anything a crashed writer left half-written, so the columns stay aligned
+                length = min(os.path.getsize(datePath) // DATE_DTYPE.itemsize, os.path.getsize(closePath) // CLOSE_DTYPE.itemsize) if lastDay != None else 0
+                with open(closePath, "ab") as fd:
+                    fd.truncate(length * CLOSE_DTYPE.itemsize)
+                    fd.write(closes.tobytes())
+                with open(datePath, "ab") as fd:
+                    fd.truncate(length * DATE_DTYPE.itemsize)
+                    fd.write(days.tobytes())
+            finally:
+                unlockFile(lockFd)
+
+    def get(self, symbol, priority = INTERACTIVE):
+        """ Get the (dates, closes) of a symbol, first fetching any newer final bars """
+        symbol = symbol.upper()
+        lastDay = self._lastDay(symbol)
+        if self._isDue(lastDay):
+            self._append(symbol, self.fetchBars(symbol, lastDay, priority))
+        return self.read(symbol)
+
+    async def aget(self, symbol, priority = INTERACTIVE):
+        """ Same as get, but doesn't block the event loop while fetching """
+        symbol = symbol.upper()
+        lastDay = self._lastDay(symbol)
+        if self._isDue(lastDay):
+            self._append(symbol, await self.afetchBars(symbol, lastDay, priority))
+        return self.read(symbol)
+
+
+def _weeklyBars(series):
+    return [(date, data["4. close"]) for date, data in series.items()]
+
+
+def _fetchWeekly(symbol, afterDay, priority):
+    # Alpha Vantage always sends the full weekly history
+    return _weeklyBars(time_series_weekly(symbol, priority))
+
+
+async def _afetchWeekly(symbol, afterDay, priority):
+    return _weeklyBars(await atime_series_weekly(symbol, priority))
+
+
+def _dailyURL(symbol, afterDay):
+    url = "https://financialmodelingprep.com/api/v3/historical-price-full/" + symbol + "?serietype=line"
+    if afterDay != None:
+        url += "&from=" + str(afterDay + 1)
+    return url
+
+
+def _dailyBars(data):
+    return [(day["date"], day["close"]) for day in data.get("historical", [])]
+
+
+def _fetchDaily(symbol, afterDay, priority):
+    # Financial Modeling Prep calls aren't rationed, so the priority doesn't matter
+    return _dailyBars(cachedJSON(_dailyURL(symbol, afterDay), HISTORICAL_PRICES_TTL))
+
+
+async def _afetchDaily(symbol, afterDay, priority):
+    return _dailyBars(await acachedJSON(_dailyURL(symbol, afterDay), HISTORICAL_PRICES_TTL))
+
+
+weeklyPrices = PriceStore(PRICE_STORE_DIR + "/weekly", _fetchWeekly, _afetchWeekly, weeklyBarClose, timedelta(days=7))
+dailyPrices = PriceStore(PRICE_STORE_DIR + "/daily", _fetchDaily, _afetchDaily, dailyBarClose, timedelta(days=1))
@@ -1,11 +1,8 @@
 #!/usr/bin/env python3
-from bitstream import BitStream
-from numpy import uint8, uint16
-from reedsolo import RSCodec
+from numpy import argwhere, array, ascontiguousarray, concatenate, count_nonzero, diff, empty, flatnonzero, frombuffer, full, hstack, int16, stack, tile, uint8, unpackbits, where, zeros
 from math import ceil, floor
 from enum import IntEnum
-from io import BytesIO
-from PIL import Image
+from .qrrender import modulesToPNG, modulesToSVG, DEFAULT_SCALE, DEFAULT_BORDER
 
 class QR_ECC(IntEnum):
     """ Error correction capability (ECC) levels for QR code encoding """
@@ -46,16 +43,24 @@ class Module(IntEnum):
 
 class ModuleMatrix:
     """ A class for storing modules in a matrix. E.g. patterns and QR codes """
+    # Values used to store modules in the backing array. Unset can't be -1 in a uint8 array
+    BLACK = 0
+    WHITE = 1
+    UNSET = 255
+    _MODULE_FROM_VALUE = { BLACK: Module.Black, WHITE: Module.White, UNSET: Module.Unset }
+    
+    # Sequences which are penalised when searching for finder-like patterns (bwbbbwbwwww and wwwwbwbbbwb)
+    _FINDER_SEQUENCES = (
+        (BLACK, WHITE, BLACK, BLACK, BLACK, WHITE, BLACK, WHITE, WHITE, WHITE, WHITE),
+        (WHITE, WHITE, WHITE, WHITE, BLACK, WHITE, BLACK, BLACK, BLACK, WHITE, BLACK)
+    )
+    
     def __init__(self, width, height):
         """ Constructor. Makes a blank matrix of the specified dimensions """
         self._width = width
         self._height = height
-        self._modules = []
-        
-        # Gen blank matrix
-        row = [ Module.Unset ] * width
-        for i in range(height):
-            self._modules.append(row.copy())
+        # Modules are stored row-major, so the array is indexed [y, x]
+        self._modules = full((height, width), ModuleMatrix.UNSET, dtype=uint8)
     
     def fromStrList(array):
         """ Factory that makes a new matrix out of a string list. B is black, W is white, spaces are unset """
@@ -82,186 +87,135 @@ class ModuleMatrix:
         # Done
         return matrix
     
+    def fromArray(modules):
+        """ Factory that makes a new matrix which takes ownership of a 2D uint8 array of module values """
+        height, width = modules.shape
+        matrix = ModuleMatrix.__new__(ModuleMatrix)
+        matrix._width = width
+        matrix._height = height
+        matrix._modules = modules
+        return matrix
+    
     def copy(self):
         """ Creates a new instance which is a copy of the matrix """
-        matrixCopy = ModuleMatrix(self._width, self._height)
-        for y in range(self._height):
-            for x in range(self._width):
-                matrixCopy[x, y] = self[x, y]
-        
-        return matrixCopy
+        return ModuleMatrix.fromArray(self._modules.copy())
     
     def overwrite(self, matrix):
         """ Overwrites self with the given matrix """
         self._width, self._height = matrix.getDimensions()
-        for y in range(self._height):
-            for x in range(self._width):
-                self[x, y] = matrix[x, y]
+        self._modules = matrix.getArray().copy()
     
     def getDimensions(self):
         """ Get matrix dimensions """
         return self._width, self._height
     
+    def getArray(self):
+        """ Get the backing uint8 array, indexed [y, x]. Not a copy """
+        return self._modules
+    
     def __getitem__(self, pos):
         """ Get module at position """
-        return self._modules[pos[1]][pos[0]]
+        return ModuleMatrix._MODULE_FROM_VALUE[self._modules[pos[1], pos[0]]]
     
     def __setitem__(self, pos, module):
         """ Set module at position """
-        self._modules[pos[1]][pos[0]] = module
+        self._modules[pos[1], pos[0]] = ModuleMatrix.UNSET if module == Module.Unset else module
+    
+    def _clipRegion(self, x, y, width, height):
+        """ Clips a region placed at a position to the matrix. Returns the matrix and region slices, or None if they don't overlap """
+        left = max(x, 0)
+        top = max(y, 0)
+        right = min(x + width, self._width)
+        bottom = min(y + height, self._height)
+        if left >= right or top >= bottom:
+            return None
+        
+        return (slice(top, bottom), slice(left, right)), (slice(top - y, bottom - y), slice(left - x, right - x))
     
     def applyPattern(self, x, y, pattern):
         """ Apply a pattern at a position. The position is the top-left corner of the pattern """
         pWidth, pHeight = pattern.getDimensions()
-        for dy in range(pHeight):
-            # Real Y coordinate
-            ry = y + dy
-            if ry >= 0 and ry < self._height:
-                for dx in range(pWidth):
-                    # Skip if module unset in pattern
-                    thisModule = pattern[dx, dy]
-                    if thisModule == Module.Unset:
-                        continue
-                    
-                    # Real X coordinate
-                    rx = x + dx
-                    if rx >= 0 and rx < self._width:
-                        self[rx, ry] = thisModule
+        region = self._clipRegion(x, y, pWidth, pHeight)
+        if region == None:
+            return
+        
+        # Copy only modules which are set in the pattern
+        selfSlices, patternSlices = region
+        patternModules = pattern.getArray()[patternSlices]
+        target = self._modules[selfSlices]
+        isSet = patternModules != ModuleMatrix.UNSET
+        target[isSet] = patternModules[isSet]
     
     def applyMask(self, x, y, mask):
         """ Applies a mask pattern at a position by XORing modules instead of overwriting """
         mWidth, mHeight = mask.getDimensions()
-        for dy in range(mHeight):
-            # Real Y coordinate
-            ry = y + dy
-            if ry >= 0 and ry < self._height:
-                for dx in range(mWidth):
-                    # Skip if module unset in mask
-                    thisModule = mask[dx, dy]
-                    if thisModule == Module.Unset:
-                        continue
-                    
-                    # Real X coordinate
-                    rx = x + dx
-                    if rx >= 0 and rx < self._width:
-                        # Skip if module unset in matrix
-                        if self[rx, ry] == Module.Unset:
-                            continue
-                        
-                        # Flip if mask module is black
-                        if thisModule == Module.Black:
-                            if self[rx, ry] == Module.Black:
-                                self[rx, ry] = Module.White
-                            else:
-                                self[rx, ry] = Module.Black
+        region = self._clipRegion(x, y, mWidth, mHeight)
+        if region == None:
+            return
+        
+        # Flip modules where the mask is black, unless they are unset in the matrix
+        selfSlices, maskSlices = region
+        target = self._modules[selfSlices]
+        flip = (mask.getArray()[maskSlices] == ModuleMatrix.BLACK) & (target != ModuleMatrix.UNSET)
+        target ^= flip.view(uint8)
     
     def applyMaskRepeated(self, mask):
         """ Repeats a mask pattern from the top left to the bottom right """
         mWidth, mHeight = mask.getDimensions()
-        for y in range(0, self._height, mHeight):
-            for x in range(0, self._width, mWidth):
-                # Apply mask at this position
-                self.applyMask(x, y, mask)
+        reps = (ceil(self._height / mHeight), ceil(self._width / mWidth))
+        tiled = tile(mask.getArray(), reps)[:self._height, :self._width]
+        self.applyMask(0, 0, ModuleMatrix.fromArray(tiled))
     
     def extractUnset(self):
         """ Creates a copy of the matrix, with set modules as unset and unset modules as white """
-        matrixCopy = self.copy()
-        for y in range(self._height):
-            for x in range(self._width):
-                thisModule = self[x, y]
-                if thisModule == Module.Unset:
-                    thisModule = Module.White
-                else:
-                    thisModule = Module.Unset
-                
-                matrixCopy[x, y] = thisModule
+        isUnset = self._modules == ModuleMatrix.UNSET
+        return ModuleMatrix.fromArray(where(isUnset, uint8(ModuleMatrix.WHITE), uint8(ModuleMatrix.UNSET)))
+    
+    def _runPenalty(modules):
+        """ Penalty for runs of 5 or more equal modules along each row of a 2D array: 3 for the first 5, 1 for each extra """
+        # Separate rows with a value that is never a module so runs can't span rows
+        height = modules.shape[0]
+        line = hstack((modules, full((height, 1), 254, dtype=uint8))).ravel()
+        runStarts = concatenate(([0], flatnonzero(line[1:] != line[:-1]) + 1, [len(line)]))
+        runLengths = diff(runStarts)
+        longRuns = runLengths[runLengths >= 5]
+        return int((longRuns - 2).sum())
+    
+    def _sequencePenalty(modules):
+        """ Penalty for finder-like sequences along each row of a 2D array: 40 for each occurrence """
+        width = modules.shape[1]
+        count = 0
+        for sequence in ModuleMatrix._FINDER_SEQUENCES:
+            seqLen = len(sequence)
+            if width < seqLen:
+                break
+            
+            matches = modules[:, :width - seqLen + 1] == sequence[0]
+            for i in range(1, seqLen):
+                matches &= modules[:, i:width - seqLen + 1 + i] == sequence[i]
+            count += int(count_nonzero(matches))
         
-        return matrixCopy
+        return count * 40
     
     def getPenaltyScore(self):
         """ Get the penalty score of the current matrix """
-        score = 0
-        
-        # Find consecutive horizontal lines
-        for y in range(self._height):
-            length = 0
-            lastModule = Module.Unset
-            for x in range(self._width):
-                thisModule = self[x, y]
-                if thisModule == lastModule:
-                    length += 1
-                    if length == 5:
-                        score += 3
-                    elif length > 5:
-                        score += 1
-                else:
-                    length = 1
-                lastModule = thisModule
-        
-        # Find consecutive vertical lines
-        for x in range(self._width):
-            length = 0
-            lastModule = Module.Unset
-            for y in range(self._height):
-                thisModule = self[x, y]
-                if thisModule == lastModule:
-                    length += 1
-                    if length == 5:
-                        score += 3
-                    elif length > 5:
-                        score += 1
-                else:
-                    length = 1
-                lastModule = thisModule
+        modules = self._modules
+        transposed = ascontiguousarray(modules.T)
+        
+        # Find consecutive horizontal and vertical lines
+        score = ModuleMatrix._runPenalty(modules) + ModuleMatrix._runPenalty(transposed)
         
         # Find 2x2 squares
-        for x in range(self._width - 1):
-            for y in range(self._height - 1):
-                expectedModule = self[x, y]
-                if expectedModule == self[x + 1, y] and expectedModule == self[x, y + 1] and expectedModule == self[x + 1, y + 1]:
-                    score += 3
-        
-        # Find the sequence bwbbbwbwwww and wwwwbwbbbwb...
-        firstSequence = [Module.Black, Module.White, Module.Black, Module.Black, Module.Black, Module.White, Module.Black, Module.White, Module.White, Module.White, Module.White]
-        secondSequence = firstSequence.copy()
-        secondSequence.reverse()
-        def horizSequenceMatches(x, y, sequence):
-            for dx in range(len(sequence)):
-                if self[x + dx, y] != sequence[dx]:
-                    return False
-            return True
-        
-        def vertSequenceMatches(x, y, sequence):
-            for dy in range(len(sequence)):
-                if self[x, y + dy] != sequence[dy]:
-                    return False
-            return True
-        
-        # ... horizontally
-        for x in range(self._width - 10):
-            for y in range(self._height):
-                if horizSequenceMatches(x, y, firstSequence):
-                    score += 40
-                if horizSequenceMatches(x, y, secondSequence):
-                    score += 40
-        
-        # ... vertically
-        for y in range(self._height - 10):
-            for x in range(self._width):
-                if vertSequenceMatches(x, y, firstSequence):
-                    score += 40
-                if vertSequenceMatches(x, y, secondSequence):
-                    score += 40
+        topLeft = modules[:-1, :-1]
+        squares = (topLeft == modules[:-1, 1:]) & (topLeft == modules[1:, :-1]) & (topLeft == modules[1:, 1:])
+        score += int(count_nonzero(squares)) * 3
+        
+        # Find the sequence bwbbbwbwwww and wwwwbwbbbwb horizontally and vertically
+        score += ModuleMatrix._sequencePenalty(modules) + ModuleMatrix._sequencePenalty(transposed)
         
         # Add black/white ratio penalty
-        black = 0
-        white = 0
-        for x in range(self._width):
-            for y in range(self._height):
-                if self[x, y] == Module.Black:
-                    black += 1
-                else:
-                    white += 1
+        black = int(count_nonzero(modules == ModuleMatrix.BLACK))
+        white = self._width * self._height - black
         bwRatio = (black / white) * 100
         prevMulPenalty = abs(floor(bwRatio / 5) * 5 - 50) // 5
         nextMulPenalty = abs(floor((bwRatio + 5) / 5) * 5 - 50) // 5
@@ -269,17 +223,79 @@ class ModuleMatrix:
         
         return score
     
+    def _checkFilled(self):
+        unset = argwhere(self._modules == ModuleMatrix.UNSET)
+        if len(unset) != 0:
+            raise Exception("Unexpected unfilled module at ({}, {})".format(unset[0][1], unset[0][0]))
+    
     def toImage(self):
-        """ Convert matrix to image """
-        image = Image.new('1', (self._width, self._height), 0)
-        pixels = image.load()
-        for y in range(self._height):
-            for x in range(self._width):
-                if self[x, y] == Module.Unset:
-                    raise Exception("Unexpected unfilled module at ({}, {})".format(x, y))
-                pixels[x, y] = self[x, y]
-        
-        return image
+        """ Convert matrix to a PIL image, one pixel per module and without a quiet zone """
+        from PIL import Image
+        self._checkFilled()
+        
+        # Black modules are 0 and white modules are 255 in the greyscale image
+        return Image.fromarray(self._modules * uint8(255)).convert('1', dither=Image.NONE)
+    
+    def toPNG(self, scale = DEFAULT_SCALE, border = DEFAULT_BORDER):
+        """ Encode matrix as 1-bit PNG file bytes with scale pixels per module and a quiet zone of border modules. Doesn't need PIL """
+        self._checkFilled()
+        return modulesToPNG(self._modules, scale, border)
+    
+    def toSVG(self, scale = DEFAULT_SCALE, border = DEFAULT_BORDER):
+        """ Encode matrix as an SVG document string, scale pixels per module with a quiet zone of border modules """
+        self._checkFilled()
+        return modulesToSVG(self._modules, scale, border)
+
+def _gfTables():
+    """ Build GF(256) antilog and log tables for the QR code field polynomial x^8 + x^4 + x^3 + x^2 + 1, and a full
+        multiplication table from them """
+    exp = zeros(512, dtype=int)
+    log = zeros(256, dtype=int)
+    value = 1
+    for power in range(255):
+        exp[power] = value
+        log[value] = power
+        value <<= 1
+        if value & 0x100:
+            value ^= 0x11d
+    # Doubled so sums of two logs don't need reducing
+    exp[255:510] = exp[:255]
+    
+    product = exp[log[:, None] + log[None, :]].astype(uint8)
+    product[0, :] = 0
+    product[:, 0] = 0
+    return exp, log, product
+
+_GF_EXP, _GF_LOG, _GF_MUL = _gfTables()
+
+# EC codeword count to a [coefficient, term] table of the generator polynomial's terms (highest degree first, without
+# the leading 1) multiplied by every coefficient
+_RS_GENERATOR_TABLES = dict()
+
+def _rsGeneratorTable(ecCount):
+    """ Get the generator polynomial multiplication table for a number of EC codewords """
+    table = _RS_GENERATOR_TABLES.get(ecCount)
+    if table is None:
+        # Product of (x - a^i) for i from 0 to ecCount - 1, highest degree first
+        generator = [1]
+        for i in range(ecCount):
+            root = int(_GF_EXP[i])
+            generator = [(generator[j] if j < len(generator) else 0) ^ (int(_GF_MUL[generator[j - 1], root]) if j > 0 else 0)
+                         for j in range(len(generator) + 1)]
+        table = _GF_MUL[:, generator[1:]]
+        _RS_GENERATOR_TABLES[ecCount] = table
+    return table
+
+def _rsRemainders(blocks, ecCount):
+    """ Reed-Solomon EC codewords of each row of a [block, codeword] uint8 array. Returns a [block, EC codeword] array """
+    table = _rsGeneratorTable(ecCount)
+    blockCount, length = blocks.shape
+    # Polynomial long division of every block at once: each leading coefficient subtracts (XORs) a multiple of the generator
+    remainder = zeros((blockCount, length + ecCount), dtype=uint8)
+    remainder[:, :length] = blocks
+    for i in range(length):
+        remainder[:, i + 1:i + 1 + ecCount] ^= table[remainder[:, i]]
+    return remainder[:, length:]
 
 class QRCode(ModuleMatrix):
     """ The QR code encoder class. Only encodes in byte mode """
@@ -379,6 +395,9 @@ class QRCode(ModuleMatrix):
         ])
     )
     
+    # Version to its (base matrix, final mask bitmaps, payload placement order), see _getTemplate
+    _TEMPLATES = dict()
+    
     def __init__(self, input_data, error_correction_capability = QR_ECC.M):
         """ Generate the smallest possible byte mode QR code with a minimum correction level """
         # Encode string to bytes
@@ -399,21 +418,16 @@ class QRCode(ModuleMatrix):
         # Generate interleaved data (final payload)
         payload = self._interleaveGroups(dataGroups, ecGroups)
         
-        # Initialize base module matrix
-        qrLength = 21 + ((self.version - 1) * 4)
-        super().__init__(qrLength, qrLength)
-        
-        # Generate base matrix with patterns
-        self._genBaseMatrix()
-        
-        # Generate final masks
-        finalMasks = self._genFinalMasks()
+        # Initialize base module matrix as a copy of the version's template, with patterns and reserved areas
+        base = QRCode._getTemplate(self.version)[0]
+        self._height, self._width = base.shape
+        self._modules = base.copy()
         
         # Populate base matrix with payload
         self._populateBaseMatrix(payload)
         
         # Generate all masked matrices
-        maskedMatrices = self._maskAll(finalMasks)
+        maskedMatrices = self._maskAll()
         
         # Pick best mask
         self._pickBestMask(maskedMatrices)
@@ -444,118 +458,66 @@ class QRCode(ModuleMatrix):
                 self.version = i + 1
                 return
     
+    def _dataCodewordCount(self):
+        """ Number of data codewords (bytes) the version and ECC level hold """
+        block_info = QRCode.BLOCK_LIST[self.version - 1][self.ecc]
+        if len(block_info) == 3:
+            return block_info[1] * block_info[2]
+        return block_info[1] * block_info[2] + block_info[3] * block_info[4]
+    
     def _genEncodedData(self):
-        """ Turns input data into a bit stream with headers but no error correction """
-        output = BitStream()
-        
-        # Add mode indicator. Using byte mode, so, write 0100
-        output.write([False, True, False, False], bool)
-        
-        # Add character count indicator. The size of the indicator depends on the QR version in use
+        """ Turns input data into codeword bytes with headers and padding but no error correction """
+        # Mode indicator 0100 (byte mode), then the character count indicator, then the data, built as one integer.
+        # The size of the indicator depends on the QR version in use
         data_len = len(self.data_bytes)
-        if self.version <= 9:
-            output.write(data_len, uint8)
-        else:
-            output.write(data_len, uint16)
+        countBits = 8 if self.version <= 9 else 16
+        value = (((0b0100 << countBits) | data_len) << (data_len * 8)) | int.from_bytes(self.data_bytes, 'big')
+        bitCount = 4 + countBits + data_len * 8
         
-        # Add data
-        output.write(self.data_bytes, bytes)
+        # Add 4-bit (or less) zero padding, then align data to bytes
+        req_bytes = self._dataCodewordCount()
+        zero_count = min(4, req_bytes * 8 - bitCount)
+        aligned_bytes = ceil((bitCount + zero_count) / 8)
+        value <<= aligned_bytes * 8 - bitCount
         
-        # Get required size
-        block_info = QRCode.BLOCK_LIST[self.version - 1][self.ecc]
-        req_bytes = None
-        if len(block_info) == 3:
-            req_bytes = block_info[1] * block_info[2]
-        else:
-            req_bytes = block_info[1] * block_info[2] + block_info[3] * block_info[4]
-        req_bits = req_bytes * 8
-        
-        # Add 4-bit (or less) zero padding
-        zero_count = min(4, req_bits - len(output))
-        output.write([False] * zero_count, bool)
-        
-        # Align data to bytes
-        out_len = len(output)
-        aligned_bits = ceil(out_len / 8) * 8
-        output.write([False] * (aligned_bits - out_len), bool)
-        
-        # Add padding bytes if necessary
-        aligned_bytes = aligned_bits // 8
-        alternate = False
-        for i in range(req_bytes - aligned_bytes):
-            if alternate:
-                output.write(17, uint8)
-            else:
-                output.write(236, uint8)
-            alternate = not alternate
-        
-        return output.read(bytes)
+        # Add alternating padding bytes if necessary
+        return value.to_bytes(aligned_bytes, 'big') + (b'\xec\x11' * ceil((req_bytes - aligned_bytes) / 2))[:req_bytes - aligned_bytes]
     
     def _genErrorCorrection(self, codewords):
-        """ Turn codewords into error-corrected data groups """
+        """ Turn codewords into error-corrected data groups. Each group is a [block, codeword] array """
         # Get EC info
         block_info = QRCode.BLOCK_LIST[self.version - 1][self.ecc]
+        codewords = frombuffer(codewords, dtype=uint8)
         
-        # Split into groups of blocks
-        groups = ([], [])
-        first_block_size = block_info[2]
-        for block in range(block_info[1]):
-            groups[0].append(codewords[first_block_size * block : first_block_size * (block + 1)])
-        
-        # Same for second group
-        if len(block_info) == 5: # There will be 5 elements in the info tuple if there are 2 groups
-            offset = first_block_size * block_info[1]
-            second_block_size = block_info[4]
-            for block in range(block_info[3]):
-                groups[1].append(codewords[offset + second_block_size * block : offset + second_block_size * (block + 1)])
-        
-        # Do first group's error correction 
-        ec_groups = ([], [])
-        ecc_codewords = block_info[0]
-        rscodec = RSCodec(ecc_codewords)
-        for b in range(len(groups[0])):
-            # Get full error corrected (EC) codewords as bytes and extract only EC bytes
-            ecBytes = rscodec.encode(groups[0][b])[block_info[2]:]
-            # Append to list of EC codewords
-            ec_groups[0].append(ecBytes)
-            
-        # Do second group's error correction
-        if len(block_info) == 5:
-            for b in range(len(groups[1])):
-                # Same thing as for first group
-                ecBytes = rscodec.encode(groups[1][b])[block_info[4]:]
-                ec_groups[1].append(ecBytes)
+        # Split into groups of equally sized blocks. There will be 5 elements in the info tuple if there are 2 groups
+        first_size = block_info[1] * block_info[2]
+        groups = (codewords[:first_size].reshape(block_info[1], block_info[2]),
+                  codewords[first_size:].reshape(block_info[3], block_info[4]) if len(block_info) == 5 else empty((0, 0), dtype=uint8))
         
+        # The blocks of a group have the same length, so they are divided by the generator polynomial together
+        ecc_codewords = block_info[0]
+        ec_groups = tuple(_rsRemainders(group, ecc_codewords) for group in groups)
         return groups, ec_groups
     
     def _interleaveGroups(self, dataGroups, ecGroups):
-        """ Interleaves data groups into the final bitstream payload, with remainder bits """
-        def interleaveTwo(bitStream, first, second):
-            # Interleaves two block groups together
-            hasSecond = len(second) != 0
-            firstLen = len(first[0])
-            secondLen = len(second[0]) if hasSecond else 0
-            for cw in range(max(firstLen, secondLen)):
-                if cw < firstLen:
-                    for block in first:
-                        bitStream.write(block[cw], uint8)
-                if cw < secondLen:
-                    for block in second:
-                        bitStream.write(block[cw], uint8)
-        
-        # This is where the payload is stored
-        payload = BitStream()
-        
-        # Interleave data blocks
-        interleaveTwo(payload, dataGroups[0], dataGroups[1])
-        
-        # Interleave EC blocks
-        interleaveTwo(payload, ecGroups[0], ecGroups[1])
+        """ Interleaves data groups into the final payload, as one bit per uint8 with remainder bits """
+        def interleaveTwo(first, second):
+            # Reads codeword columns across the blocks of both groups. Second group blocks may be longer, so the
+            # blocks are stacked with -1 filling the gaps and the gaps are dropped afterwards
+            if len(second) == 0:
+                return first.T.ravel()
+            width = max(first.shape[1], second.shape[1])
+            stacked = full((len(first) + len(second), width), -1, dtype=int16)
+            stacked[:len(first), :first.shape[1]] = first
+            stacked[len(first):, :second.shape[1]] = second
+            interleaved = stacked.T.ravel()
+            return interleaved[interleaved >= 0].astype(uint8)
+        
+        # Interleave data blocks, then EC blocks
+        codewords = concatenate((interleaveTwo(*dataGroups), interleaveTwo(*ecGroups)))
         
         # Add remainder bits (zero-padding to match size constraints)
-        payload.write([False] * QRCode.REMAINDER_LIST[self.version - 1], bool)
-        
-        return payload
+        return concatenate((unpackbits(codewords), zeros(QRCode.REMAINDER_LIST[self.version - 1], dtype=uint8)))
     
     def _genBaseMatrix(self):
         """ Generate the QR code's base matrix, with patterns and reserved areas only """
@@ -638,6 +600,28 @@ class QRCode(ModuleMatrix):
                 self[length - 10, i] = Module.White
                 self[length - 11, i] = Module.White
     
+    def _getTemplate(version):
+        """ Get the (base matrix, final mask bitmaps, payload placement order) of a version, building them the first time.
+            They only depend on the version, so every code of that version shares them and must not modify them """
+        template = QRCode._TEMPLATES.get(version)
+        if template != None:
+            return template
+        
+        # Draw the patterns on a blank code of the version
+        code = QRCode.__new__(QRCode)
+        code.version = version
+        qrLength = 21 + ((version - 1) * 4)
+        ModuleMatrix.__init__(code, qrLength, qrLength)
+        code._genBaseMatrix()
+        
+        # Each final mask as a bitmap of the modules it flips, so masking is a single XOR
+        flips = stack([mask.getArray() == ModuleMatrix.BLACK for mask in code._genFinalMasks()]).view(uint8)
+        template = (code.getArray(), flips, code._placementOrder())
+        for part in (template[0], template[1]) + template[2]:
+            part.flags.writeable = False
+        QRCode._TEMPLATES[version] = template
+        return template
+    
     def _genFinalMasks(self):
         """ Generates a list of final masks, those being mask patterns applied to unset parts of the matrix """
         finalMasks = []
@@ -647,46 +631,39 @@ class QRCode(ModuleMatrix):
             finalMasks.append(thisFinalMask)
         return finalMasks
     
-    def _populateBaseMatrix(self, payload):
-        """ Populates the base matrix with the bitstream payload """
-        def drawZigzagCol(x):
-            yRange = range(self._height)
-            if goingUp:
-                yRange = reversed(yRange)
-            
-            for y in yRange:
-                # Skip modules which are already set, since that means they are reserved
-                if self[x + 1, y] == Module.Unset:
-                    if payload.read(bool):
-                        self[x + 1, y] = Module.Black
-                    else:
-                        self[x + 1, y] = Module.White
-                
-                if self[x, y] == Module.Unset:
-                    if payload.read(bool):
-                        self[x, y] = Module.Black
-                    else:
-                        self[x, y] = Module.White
-        
-        # Starting at bottom right, populate with payload in a zig-zag pattern
+    def _placementOrder(self):
+        """ Get the (y, x) coordinate arrays of the modules the payload fills, in payload order, from the base matrix's unset modules """
+        # Starting at bottom right, go through column pairs in a zig-zag pattern, right column first.
+        # Note that the 7th column is skipped. Columns before it are paired from the 6th
+        pairs = list(range(self._width - 2, 6, -2)) + list(range(4, -1, -2))
+        ys = []
+        xs = []
         goingUp = True
-        for x in range(self._width - 2, 6, -2):
-            drawZigzagCol(x)
+        for x in pairs:
+            yRange = range(self._height - 1, -1, -1) if goingUp else range(self._height)
+            for y in yRange:
+                ys += (y, y)
+                xs += (x + 1, x)
             goingUp = not goingUp
+        ys = array(ys, dtype=int16)
+        xs = array(xs, dtype=int16)
         
-        # Note that the 7th column is skipped. This is the slice before the 7th column
-        for x in range(4, -1, -2):
-            drawZigzagCol(x)
-            goingUp = not goingUp
+        # Skip modules which are already set, since that means they are reserved
+        free = self._modules[ys, xs] == ModuleMatrix.UNSET
+        return ys[free], xs[free]
+    
+    def _populateBaseMatrix(self, payload):
+        """ Populates the base matrix with the payload bits, in a single scatter """
+        ys, xs = QRCode._getTemplate(self.version)[2]
+        if len(payload) < len(ys):
+            raise QR_Exception("Payload of {} bits is too short for version {}".format(len(payload), self.version))
+        
+        # Set bits are black modules
+        self._modules[ys, xs] = uint8(1) - payload[:len(ys)]
     
-    def _maskAll(self, finalMasks):
-        """ Applies all masks to the matrix with the payload """
-        maskedCodes = []
-        for mask in finalMasks:
-            matrixCopy = self.copy()
-            matrixCopy.applyMask(0, 0, mask)
-            maskedCodes.append(matrixCopy)
-        return maskedCodes
+    def _maskAll(self):
+        """ Applies all masks to the matrix with the payload, by XORing it with the version's final mask bitmaps """
+        return [ModuleMatrix.fromArray(self._modules ^ flips) for flips in QRCode._getTemplate(self.version)[1]]
     
     def _pickBestMask(self, maskedMatrices):
         """ Pick the mask that has the least penalty score """
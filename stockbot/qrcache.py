@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+from collections import OrderedDict
+from threading import Lock
+from .qr_pil import QRCode, QR_ECC
+from .qrrender import DEFAULT_SCALE, DEFAULT_BORDER
+from .instrumentation import instrumentation
+
+
+class QRCodeCache:
+    """ A bounded LRU cache of encoded QR code PNG files, keyed on payload and ECC level """
+    def __init__(self, maxSize = 256, scale = DEFAULT_SCALE, border = DEFAULT_BORDER):
+        """ Constructor. Keeps at most maxSize PNG files, drawn with scale pixels per module and a quiet zone of border modules """
+        self.maxSize = maxSize
+        self.scale = scale
+        self.border = border
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def getPNG(self, payload, ecc = QR_ECC.M):
+        """ Get the PNG file bytes of the QR code for a payload, encoding it only if it isn't cached """
+        key = (payload, ecc)
+        with self._lock:
+            pngBytes = self._entries.get(key)
+            if pngBytes != None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pngBytes
+            self.misses += 1
+
+        # Encode outside the lock so a miss doesn't stall hits in other threads
+        with instrumentation.timed("qr.encode"):
+            code = QRCode(payload, ecc)
+        with instrumentation.timed("qr.png"):
+            pngBytes = code.toPNG(self.scale, self.border)
+
+        with self._lock:
+            self._entries[key] = pngBytes
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+        return pngBytes
+
+    def getStats(self):
+        """ Get hit/miss counters and occupancy as a dictionary """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxSize": self.maxSize
+            }
+
+    def clear(self):
+        """ Drop all cached files and reset the counters """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+qrCodeCache = QRCodeCache()
+instrumentation.registerCache("qr", qrCodeCache.getStats)
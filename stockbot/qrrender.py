@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+from numpy import diff, int8, nonzero, packbits, pad, repeat, uint8, zeros
+import struct
+import zlib
+
+
+# Quiet zone around QR codes, in modules. The standard asks for at least 4
+DEFAULT_BORDER = 4
+DEFAULT_SCALE = 4
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _pngChunk(chunkType, data):
+    return struct.pack(">I", len(data)) + chunkType + data + struct.pack(">I", zlib.crc32(chunkType + data))
+
+
+def _withBorder(modules, border):
+    """ Surround a [y, x] array of modules (0 black, 1 white) with white modules """
+    return pad(modules, border, mode="constant", constant_values=1)
+
+
+def modulesToPNG(modules, scale = DEFAULT_SCALE, border = DEFAULT_BORDER):
+    """ Encode a [y, x] array of modules (0 black, 1 white) as a 1-bit greyscale PNG file, with a quiet zone of border
+        modules and scale pixels per module. Returns the file's bytes """
+    pixels = _withBorder(modules, border)
+    height, width = pixels.shape[0] * scale, pixels.shape[1] * scale
+    # In a 1-bit greyscale PNG, 0 is black and 1 is white, like module values. Rows are padded to whole bytes
+    packedRow = packbits(repeat(pixels, scale, axis=1).astype(uint8), axis=1)
+    # Each module row is scale identical scanlines. The first is stored as is (filter type 0), and the repeats with filter
+    # type 2 (up) as all zero differences, which deflate compresses to almost nothing
+    scanlines = zeros((pixels.shape[0], scale, packedRow.shape[1] + 1), uint8)
+    scanlines[:, 0, 1:] = packedRow
+    scanlines[:, 1:, 0] = 2
+    raw = scanlines.tobytes()
+
+    return (_PNG_SIGNATURE
+            + _pngChunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 1, 0, 0, 0, 0))
+            + _pngChunk(b"IDAT", zlib.compress(raw, 9))
+            + _pngChunk(b"IEND", b""))
+
+
+def modulesToSVG(modules, scale = DEFAULT_SCALE, border = DEFAULT_BORDER):
+    """ Encode a [y, x] array of modules (0 black, 1 white) as an SVG document, drawing each horizontal run of black
+        modules as one rectangle. Returns the document as a string """
+    height, width = modules.shape
+    size = (width + 2 * border, height + 2 * border)
+    # Edges of black runs: where a row changes between black and white, with white assumed past both ends.
+    # Each row has an even number of edges, so in row-major order they pair up into (start, stop) runs
+    black = pad(modules == 0, ((0, 0), (1, 1)), mode="constant", constant_values=False).astype(int8)
+    rows, columns = nonzero(diff(black, axis=1))
+    commands = ["M{},{}h{}v1h-{}z".format(start + border, y + border, stop - start, stop - start)
+                for y, start, stop in zip(rows[::2].tolist(), columns[::2].tolist(), columns[1::2].tolist())]
+
+    return ('<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="{}" height="{}" viewBox="0 0 {} {}" shape-rendering="crispEdges">'
+            '<rect width="100%" height="100%" fill="#fff"/><path fill="#000" d="{}"/></svg>').format(
+                size[0] * scale, size[1] * scale, size[0], size[1], "".join(commands))
@@ -1,25 +1,58 @@
 #!/usr/bin/env python3
-from .qr_pil import QRCode
+from .qrcache import qrCodeCache
 from random import choice
-from .predict import load_predict_model, predict
+from .predict import load_predict_model, predict, apredict
+from .predictbatcher import PredictionBatcher
 from .metrics import addQueryToMetrics
+from .intents import INTENT_MATCHER
 from .financial import *
 from .currency import *
-import re
+from .responsecache import responseCache, CACHE_FILE
+from .instrumentation import instrumented
+from .warmup import Warmer, hotSymbols
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
 
 class QueryHandler:
-    def __init__(self):
+    def __init__(self, responseCacheFile = CACHE_FILE, cpuWorkers = 2, maxPredictBatchSize = 64, maxPredictWait = 0.002,
+                 warmUpInterval = 15 * 60, warmUpSymbols = 20):
+        """ Constructor. Upstream responses are persisted to responseCacheFile, or only kept in memory if it is None.
+            The async API runs CPU-bound work (QR encoding) on at most cpuWorkers threads.
+            Concurrent predictions are batched, up to maxPredictBatchSize inputs or maxPredictWait seconds.
+            The data of the warmUpSymbols most requested symbols is refreshed in the background at startup and every
+            warmUpInterval seconds, unless warmUpInterval is None """
         self.predict_model = load_predict_model()
+        self.predictor = PredictionBatcher(self.predict_model, maxPredictBatchSize, maxPredictWait)
+        self.executor = ThreadPoolExecutor(max_workers=cpuWorkers, thread_name_prefix="QueryHandler")
         print("QueryHandler -- loaded prediction model")
+        if responseCacheFile != None:
+            responseCache.enablePersistence(responseCacheFile)
+            print("QueryHandler -- persisting upstream responses to '{}'".format(responseCacheFile))
+        self.warmer = None
+        if warmUpInterval != None:
+            self.warmer = Warmer(self.predictor, hotSymbols, warmUpInterval, warmUpSymbols)
+            self.warmer.start()
+            print("QueryHandler -- warming up the {} most requested symbols every {} seconds".format(warmUpSymbols, warmUpInterval))
         
+    @instrumented("intent.stockSymbol")
     def doStockSymbolStatement(self, companyName):
         symbol = company_name_to_stock(companyName)[0]
+        hotSymbols.record(symbol, companyName)
         text = companyName.capitalize() + "'s stock symbol is " + symbol
-        image = QRCode("https://www.google.com/search?q=" + symbol).toImage()
+        image = qrCodeCache.getPNG("https://www.google.com/search?q=" + symbol)
+        return text, image
+
+    @instrumented("intent.stockSymbol")
+    async def adoStockSymbolStatement(self, companyName):
+        symbol = (await acompany_name_to_stock(companyName))[0]
+        hotSymbols.record(symbol, companyName)
+        text = companyName.capitalize() + "'s stock symbol is " + symbol
+        image = await asyncio.get_running_loop().run_in_executor(self.executor, qrCodeCache.getPNG, "https://www.google.com/search?q=" + symbol)
         return text, image
 
 
+    @instrumented("intent.recommendation")
     def doRecommendationStatement(self, who, stockSymbol):
         who = who.lower()
         stockSymbol = stockSymbol.upper()
@@ -34,6 +67,7 @@ class QueryHandler:
         # TODO actually decide something
         return "I think " + who + " should invest in " + stockSymbol, None
 
+    @instrumented("intent.currency")
     def doCurrencyStatement(self, num, currency1, currency2):
         print(num, currency1, currency2)
         currency1 = currency1.upper()
@@ -42,20 +76,47 @@ class QueryHandler:
             data = convert(currency1,currency2)
         except:
             return "Sorry, I don't know how to convert that", None
+        return self._currencyAnswer(num, data)
+
+    @instrumented("intent.currency")
+    async def adoCurrencyStatement(self, num, currency1, currency2):
+        currency1 = currency1.upper()
+        currency2 = currency2.upper()
+        try:
+            data = await aconvert(currency1,currency2)
+        except:
+            return "Sorry, I don't know how to convert that", None
+        return self._currencyAnswer(num, data)
+
+    def _currencyAnswer(self, num, data):
         text = num + " " + getCurrencyData(data,2) + " converted is " + str(round(int(num) * float(getCurrencyData(data,5)),4)) + " " + getCurrencyData(data,4)
         return text, None
 
 
+    @instrumented("intent.prediction")
     def doPredictionStatement(self, symbol):
         pred = None
         try:
-            pred = predict(self.predict_model, symbol.lower())
+            pred = predict(self.predictor, symbol.lower())
+            hotSymbols.record(symbol)
+        except Exception as e:
+            print(e)
+            return "Sorry, I can't predict for that company", None
+        return "I predict the stocks for next week are worth " + str(pred), None
+
+    @instrumented("intent.prediction")
+    async def adoPredictionStatement(self, symbol):
+        pred = None
+        try:
+            pred = await apredict(self.predictor, symbol.lower(), self.executor)
+            hotSymbols.record(symbol)
         except Exception as e:
             print(e)
             return "Sorry, I can't predict for that company", None
         return "I predict the stocks for next week are worth " + str(pred), None
     
     
+    @instrumented("intent.unknown")
     def doUnknownResponse(self):
         responses = [
             "I'm sorry, I don't understand your question",
@@ -70,55 +131,38 @@ class QueryHandler:
         return choice(responses), None
 
 
+    @instrumented("query")
     def queryChatbot(self, statement):
-        """ Ask the bot a question [statement]. Returns a response string and a pillow image as a tuple """
+        """ Ask the bot a question [statement]. Returns a response string and PNG image bytes (or None) as a tuple """
         addQueryToMetrics()
         
-        # Regular expression parts. These are concatenated to generate the final expression
-        # Most of these expressions are big due to matching broken english or unreasonable input
-        optionalDateRegex = r'(?:\s+in\s+(?:[0-9]+|[0-9]+\s*(?:st|nd|rd|th)?(?:\s+|\s*\/\s*)(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may?|june?|july?|aug(?:ust)?|sep(?:tember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?|0*[1-9]|0*1[0-2])(?:(?:\s+|\s*\/\s*)[0-9]+)?))?'
-        nameRegex = r'\s+((?!\s).+?)'
-        questionEndRegex = r'[?!.\s]*$'
-        stockSymbolRegex = r'(?:\s+stock)?\s+(?:symbol|code)'
-        apostropheSRegex = r'(?:\'|\'?s)?'
-        whatRegex = r'^wh?at(?:\'?s|\s+is)'
-        prepositionRegex = r'\s+(?:for|of)'
-        optionalTheRegex = r'(?:\s*the)?'
-        recommendRegex = r'^(?:should|(?:do\s+)?(?:you\s+)?(?:recommend|think))'
-        optionalNameRegex = r'(?:' + nameRegex + r')?'
-        investRegex = r'\s+(?:(?:to\s+)?invests?|(?:buys?|gets?)\s+(?:stocks?|shares?))\s+(?:in|for)'
-        convertRegex = r'\s(?:converted to|in)'
-        numRegex = r'\s([0-9]*)'
-        
-        # Try to match the type of question
-        # Stock symbol (first variant)
-        # (What's|What is) [the] [stock] symbol|code for|of ... [in (XX(/(XX|month)/XXXX))][?!.]
-        matches = re.match(whatRegex + optionalTheRegex + stockSymbolRegex + prepositionRegex + nameRegex + optionalDateRegex + questionEndRegex, statement, re.IGNORECASE)
-        if matches != None:
-            return self.doStockSymbolStatement(matches.group(1))
+        # Match the type of question in a single pass. Intents are defined in intents.py
+        intent, groups = INTENT_MATCHER.match(statement)
+        if intent == "stockSymbol":
+            return self.doStockSymbolStatement(groups[0])
+        if intent == "recommendation":
+            return self.doRecommendationStatement(groups[0], groups[1])
+        if intent == "prediction":
+            return self.doPredictionStatement(groups[0])
+        if intent == "currency":
+            return self.doCurrencyStatement(groups[0], groups[1], groups[2])
         
-        # Stock symbol (second variant)
-        # (What's|What is) ...['s] [stock] symbol|code [in (XX(/(XX|month)/XXXX))][?!.]
-        matches = re.match(whatRegex + nameRegex + apostropheSRegex + stockSymbolRegex + optionalDateRegex + questionEndRegex, statement, re.IGNORECASE)
-        if matches != None:
-            return self.doStockSymbolStatement(matches.group(1))
-        
-        # Recommendation
-        # (Should|[Do ][you ]recommend) [...] (to invest|invests|buys (stocks|shares)) in|for ...[?!.]
-        matches = re.match(recommendRegex + optionalNameRegex + investRegex + nameRegex + questionEndRegex, statement, re.IGNORECASE)
-        if matches != None:
-            return self.doRecommendationStatement(matches.group(1), matches.group(2))
-        
-        # Stock prediction
-        # what do you predict for this company ...
-        matches = re.match('^\s*what\s+(?:are\s+the\s+stock\s+predictions\s+for\s+this|do\s+you\s+predict\s+for\s+this)\s+company\s+([a-z]+?)\s*$', statement, re.IGNORECASE)
-        if matches != None:
-            return self.doPredictionStatement(matches.group(1))
+        return self.doUnknownResponse()
+
+
+    @instrumented("query")
+    async def aqueryChatbot(self, statement):
+        """ Same as queryChatbot, but upstream requests don't block the event loop and CPU-bound work runs in the executor """
+        addQueryToMetrics()
         
-        # Currency Conversion
-        # (What's|What is) ...['s] [value] in ...?
-        matches = re.match(whatRegex + numRegex + nameRegex + apostropheSRegex + convertRegex + nameRegex + questionEndRegex, statement, re.IGNORECASE)
-        if matches != None:
-            return self.doCurrencyStatement(matches.group(1),matches.group(2),matches.group(3))
+        intent, groups = INTENT_MATCHER.match(statement)
+        if intent == "stockSymbol":
+            return await self.adoStockSymbolStatement(groups[0])
+        if intent == "recommendation":
+            return self.doRecommendationStatement(groups[0], groups[1])
+        if intent == "prediction":
+            return await self.adoPredictionStatement(groups[0])
+        if intent == "currency":
+            return await self.adoCurrencyStatement(groups[0], groups[1], groups[2])
         
         return self.doUnknownResponse()
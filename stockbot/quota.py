@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from threading import Event, Lock
+from itertools import count
+from time import monotonic
+import heapq
+import asyncio
+import os
+
+
+# Call priorities. Lower goes first, so people waiting on an answer aren't stuck behind background refreshes
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Alpha Vantage's free tier limits per API key
+ALPHA_VANTAGE_CALLS_PER_MINUTE = 5
+ALPHA_VANTAGE_CALLS_PER_DAY = 500
+# Fraction of each key's quota which background calls leave for interactive ones
+BACKGROUND_RESERVE = 0.4
+# Comma separated API keys to rotate through. The original key is used if none are configured
+ALPHA_VANTAGE_KEYS_VARIABLE = "ALPHAVANTAGE_API_KEYS"
+DEFAULT_ALPHA_VANTAGE_KEY = "VUUG2MG0ELJZOOGF"
+
+
+class QuotaExceededError(Exception):
+    """ Raised instead of calling upstream when no API key will have quota left before the caller's deadline.
+        retryAfter is a hint, in seconds, of when a call could succeed """
+    def __init__(self, message, retryAfter = None):
+        super().__init__(message)
+        self.retryAfter = retryAfter
+
+
+class TokenBucket:
+    """ A token bucket holding up to capacity tokens, refilled continuously at rate tokens per second. Not thread-safe """
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self._updated = monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delayUntil(self, tokens):
+        """ Seconds until a number of tokens will have refilled, as of the last refill. This can be more than the
+            capacity, for calls which take tokens one at a time as they refill """
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def drain(self):
+        """ Empty the bucket, e.g. because upstream says the quota is used up """
+        self.tokens = 0
+
+
+class _Waiter:
+    """ A caller waiting for a key, from a thread or an event loop """
+    def __init__(self, priority, loop = None):
+        self.priority = priority
+        self.key = None
+        self.cancelled = False
+        self._loop = loop
+        self._event = Event() if loop == None else None
+        self._future = loop.create_future() if loop != None else None
+
+    def grant(self, key):
+        self.key = key
+        if self._loop == None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(_resolveFuture, self._future)
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+
+    async def waitAsync(self, timeout):
+        await asyncio.wait((self._future,), timeout=timeout)
+
+
+def _resolveFuture(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class QuotaScheduler:
+    """ Hands out API keys within each key's per-minute and per-day call limits, tracked with token buckets.
+        Calls beyond the quota wait in a bounded queue, interactive ones before background ones, and fail straight
+        away with QuotaExceededError if the queue is full or their turn can't come before their deadline.
+        Background calls only take a token while the key keeps backgroundReserve of its quota for interactive calls """
+    def __init__(self, keys, perMinute, perDay, maxWaiters = 64, maxWait = 10, keyParameter = "apikey", throttleFields = ("Note", "Information"),
+                 backgroundReserve = BACKGROUND_RESERVE):
+        """ Constructor. Calls wait at most maxWait seconds unless told otherwise. keyParameter is the URL query parameter
+            keys are sent in, and a JSON response made of only one of throttleFields means upstream refused the call for quota.
+            backgroundReserve is a fraction (0 to 1) of each bucket's capacity """
+        if len(keys) == 0:
+            raise ValueError("At least one API key is needed")
+        self.keys = list(keys)
+        self.maxWaiters = maxWaiters
+        self.maxWait = maxWait
+        self.keyParameter = keyParameter
+        self.throttleFields = throttleFields
+        self.backgroundReserve = backgroundReserve
+        self.granted = 0
+        self.rejected = 0
+        self.timedOut = 0
+        self.throttled = 0
+        # Key to its (per-minute, per-day) buckets
+        self._buckets = {key: (TokenBucket(perMinute, perMinute / 60), TokenBucket(perDay, perDay / (24 * 60 * 60))) for key in self.keys}
+        # Heap of (priority, sequence, waiter); cancelled waiters are skipped when they reach the top
+        self._waiters = []
+        self._waiting = 0
+        self._sequence = count()
+        self._nextKey = 0
+        self._lock = Lock()
+
+    def share(self, parts):
+        """ Keep 1/parts of each key's quota, for when parts processes call upstream with the same keys. Call once, before use.
+            Buckets still hold enough for a background call, so small shares refill more slowly instead of never allowing one """
+        minimum = 1 / (1 - self.backgroundReserve) if self.backgroundReserve < 1 else 1
+        with self._lock:
+            for buckets in self._buckets.values():
+                for bucket in buckets:
+                    bucket.rate /= parts
+                    bucket.capacity = min(bucket.capacity, max(bucket.capacity / parts, minimum))
+                    bucket.tokens = min(bucket.tokens, bucket.capacity)
+
+    def _refill(self, now):
+        for buckets in self._buckets.values():
+            for bucket in buckets:
+                bucket.refill(now)
+
+    def _reserve(self, priority, bucket):
+        """ Tokens of a bucket a call of some priority must leave """
+        return bucket.capacity * self.backgroundReserve if priority >= BACKGROUND else 0
+
+    def _takeToken(self, priority):
+        """ Take a token from the next key in rotation which has one for a priority. Returns the key, or None """
+        for i in range(len(self.keys)):
+            key = self.keys[(self._nextKey + i) % len(self.keys)]
+            minute, day = self._buckets[key]
+            if minute.tokens >= 1 + self._reserve(priority, minute) and day.tokens >= 1 + self._reserve(priority, day):
+                minute.tokens -= 1
+                day.tokens -= 1
+                self._nextKey = (self._nextKey + i + 1) % len(self.keys)
+                self.granted += 1
+                return key
+        return None
+
+    def _delayUntilTokens(self, tokens, priority):
+        """ Seconds until a number of tokens will have been available across all keys for a priority, ignoring calls that come later.
+            Raises ValueError if no key's buckets can ever hold a token on top of the priority's reserve """
+        times = []
+        for minute, day in self._buckets.values():
+            minuteReserve = self._reserve(priority, minute)
+            dayReserve = self._reserve(priority, day)
+            if 1 + minuteReserve > minute.capacity or 1 + dayReserve > day.capacity:
+                continue
+            # The nth call takes its token once n tokens refilled on top of the reserve, as the calls before took theirs
+            times += [max(minute.delayUntil(n + minuteReserve), day.delayUntil(n + dayReserve)) for n in range(1, tokens + 1)]
+        if len(times) == 0:
+            raise ValueError("Calls of priority {} can never get a key: no key's quota holds a call on top of the reserve".format(priority))
+        times.sort()
+        return times[tokens - 1]
+
+    def _dispatch(self):
+        """ Give tokens to waiters in priority order while there are any """
+        while len(self._waiters) != 0:
+            waiter = self._waiters[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            key = self._takeToken(waiter.priority)
+            if key == None:
+                return
+            heapq.heappop(self._waiters)
+            self._waiting -= 1
+            waiter.grant(key)
+
+    def _enqueue(self, priority, deadline, loop):
+        """ Take a key straight away if no one is ahead, otherwise queue a waiter. Returns (key, waiter), one of them None.
+            Raises QuotaExceededError if the caller can't be served before its deadline """
+        now = monotonic()
+        with self._lock:
+            self._refill(now)
+            self._dispatch()
+            ahead = sum(1 for entry in self._waiters if not entry[2].cancelled and entry[0] <= priority)
+            if ahead == 0:
+                key = self._takeToken(priority)
+                if key != None:
+                    return key, None
+
+            delay = self._delayUntilTokens(ahead + 1, priority)
+            if self._waiting >= self.maxWaiters:
+                self.rejected += 1
+                raise QuotaExceededError("Too many calls waiting for quota", delay)
+            if now + delay > deadline:
+                self.rejected += 1
+                raise QuotaExceededError("Over quota, next call possible in {:.0f} seconds".format(delay), delay)
+
+            waiter = _Waiter(priority, loop)
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+            self._waiting += 1
+            return None, waiter
+
+    def _poll(self, waiter, deadline):
+        """ Hand out tokens which refilled since the last poll. Returns how long the waiter should sleep next, or 0 if it got a key.
+            Raises QuotaExceededError if its deadline passed """
+        now = monotonic()
+        with self._lock:
+            self._refill(now)
+            self._dispatch()
+            if waiter.key != None:
+                return 0
+            if now >= deadline:
+                self._cancel(waiter)
+                self.timedOut += 1
+                raise QuotaExceededError("Timed out waiting for quota", self._delayUntilTokens(1, waiter.priority))
+            # Sleep until the next token, when some waiter polls and gives it to whoever is first in line
+            return max(0.01, min(deadline - now, self._delayUntilTokens(1, INTERACTIVE)))
+
+    def _cancel(self, waiter):
+        """ Take a waiter out of the queue, unless it already got a key. Call with the lock held """
+        if waiter.key == None and not waiter.cancelled:
+            waiter.cancelled = True
+            self._waiting -= 1
+
+    def acquire(self, priority = INTERACTIVE, timeout = None):
+        """ Get an API key to make one call with, waiting at most timeout seconds (maxWait if None) """
+        deadline = monotonic() + (self.maxWait if timeout == None else timeout)
+        key, waiter = self._enqueue(priority, deadline, None)
+        while key == None:
+            delay = self._poll(waiter, deadline)
+            if delay == 0:
+                key = waiter.key
+            else:
+                waiter.wait(delay)
+        return key
+
+    async def aacquire(self, priority = INTERACTIVE, timeout = None):
+        """ Same as acquire, but waiting doesn't block the event loop """
+        deadline = monotonic() + (self.maxWait if timeout == None else timeout)
+        key, waiter = self._enqueue(priority, deadline, asyncio.get_running_loop())
+        while key == None:
+            delay = self._poll(waiter, deadline)
+            if delay == 0:
+                key = waiter.key
+            else:
+                try:
+                    await waiter.waitAsync(delay)
+                except asyncio.CancelledError:
+                    with self._lock:
+                        self._cancel(waiter)
+                    raise
+        return key
+
+    def signURL(self, url, key):
+        """ Put an API key in a URL, replacing any key already in it """
+        parts = urlsplit(url)
+        params = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name.lower() != self.keyParameter]
+        params.append((self.keyParameter, key))
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(params), parts.fragment))
+
+    def checkResponse(self, key, data):
+        """ Raise QuotaExceededError if a JSON response is upstream refusing a call made with a key for quota reasons.
+            The key isn't handed out again until its per-minute bucket refills """
+        if isinstance(data, dict) and len(data) == 1 and next(iter(data)) in self.throttleFields:
+            with self._lock:
+                self._buckets[key][0].drain()
+                self.throttled += 1
+            raise QuotaExceededError("Upstream refused the call: " + str(next(iter(data.values()))), 60 / self._buckets[key][0].capacity)
+
+    def getStats(self):
+        """ Get counters and the tokens left per key (keys are numbered, not shown) as a dictionary """
+        with self._lock:
+            self._refill(monotonic())
+            return {
+                "granted": self.granted,
+                "rejected": self.rejected,
+                "timedOut": self.timedOut,
+                "throttled": self.throttled,
+                "waiting": self._waiting,
+                "keys": [{"minuteTokens": round(minute.tokens, 2), "dayTokens": round(day.tokens, 2)} for minute, day in self._buckets.values()]
+            }
+
+
+def _alphaVantageKeys():
+    keys = [key.strip() for key in os.environ.get(ALPHA_VANTAGE_KEYS_VARIABLE, "").split(",") if key.strip() != ""]
+    return keys if len(keys) != 0 else [DEFAULT_ALPHA_VANTAGE_KEY]
+
+
+alphaVantageQuota = QuotaScheduler(_alphaVantageKeys(), ALPHA_VANTAGE_CALLS_PER_MINUTE, ALPHA_VANTAGE_CALLS_PER_DAY)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from datetime import datetime, timedelta, timezone
+from os.path import dirname, realpath
+from collections import OrderedDict
+from threading import Event, Lock
+from time import time
+from .httpclient import httpClient, asyncHTTPClient
+from .instrumentation import instrumentation
+from .quota import INTERACTIVE
+import sqlite3
+import asyncio
+import json
+import os
+
+
+CACHE_FILE = dirname(realpath(__file__)) + "/cache/responses.sqlite"
+
+# Time to live, in seconds, for each kind of upstream response
+SYMBOL_SEARCH_TTL = 24 * 60 * 60
+FX_RATE_TTL = 60
+MARKET_STATUS_TTL = 60
+MARKET_MOVERS_TTL = 60
+REALTIME_PRICE_TTL = 15
+COMPANY_PROFILE_TTL = 60 * 60
+HISTORICAL_PRICES_TTL = 60 * 60
+FINANCIAL_STATEMENTS_TTL = 24 * 60 * 60
+
+
+def secondsUntilWeeklyClose():
+    """ Seconds until weekly bars next change. Weekly bars close on Friday; 22:00 UTC is after the US close all year round """
+    now = datetime.now(timezone.utc)
+    close = (now + timedelta(days=(4 - now.weekday()) % 7)).replace(hour=22, minute=0, second=0, microsecond=0)
+    if close <= now:
+        close += timedelta(days=7)
+    return (close - now).total_seconds()
+
+
+def normaliseURL(url):
+    """ Turn an upstream URL into a cache key. The API key is dropped and query parameters are sorted and lowercased """
+    parts = urlsplit(url)
+    params = sorted((k.lower(), v.lower()) for k, v in parse_qsl(parts.query) if k.lower() != "apikey")
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(params), ""))
+
+
+class _Flight:
+    """ An upstream fetch in progress, which duplicate callers wait on from threads or event loops """
+    def __init__(self):
+        self.value = None
+        self.error = None
+        self._done = Event()
+        self._asyncWaiters = []
+        self._lock = Lock()
+
+    def finish(self):
+        """ Wake every waiting caller """
+        with self._lock:
+            self._done.set()
+            waiters = self._asyncWaiters
+            self._asyncWaiters = []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolveFuture, future)
+
+    def result(self):
+        """ Get the shared value, or raise the shared error """
+        if self.error != None:
+            raise self.error
+        return self.value
+
+    def wait(self):
+        """ Block until the fetch finishes and get its result """
+        self._done.wait()
+        return self.result()
+
+    async def waitAsync(self):
+        """ Wait, without blocking the event loop, until the fetch finishes and get its result """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if not self._done.is_set():
+                self._asyncWaiters.append((loop, future))
+            else:
+                future.set_result(None)
+        await future
+        return self.result()
+
+
+def _resolveFuture(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ResponseCache:
+    """ A thread-safe TTL cache for upstream responses, with optional SQLite persistence.
+        Concurrent requests for the same missing key share a single fetch """
+    def __init__(self, maxEntries = 1024):
+        """ Constructor. Keeps at most maxEntries responses in memory """
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._inFlight = dict()
+        self._lock = Lock()
+        self._db = None
+        self._dbLock = Lock()
+
+    def enablePersistence(self, path = CACHE_FILE):
+        """ Back the cache with an SQLite file so responses survive restarts and are shared between processes """
+        os.makedirs(dirname(path), exist_ok=True)
+        db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT NOT NULL)")
+        db.commit()
+        with self._dbLock:
+            self._db = db
+
+    def _loadPersisted(self, key, now):
+        """ Get an unexpired (expires, value) pair from disk, or None. The disk is best-effort, so errors count as a miss """
+        with self._dbLock:
+            if self._db == None:
+                return None
+            try:
+                row = self._db.execute("SELECT expires, value FROM responses WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                print("Exception while reading the response cache file: ", e)
+                return None
+        if row == None or row[0] <= now:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _persist(self, key, expires, value):
+        """ Write a response to disk, if persistence is enabled. Errors, e.g. another process holding the file locked, are
+            logged, as the response is still cached in memory """
+        with self._dbLock:
+            if self._db == None:
+                return
+            try:
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, expires, json.dumps(value)))
+                self._db.execute("DELETE FROM responses WHERE expires <= ?", (time(),))
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db.rollback()
+                print("Exception while writing the response cache file: ", e)
+
+    def _store(self, key, expires, value):
+        """ Put a response in memory, evicting the least recently used ones past the limit """
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+    def _begin(self, key):
+        """ Look a key up. Returns (True, value) on a hit, otherwise (isLeader, flight) where the leader must do the fetch """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry != None and entry[0] > time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+
+            flight = self._inFlight.get(key)
+            if flight != None:
+                self.coalesced += 1
+                return False, flight
+
+            flight = _Flight()
+            self._inFlight[key] = flight
+            return None, flight
+
+    def _loadForLeader(self, key):
+        """ Try the on-disk cache for a key being fetched. Returns (found, value) and keeps the value in memory if found """
+        persisted = self._loadPersisted(key, time())
+        with self._lock:
+            if persisted == None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        self._store(key, persisted[0], persisted[1])
+        return True, persisted[1]
+
+    def _finishLeader(self, key, flight, value, error, ttl):
+        """ Keep a freshly fetched value in memory (if ttl isn't None) and wake the callers sharing it. Returns when the
+            value expires, for the caller to persist it outside the flight, or None if it shouldn't be persisted """
+        flight.value = value
+        flight.error = error
+        expires = None
+        try:
+            if error == None and ttl != None:
+                expires = time() + (ttl() if callable(ttl) else ttl)
+                self._store(key, expires, value)
+        except Exception as e:
+            # The fetch itself succeeded, so its callers still get the value
+            expires = None
+            print("Exception while caching upstream response: ", e)
+        finally:
+            with self._lock:
+                del self._inFlight[key]
+            flight.finish()
+        return expires
+
+    def get(self, key, ttl, fetch):
+        """ Get the response for a key, calling fetch() on a miss. ttl is in seconds, or a function returning seconds.
+            Returned values are shared between callers and must be treated as read-only """
+        state, result = self._begin(key)
+        if state == True:
+            return result
+        # Someone else is already fetching this key, so share their result
+        if state == False:
+            return result.wait()
+
+        value = error = None
+        found = True
+        try:
+            found, value = self._loadForLeader(key)
+            if not found:
+                value = fetch()
+            return value
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            expires = self._finishLeader(key, result, value, error, None if found else ttl)
+            if expires != None:
+                self._persist(key, expires, value)
+
+    async def aget(self, key, ttl, fetch):
+        """ Same as get, but fetch is a coroutine function and waiting doesn't block the event loop.
+            Threads and coroutines asking for the same key share a single fetch """
+        state, result = self._begin(key)
+        if state == True:
+            return result
+        if state == False:
+            return await result.waitAsync()
+
+        # SQLite calls block, so they run in the loop's default executor
+        loop = asyncio.get_running_loop()
+        value = error = None
+        found = True
+        try:
+            found, value = await loop.run_in_executor(None, self._loadForLeader, key) if self._db != None else self._loadForLeader(key)
+            if not found:
+                value = await fetch()
+            return value
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            expires = self._finishLeader(key, result, value, error, None if found else ttl)
+            if expires != None and self._db != None:
+                await loop.run_in_executor(None, self._persist, key, expires, value)
+
+    def getStats(self):
+        """ Get hit/miss/coalesced counters and occupancy as a dictionary """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "size": len(self._entries),
+                "maxEntries": self.maxEntries
+            }
+
+    def clear(self):
+        """ Drop all cached responses, including persisted ones, and reset the counters """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.coalesced = 0
+        with self._dbLock:
+            if self._db != None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+
+responseCache = ResponseCache()
+instrumentation.registerCache("upstream", responseCache.getStats)
+
+
+def cachedJSON(url, ttl, requiredKey = None, quota = None, priority = INTERACTIVE):
+    """ Fetch and decode a JSON response through the shared cache. Responses missing requiredKey (e.g. rate limit notes) raise KeyError and aren't cached.
+        If a QuotaScheduler is given, only calls which actually go upstream take an API key from it, with the given priority """
+    def fetch():
+        if quota == None:
+            data = httpClient.getJSON(url)
+        else:
+            key = quota.acquire(priority)
+            data = httpClient.getJSON(quota.signURL(url, key))
+            quota.checkResponse(key, data)
+        if requiredKey != None and requiredKey not in data:
+            raise KeyError(requiredKey)
+        return data
+
+    return responseCache.get(normaliseURL(url), ttl, fetch)
+
+
+async def acachedJSON(url, ttl, requiredKey = None, quota = None, priority = INTERACTIVE):
+    """ Same as cachedJSON, but the upstream request and waiting for quota don't block the event loop """
+    async def fetch():
+        if quota == None:
+            data = await asyncHTTPClient.getJSON(url)
+        else:
+            key = await quota.aacquire(priority)
+            data = await asyncHTTPClient.getJSON(quota.signURL(url, key))
+            quota.checkResponse(key, data)
+        if requiredKey != None and requiredKey not in data:
+            raise KeyError(requiredKey)
+        return data
+
+    return await responseCache.aget(normaliseURL(url), ttl, fetch)
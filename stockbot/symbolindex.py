@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+from os.path import dirname, realpath, getmtime
+from collections import Counter
+from difflib import SequenceMatcher
+from threading import Thread, Lock
+from bisect import bisect_left, insort
+from time import time
+from .httpclient import httpClient
+from .instrumentation import instrumentation
+from .quota import alphaVantageQuota, BACKGROUND
+import csv
+import io
+import os
+import re
+
+
+# Bundled listing, shipped with the package. A fresher copy is downloaded into the cache folder when it gets old
+LISTING_FILE = dirname(realpath(__file__)) + "/data/listing.csv"
+DOWNLOADED_LISTING_FILE = dirname(realpath(__file__)) + "/cache/listing.csv"
+# Names and symbols learned from symbol searches that missed the index
+LEARNED_FILE = dirname(realpath(__file__)) + "/cache/learnedSymbols.csv"
+LISTING_URL = "https://www.alphavantage.co/query?function=LISTING_STATUS"
+LISTING_REFRESH_INTERVAL = 7 * 24 * 60 * 60
+
+# Listings on these exchanges come first when several symbols share a name
+PREFERRED_EXCHANGES = ("NASDAQ", "NYSE", "NYSE ARCA", "NYSE MKT", "BATS", "United States")
+MAX_RESULTS = 10
+FUZZY_CANDIDATES = 20
+
+# Words which don't help tell companies apart, dropped from the end of names
+_NAME_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "companies", "plc", "ltd", "limited",
+    "llc", "lp", "sa", "ag", "nv", "se", "group", "holding", "holdings", "com", "and"
+}
+_CLASS_RE = re.compile(r"\bclass [a-z]\b")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normaliseName(name):
+    """ Turn a company name or query into an index key: lowercase words without punctuation or corporate suffixes """
+    name = _CLASS_RE.sub(" ", name.lower().replace("&", " and ").replace("'", ""))
+    words = _NON_ALNUM_RE.sub(" ", name).split()
+    if len(words) > 1 and words[0] == "the":
+        words = words[1:]
+    end = len(words)
+    while end > 1 and words[end - 1] in _NAME_SUFFIXES:
+        end -= 1
+    return " ".join(words[:end])
+
+
+def _trigrams(name):
+    padded = " " + name + " "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _IndexData:
+    """ Lookup tables for one generation of the index. Every distinct normalised name gets an id """
+    def __init__(self):
+        self.names = []
+        self.nameIds = dict()
+        self.sortedNames = []
+        # Per name id, a list of (exchange rank, symbol) pairs
+        self.listings = []
+        # Uppercase symbol to the id of the first name it was listed under
+        self.symbols = dict()
+        self.byToken = dict()
+        self.byTrigram = dict()
+
+    def add(self, symbol, name, exchange):
+        """ Index a symbol under a name. Returns False if it was already there """
+        key = normaliseName(name)
+        if key == "":
+            return False
+        nameId = self.nameIds.get(key)
+        if nameId == None:
+            nameId = len(self.names)
+            self.names.append(key)
+            self.nameIds[key] = nameId
+            self.listings.append([])
+            insort(self.sortedNames, key)
+            for token in key.split():
+                self.byToken.setdefault(token, set()).add(nameId)
+            for trigram in _trigrams(key):
+                self.byTrigram.setdefault(trigram, []).append(nameId)
+
+        listing = (_exchangeRank(exchange), symbol)
+        listings = self.listings[nameId]
+        if listing in listings:
+            return False
+        insort(listings, listing)
+        self.symbols.setdefault(symbol.upper(), nameId)
+        return True
+
+
+def _exchangeRank(exchange):
+    try:
+        return PREFERRED_EXCHANGES.index(exchange)
+    except ValueError:
+        return len(PREFERRED_EXCHANGES)
+
+
+class SymbolIndex:
+    """ A local index of listed companies which resolves company names to stock symbols without a network round trip.
+        Tries an exact name, an exact symbol, whole words, a name prefix and finally a fuzzy match, in that order """
+    def __init__(self, listingFiles = (DOWNLOADED_LISTING_FILE, LISTING_FILE), learnedFile = LEARNED_FILE, autoRefresh = True, fuzzyCutoff = 0.8):
+        """ Constructor. Listing files are CSV files with symbol, name and exchange columns (Alpha Vantage's LISTING_STATUS format).
+            The first listing file is re-downloaded in the background when it's missing or older than LISTING_REFRESH_INTERVAL
+            if autoRefresh is True """
+        self.listingFiles = listingFiles
+        self.learnedFile = learnedFile
+        self.autoRefresh = autoRefresh
+        self.fuzzyCutoff = fuzzyCutoff
+        self.hits = 0
+        self.misses = 0
+        self._data = None
+        self._lock = Lock()
+        self._refreshThread = None
+
+    def _ensureLoaded(self):
+        if self._data == None:
+            self.load()
+
+    def load(self):
+        """ (Re)build the index from the listing files and learned symbols """
+        data = _IndexData()
+        for path in self.listingFiles + (self.learnedFile,):
+            try:
+                with open(path, "r", newline="", encoding="utf-8") as fd:
+                    _addRows(data, csv.DictReader(fd))
+            except FileNotFoundError:
+                pass
+
+        with self._lock:
+            self._data = data
+
+        if self.autoRefresh:
+            self._refreshIfStale()
+
+    def _refreshIfStale(self):
+        try:
+            stale = time() - getmtime(self.listingFiles[0]) > LISTING_REFRESH_INTERVAL
+        except OSError:
+            stale = True
+        if stale and (self._refreshThread == None or not self._refreshThread.is_alive()):
+            self._refreshThread = Thread(target=self._backgroundRefresh, name="SymbolIndexRefresh", daemon=True)
+            self._refreshThread.start()
+
+    def _backgroundRefresh(self):
+        try:
+            self.refreshListing()
+        except Exception as e:
+            print("Exception while refreshing symbol listing: ", e)
+
+    def refreshListing(self):
+        """ Download the full listing into the first listing file and rebuild the index """
+        # A background job, so it gives way to interactive calls and can wait for a minute's quota
+        key = alphaVantageQuota.acquire(BACKGROUND, 60)
+        body = httpClient.get(alphaVantageQuota.signURL(LISTING_URL, key))
+        rows = list(csv.DictReader(io.StringIO(body.decode("utf-8"))))
+        if len(rows) == 0 or "symbol" not in rows[0]:
+            raise ValueError("Unexpected listing response: " + body[:200].decode("utf-8", "replace"))
+
+        path = self.listingFiles[0]
+        os.makedirs(dirname(path), exist_ok=True)
+        tempPath = "{}.{}.tmp".format(path, os.getpid())
+        with open(tempPath, "wb") as fd:
+            fd.write(body)
+        os.replace(tempPath, path)
+
+        autoRefresh = self.autoRefresh
+        self.autoRefresh = False
+        try:
+            self.load()
+        finally:
+            self.autoRefresh = autoRefresh
+
+    def lookup(self, query):
+        """ Get the symbols matching a company name, best first. Returns an empty list if nothing matches """
+        self._ensureLoaded()
+        key = normaliseName(query)
+        with self._lock:
+            data = self._data
+            nameIds = _lookupNameIds(data, key, query, self.fuzzyCutoff)
+            symbols = []
+            for nameId in nameIds:
+                for _, symbol in data.listings[nameId]:
+                    if symbol not in symbols:
+                        symbols.append(symbol)
+                if len(symbols) >= MAX_RESULTS:
+                    break
+            if len(symbols) != 0:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return symbols[:MAX_RESULTS]
+
+    def learn(self, query, matches):
+        """ Remember the result of a remote symbol search. matches is a list of (symbol, name, exchange) tuples, best first.
+            The query itself is stored as another name of the best match so the same question is answered locally next time """
+        if len(matches) == 0:
+            return
+        rows = list(matches)
+        rows.append((matches[0][0], query, matches[0][2]))
+
+        self._ensureLoaded()
+        with self._lock:
+            newRows = [row for row in rows if self._data.add(*row)]
+            if len(newRows) == 0:
+                return
+            try:
+                os.makedirs(dirname(self.learnedFile), exist_ok=True)
+                writeHeader = not os.path.exists(self.learnedFile)
+                with open(self.learnedFile, "a", newline="", encoding="utf-8") as fd:
+                    writer = csv.writer(fd)
+                    if writeHeader:
+                        writer.writerow(("symbol", "name", "exchange"))
+                    writer.writerows(newRows)
+            except OSError as e:
+                print("Exception while saving learned symbols: ", e)
+
+    def getStats(self):
+        """ Get hit/miss counters and index size as a dictionary. Doesn't load the index, so sizes are 0 until it is used """
+        with self._lock:
+            data = self._data
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "names": len(data.names) if data != None else 0,
+                "symbols": len(data.symbols) if data != None else 0
+            }
+
+
+def _addRows(data, rows):
+    for row in rows:
+        symbol = (row.get("symbol") or "").strip()
+        name = (row.get("name") or "").strip()
+        # Alpha Vantage's listing includes delisted symbols when asked to; they can't be queried
+        if symbol == "" or name == "" or row.get("status", "Active") != "Active":
+            continue
+        data.add(symbol, name, (row.get("exchange") or "").strip())
+
+
+def _lookupNameIds(data, key, query, fuzzyCutoff):
+    """ Get the ids of names matching a normalised query, best first """
+    if key == "":
+        return []
+
+    nameId = data.nameIds.get(key)
+    if nameId != None:
+        return [nameId]
+
+    nameId = data.symbols.get(query.strip().upper())
+    if nameId != None:
+        return [nameId]
+
+    # Names containing every word of the query
+    tokens = key.split()
+    nameIds = data.byToken.get(tokens[0])
+    if nameIds != None:
+        for token in tokens[1:]:
+            nameIds = nameIds & data.byToken.get(token, set())
+        if len(nameIds) != 0:
+            return sorted(nameIds, key=lambda i: len(data.names[i]))
+
+    # Names starting with the query
+    nameIds = []
+    start = bisect_left(data.sortedNames, key)
+    for name in data.sortedNames[start:start + MAX_RESULTS]:
+        if not name.startswith(key):
+            break
+        nameIds.append(data.nameIds[name])
+    if len(nameIds) != 0:
+        return sorted(nameIds, key=lambda i: len(data.names[i]))
+
+    # Misspellings. Names sharing the most trigrams with the query are scored properly
+    overlaps = Counter()
+    for trigram in _trigrams(key):
+        overlaps.update(data.byTrigram.get(trigram, ()))
+    scored = []
+    for nameId, _ in overlaps.most_common(FUZZY_CANDIDATES):
+        ratio = SequenceMatcher(None, key, data.names[nameId]).ratio()
+        if ratio >= fuzzyCutoff:
+            scored.append((-ratio, nameId))
+    scored.sort()
+    return [nameId for _, nameId in scored]
+
+
+symbolIndex = SymbolIndex()
+instrumentation.registerCache("symbols", symbolIndex.getStats)
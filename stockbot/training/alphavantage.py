@@ -1,15 +1,19 @@
 #!/usr/bin/env python3
-import urllib.request, json
+from os.path import dirname, realpath
+import sys
+
+# This script isn't part of the stockbot package, so make the package importable to share its HTTP client
+sys.path.insert(0, dirname(dirname(dirname(realpath(__file__)))))
+from stockbot.httpclient import httpClient
 
 #Makes use of the alphavantage api to return data about a specific stock
 
 def jsonReturn(keyword):
     keyword = spaceCheck(keyword)
     url = "https://www.alphavantage.co/query?function=SYMBOL_SEARCH&keywords=" + keyword + "&apikey=VUUG2MG0ELJZOOGF"
-    with urllib.request.urlopen(url) as url:
-        data = json.loads(url.read().decode())
-        results = data["bestMatches"]
-        return jsonStrip(results)
+    data = httpClient.getJSON(url)
+    results = data["bestMatches"]
+    return jsonStrip(results)
 
 def jsonStrip(results):
     acronyms = []
@@ -25,11 +29,10 @@ def spaceCheck(keyword):
 def time_series_weekly(stock):
     """Returns weekly time series for a stock"""
     url = "https://www.alphavantage.co/query?function=TIME_SERIES_WEEKLY&symbol=" + stock + "&apikey=VUUG2MG0ELJZOOGF"
-    with urllib.request.urlopen(url) as url:
-        data = json.loads(url.read().decode())
-        print(data)
-        results = data["Weekly Time Series"]
-        return results
+    data = httpClient.getJSON(url)
+    print(data)
+    results = data["Weekly Time Series"]
+    return results
 
 
         
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+from os.path import dirname, realpath
+from threading import Thread, Event, Lock
+from time import time
+from .financial import company_name_to_stock
+from .predict import predict
+from .qrcache import qrCodeCache
+from .quota import BACKGROUND, QuotaExceededError
+from .instrumentation import instrumentation
+from .filelock import lockFile, unlockFile
+import atexit
+import json
+import os
+
+
+HOT_SYMBOLS_FILE = dirname(realpath(__file__)) + "/cache/hotSymbols.json"
+
+# Request counts halve every this many seconds, so symbols which were popular a month ago stop being warmed
+HOT_SYMBOLS_HALF_LIFE = 3 * 24 * 60 * 60
+# Company names remembered per symbol, to refresh their symbol mappings
+NAMES_PER_SYMBOL = 3
+
+
+class HotSymbols:
+    """ Decaying request counts per stock symbol, with the company names people asked about them by.
+        Persisted to a JSON file so the most requested symbols survive restarts. Several processes can share the file;
+        each one adds the requests it counted to it under a file lock, every saveInterval seconds and at exit """
+    def __init__(self, path = HOT_SYMBOLS_FILE, halfLife = HOT_SYMBOLS_HALF_LIFE, maxSymbols = 1024, saveInterval = 60):
+        """ Constructor. Tracks at most maxSymbols symbols, forgetting the least requested ones """
+        self.path = path
+        self.halfLife = halfLife
+        self.maxSymbols = maxSymbols
+        self.saveInterval = saveInterval
+        # Symbol to [score, time of score, company names], as of the last save plus requests counted since
+        self._symbols = dict()
+        # The same, for only the requests counted since the last save
+        self._pending = dict()
+        self._lock = Lock()
+        self._saveLock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def _decayed(self, entry, now):
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.halfLife)
+
+    def _add(self, symbols, symbol, companyName, now):
+        entry = symbols.get(symbol)
+        if entry == None:
+            entry = symbols[symbol] = [0.0, now, []]
+        entry[0] = self._decayed(entry, now) + 1
+        entry[1] = now
+        if companyName != None:
+            if companyName in entry[2]:
+                entry[2].remove(companyName)
+            entry[2].insert(0, companyName)
+            del entry[2][NAMES_PER_SYMBOL:]
+
+    def _trim(self, symbols, now):
+        """ Forget the least requested symbols past maxSymbols """
+        if len(symbols) > self.maxSymbols:
+            ranked = sorted(symbols, key=lambda s: self._decayed(symbols[s], now), reverse=True)
+            for symbol in ranked[self.maxSymbols:]:
+                del symbols[symbol]
+
+    def _ensureStarted(self):
+        """ Start the saving thread on first use """
+        if self._thread != None:
+            return
+        with self._saveLock:
+            if self._thread != None:
+                return
+            self._thread = Thread(target=self._run, name="HotSymbolsSaver", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.wait(self.saveInterval):
+            try:
+                self.save()
+            except Exception as e:
+                print("Exception while saving hot symbols file: ", e)
+
+    def stop(self):
+        """ Stop the saving thread and do a final save """
+        self._stopped.set()
+        self.save()
+
+    def record(self, symbol, companyName = None):
+        """ Count a request for a symbol, optionally asked for by company name """
+        self._ensureStarted()
+        symbol = symbol.upper()
+        companyName = companyName.lower() if companyName != None else None
+        now = time()
+        with self._lock:
+            self._add(self._symbols, symbol, companyName, now)
+            self._add(self._pending, symbol, companyName, now)
+            self._trim(self._symbols, now)
+            self._trim(self._pending, now)
+
+    def top(self, count):
+        """ Get the count most requested symbols, hottest first, as (symbol, company names) pairs """
+        now = time()
+        with self._lock:
+            ranked = sorted(self._symbols.items(), key=lambda item: self._decayed(item[1], now), reverse=True)
+            return [(symbol, list(entry[2])) for symbol, entry in ranked[:count]]
+
+    def _readFile(self):
+        """ Read the saved counts as a symbol to [score, time, company names] dictionary, treating a missing or broken file as empty """
+        try:
+            with open(self.path, "r") as fd:
+                saved = json.load(fd)
+        except FileNotFoundError:
+            return dict()
+        except Exception as e:
+            print("Exception while reading hot symbols file: ", e)
+            return dict()
+        return {symbol: [entry["score"], entry["time"], entry["names"][:NAMES_PER_SYMBOL]] for symbol, entry in saved.items()}
+
+    def load(self):
+        """ Load counts saved by an earlier run or other processes, if there are any """
+        saved = self._readFile()
+        with self._lock:
+            for symbol, entry in saved.items():
+                self._symbols.setdefault(symbol, entry)
+
+    def save(self):
+        """ Add the requests counted since the last save to the file, and pick up the requests other processes saved """
+        with self._saveLock:
+            with self._lock:
+                pending = self._pending
+                self._pending = dict()
+            now = time()
+            if len(pending) == 0:
+                symbols = self._readFile()
+                with self._lock:
+                    # Nothing to add, but other processes may have saved requests
+                    if len(symbols) != 0:
+                        self._symbols = symbols
+                return
+
+            try:
+                os.makedirs(dirname(self.path), exist_ok=True)
+                with open(self.path + ".lock", "a+") as lockFd:
+                    lockFile(lockFd)
+                    try:
+                        symbols = self._readFile()
+                        for symbol, entry in pending.items():
+                            saved = symbols.get(symbol, [0.0, now, []])
+                            names = entry[2] + [name for name in saved[2] if name not in entry[2]]
+                            symbols[symbol] = [self._decayed(saved, now) + self._decayed(entry, now), now, names[:NAMES_PER_SYMBOL]]
+                        self._trim(symbols, now)
+                        # Write a temporary file and rename it over the old one, so readers never see a partial file
+                        tempPath = "{}.{}.tmp".format(self.path, os.getpid())
+                        with open(tempPath, "w") as fd:
+                            json.dump({symbol: {"score": entry[0], "time": entry[1], "names": entry[2]} for symbol, entry in symbols.items()}, fd)
+                        os.replace(tempPath, self.path)
+                    finally:
+                        unlockFile(lockFd)
+            except BaseException:
+                # Keep the requests for the next attempt
+                with self._lock:
+                    for symbol, entry in pending.items():
+                        current = self._pending.get(symbol)
+                        if current == None:
+                            self._pending[symbol] = entry
+                        else:
+                            current[0] = self._decayed(current, now) + self._decayed(entry, now)
+                            current[1] = now
+                raise
+
+            with self._lock:
+                # Requests counted during the save are still pending, so they are added on top of the merged counts
+                for symbol, entry in self._pending.items():
+                    merged = symbols.setdefault(symbol, [0.0, now, []])
+                    merged[0] = self._decayed(merged, now) + self._decayed(entry, now)
+                    merged[1] = now
+                self._symbols = symbols
+
+    def getStats(self):
+        """ Get occupancy and the hottest symbols as a dictionary """
+        with self._lock:
+            size = len(self._symbols)
+        return {"size": size, "maxSymbols": self.maxSymbols, "top": [symbol for symbol, _ in self.top(10)]}
+
+
+class Warmer:
+    """ Refreshes the data of the most requested symbols in a background thread, at startup and then periodically,
+        so their next queries don't wait on upstream: symbol mappings, weekly series and model input windows,
+        predictions and QR code PNGs. Upstream calls are made at background quota priority, so they give way to
+        interactive queries and leave them a reserve of each API key's quota """
+    def __init__(self, predictor, hotSymbols, interval = 15 * 60, maxSymbols = 20):
+        """ Constructor. Every interval seconds, the maxSymbols hottest symbols are refreshed. predictor is the model
+            (or PredictionBatcher) used to warm up predictions """
+        self.predictor = predictor
+        self.hotSymbols = hotSymbols
+        self.interval = interval
+        self.maxSymbols = maxSymbols
+        self.cycles = 0
+        self.warmed = 0
+        self.skipped = 0
+        self.failed = 0
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self):
+        """ Load the saved symbols and start warming up in the background """
+        if self._thread != None:
+            return
+        self.hotSymbols.load()
+        self._thread = Thread(target=self._run, name="Warmer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """ Stop the background thread and save the symbols """
+        self._stopped.set()
+        self.hotSymbols.save()
+
+    def _run(self):
+        # The first cycle runs straight away, so a restart is warm again before the first interval ends
+        while True:
+            try:
+                self.warmUp()
+                self.hotSymbols.save()
+            except Exception as e:
+                print("Exception while warming up: ", e)
+            if self._stopped.wait(self.interval):
+                return
+
+    def warmUp(self):
+        """ Refresh the data of the hottest symbols once. Stops early when background quota runs out """
+        self.cycles += 1
+        for symbol, companyNames in self.hotSymbols.top(self.maxSymbols):
+            if self._stopped.is_set():
+                return
+            try:
+                with instrumentation.timed("warmup.symbol"):
+                    self._warmSymbol(symbol, companyNames)
+                self.warmed += 1
+            except QuotaExceededError:
+                # The rest would be refused too. They are warmed next cycle
+                self.skipped += 1
+                return
+            except Exception as e:
+                self.failed += 1
+                print("Exception while warming up '{}': ".format(symbol), e)
+
+    def _warmSymbol(self, symbol, companyNames):
+        for companyName in companyNames:
+            company_name_to_stock(companyName, BACKGROUND)
+        predict(self.predictor, symbol, BACKGROUND)
+        qrCodeCache.getPNG("https://www.google.com/search?q=" + symbol)
+
+    def getStats(self):
+        """ Get counters as a dictionary """
+        return {
+            "cycles": self.cycles,
+            "warmed": self.warmed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "hotSymbols": self.hotSymbols.getStats()
+        }
+
+
+hotSymbols = HotSymbols()
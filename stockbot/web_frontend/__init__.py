@@ -1,3 +1,3 @@
 #!/usr/bin/env python3
 
-__all__ = ["apiHandlers", "fileCacher", "getStatsHandler", "httpHandler", "queryHandler", "restError"] 
+__all__ = ["apiHandlers", "asyncServer", "fileCacher", "getStatsHandler", "httpHandler", "imageStore", "metricsHandler", "predictHandler", "queryHandler", "rawResponse", "restError", "routes", "workerPool"] 
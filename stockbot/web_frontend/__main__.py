@@ -1,22 +1,66 @@
 #!/usr/bin/env python3
 from http.server import ThreadingHTTPServer
 from os.path import dirname, realpath
+from argparse import ArgumentParser
+import asyncio
 from .httpHandler import HTTPApiHandler
-from .fileCacher import cacheFile
+from .asyncServer import AsyncHTTPServer
+from .fileCacher import cacheFile, LONG_MAX_AGE
+from .imageStore import imageStore
+from .workerPool import WorkerPool, listeningSocket
 from ..query import QueryHandler
+from ..quota import alphaVantageQuota
 
-def startServer(port):
-    HTTPApiHandler.queryHandler = QueryHandler()
+def cacheFiles():
     filesPath = dirname(realpath(__file__)) + "/files"
     cacheFile(None, filesPath + "/404.html", "text/html")
     cacheFile("/404_styles.css", filesPath + "/404_styles.css", "text/css")
-    cacheFile("/404.png", filesPath + "/404.png", "image/png")
+    cacheFile("/404.png", filesPath + "/404.png", "image/png", LONG_MAX_AGE)
     cacheFile("/index.html", filesPath + "/index.html", "text/html")
     cacheFile("/rest-caller.js", filesPath + "/rest-caller.js", "text/javascript")
     cacheFile("/styles.css", filesPath + "/styles.css", "text/css")
     cacheFile("/roboto.css", filesPath + "/roboto.css", "text/css")
-    cacheFile("/Roboto-Regular.ttf", filesPath + "/Roboto-Regular.ttf", "application/octet-stream")
-    cacheFile("/Roboto-Medium.ttf", filesPath + "/Roboto-Medium.ttf", "application/octet-stream")
+    cacheFile("/Roboto-Regular.ttf", filesPath + "/Roboto-Regular.ttf", "application/octet-stream", LONG_MAX_AGE)
+    cacheFile("/Roboto-Medium.ttf", filesPath + "/Roboto-Medium.ttf", "application/octet-stream", LONG_MAX_AGE)
+
+def _workerQueryHandler(index, processes, **kwargs):
+    """ Make the QueryHandler of a worker process. Workers split the upstream quota and share images stored by the
+        others; only the first one warms up the most requested symbols, so background calls aren't repeated """
+    alphaVantageQuota.share(processes)
+    imageStore.enableSharing()
+    if index != 0:
+        kwargs["warmUpInterval"] = None
+    return QueryHandler(**kwargs)
+
+def _serveWorkers(serve, port, processes):
+    """ Serve from processes pre-forked workers, each running serve(sock, index) on a shared listening socket """
+    cacheFiles()
+    pool = WorkerPool(serve, processes, listeningSocket("", port))
+    try:
+        print("Server started ({} worker processes)".format(processes))
+        pool.serveForever()
+    except Exception as e:
+        print("\nException occurred, stopping: {}".format(e))
+    except KeyboardInterrupt:
+        print("\nGracefully stopping server...")
+    pool.close()
+    print("Server stopped")
+
+def startServer(port, processes = 1):
+    """ Serve with a thread per connection. With more than one process, connections are spread over that many
+        pre-forked worker processes, each with its own QueryHandler """
+    if processes > 1:
+        def serve(sock, index):
+            HTTPApiHandler.queryHandler = _workerQueryHandler(index, processes)
+            httpd = ThreadingHTTPServer(sock.getsockname(), HTTPApiHandler, bind_and_activate=False)
+            httpd.socket.close()
+            httpd.socket = sock
+            httpd.serve_forever()
+        _serveWorkers(serve, port, processes)
+        return
+
+    HTTPApiHandler.queryHandler = QueryHandler()
+    cacheFiles()
     httpd = ThreadingHTTPServer(('', port), HTTPApiHandler)
     try:
         print("Server started")
@@ -28,7 +72,45 @@ def startServer(port):
     httpd.server_close()
     print("Server stopped")
 
+def startAsyncServer(port, workers = 8, cpuWorkers = 2, maxConcurrentCalls = 64, maxQueuedCalls = 256, processes = 1):
+    """ Same as startServer, but serves from an event loop. Upstream requests don't hold a thread; model and image work
+        runs on cpuWorkers threads and API calls without a coroutine version on workers threads. The limits are per process """
+    if processes > 1:
+        def serve(sock, index):
+            server = AsyncHTTPServer(_workerQueryHandler(index, processes, cpuWorkers=cpuWorkers), workers=workers,
+                                     maxConcurrentCalls=maxConcurrentCalls, maxQueuedCalls=maxQueuedCalls, sock=sock)
+            asyncio.run(server.serveForever())
+        _serveWorkers(serve, port, processes)
+        return
+
+    server = AsyncHTTPServer(QueryHandler(cpuWorkers=cpuWorkers), port=port, workers=workers,
+                             maxConcurrentCalls=maxConcurrentCalls, maxQueuedCalls=maxQueuedCalls)
+    cacheFiles()
+    try:
+        print("Server started (asyncio)")
+        asyncio.run(server.serveForever())
+    except Exception as e:
+        print("\nException occurred, stopping: {}".format(e))
+    except KeyboardInterrupt:
+        print("\nGracefully stopping server...")
+    server.close()
+    print("Server stopped")
+
 
 if __name__ == "__main__":
-    startServer(8080)
+    parser = ArgumentParser(prog="python3 -m stockbot.web_frontend", description="Serve the chatbot's web frontend")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--server", choices=("threaded", "async"), default="threaded",
+                        help="threaded: a thread per connection; async: an event loop with keep-alive and bounded queues")
+    parser.add_argument("--workers", type=int, default=8, help="async server: threads for blocking API calls")
+    parser.add_argument("--cpu-workers", type=int, default=2, help="async server: threads for model and image work")
+    parser.add_argument("--max-concurrent-calls", type=int, default=64, help="async server: API calls served at once")
+    parser.add_argument("--max-queued-calls", type=int, default=256, help="async server: API calls waiting before 503s are sent")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="pre-forked worker processes sharing the port, e.g. one per core, so CPU-bound work isn't limited to one core by the GIL")
+    args = parser.parse_args()
 
+    if args.server == "async":
+        startAsyncServer(args.port, args.workers, args.cpu_workers, args.max_concurrent_calls, args.max_queued_calls, args.processes)
+    else:
+        startServer(args.port, args.processes)
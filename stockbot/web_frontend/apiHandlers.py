@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 from .getStatsHandler import getStats
-from .queryHandler import query
+from .metricsHandler import metrics
+from .queryHandler import query, aquery
+from .predictHandler import predict, apredict
 
 
 apiHandlers = {
     'getStats': getStats,
+    'metrics': metrics,
+    'predict': predict,
     'query': query
 }
+
+# Coroutine versions of handlers, used by the asyncio server instead of running the handler in a worker thread
+asyncApiHandlers = {
+    'predict': apredict,
+    'query': aquery
+}
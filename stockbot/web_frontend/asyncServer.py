@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from email.utils import formatdate
+from time import strftime
+import traceback
+import asyncio
+import sys
+from .routes import Response, StreamBody, ahandleGET
+from .fileCacher import FileBody
+
+
+MAX_HEADER_BYTES = 64 * 1024
+_REASONS = {status: phrase for status, (phrase, _) in BaseHTTPRequestHandler.responses.items()}
+
+
+class _BadRequest(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+
+
+class AsyncHTTPServer:
+    """ An asyncio HTTP/1.1 server for the same routes as HTTPApiHandler, keeping connections alive between requests.
+        At most maxConcurrentCalls REST API calls run at once and at most maxQueuedCalls wait for a turn; calls beyond that
+        get a 503 response straight away instead of piling up """
+    def __init__(self, queryHandler, host = "", port = 8080, workers = 8, maxConcurrentCalls = 64, maxQueuedCalls = 256,
+                 maxConnections = 1024, keepAliveTimeout = 15, maxRequestsPerConnection = 1000, quiet = False, sock = None):
+        """ Constructor. REST API handlers without a coroutine version run in a pool of worker threads.
+            If sock is given, connections are accepted from that listening socket instead of binding host and port """
+        self.queryHandler = queryHandler
+        self.host = host
+        self.port = port
+        self.maxConcurrentCalls = maxConcurrentCalls
+        self.maxQueuedCalls = maxQueuedCalls
+        self.maxConnections = maxConnections
+        self.keepAliveTimeout = keepAliveTimeout
+        self.maxRequestsPerConnection = maxRequestsPerConnection
+        self.quiet = quiet
+        self.sock = sock
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="HTTPWorker")
+        self._callSlots = None
+        self._pendingCalls = 0
+        self._connections = 0
+        self._server = None
+
+    async def start(self):
+        """ Start listening. Returns once the socket is bound """
+        self._callSlots = asyncio.Semaphore(self.maxConcurrentCalls)
+        if self.sock != None:
+            self._server = await asyncio.start_server(self._handleConnection, sock=self.sock, limit=MAX_HEADER_BYTES)
+        else:
+            self._server = await asyncio.start_server(self._handleConnection, self.host or None, self.port, limit=MAX_HEADER_BYTES, backlog=1024)
+        return self._server
+
+    async def serveForever(self):
+        """ Start listening and serve until cancelled """
+        if self._server == None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        """ Stop listening and shut the worker threads down """
+        if self._server != None:
+            self._server.close()
+        self._executor.shutdown(wait=False)
+
+    def _logger(self, peer):
+        def log(message):
+            if not self.quiet:
+                sys.stderr.write("{} - - [{}] {}\n".format(peer, strftime("%d/%b/%Y %H:%M:%S"), message))
+        return log
+
+    async def _handleConnection(self, reader, writer):
+        peername = writer.get_extra_info("peername")
+        log = self._logger(peername[0] if peername else "-")
+        self._connections += 1
+        try:
+            if self._connections > self.maxConnections:
+                self.rejected += 1
+                await self._send(writer, Response(503, reason="Too many connections", headers=[("Retry-After", "1")]), False, False)
+                return
+
+            for _ in range(self.maxRequestsPerConnection):
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keepAliveTimeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._send(writer, Response(431), False, False)
+                    return
+
+                try:
+                    method, target, version, headers = _parseHead(head)
+                    await _discardBody(reader, headers)
+                except _BadRequest as e:
+                    await self._send(writer, Response(e.status, reason=e.message), False, False)
+                    return
+
+                connection = headers.get("connection", "").lower()
+                keepAlive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                chunked = version == "HTTP/1.1"
+
+                if method not in ("GET", "HEAD"):
+                    response = Response(501, reason="Unsupported method ({!r})".format(method))
+                else:
+                    try:
+                        response = await self._dispatch(target, headers, log)
+                    except Exception:
+                        traceback.print_exc()
+                        await self._send(writer, Response(500), False, False)
+                        return
+
+                if isinstance(response.body, StreamBody) and not chunked:
+                    # HTTP/1.0 clients can't read chunked bodies, so the end of the body is marked by closing the connection
+                    keepAlive = False
+                log('"{} {} {}" {} {}'.format(method, target, version, response.status, "-" if isinstance(response.body, StreamBody) else len(response.body)))
+                await self._send(writer, response, keepAlive, method == "HEAD", chunked)
+                if not keepAlive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def _dispatch(self, target, headers, log):
+        if not target.startswith("/api/"):
+            return await ahandleGET(self.queryHandler, target, headers, log, self._executor)
+
+        if self._pendingCalls >= self.maxConcurrentCalls + self.maxQueuedCalls:
+            self.rejected += 1
+            return Response(503, reason="Server busy", headers=[("Retry-After", "1")])
+        self._pendingCalls += 1
+        try:
+            async with self._callSlots:
+                return await ahandleGET(self.queryHandler, target, headers, log, self._executor)
+        finally:
+            self._pendingCalls -= 1
+
+    async def _send(self, writer, response, keepAlive, headOnly, chunked = True):
+        """ Write a response. Streamed bodies are sent with chunked transfer encoding if chunked is set, and until the
+            connection closes otherwise """
+        reason = response.reason if response.reason != None else _REASONS.get(response.status, "")
+        lines = [
+            "HTTP/1.1 {} {}".format(response.status, reason),
+            "Server: stockbot",
+            "Date: " + formatdate(usegmt=True),
+            "Connection: " + ("keep-alive" if keepAlive else "close")
+        ]
+        stream = isinstance(response.body, StreamBody)
+        if stream:
+            if chunked:
+                lines.append("Transfer-Encoding: chunked")
+        elif response.status != 304:
+            lines.append("Content-Length: {}".format(len(response.body)))
+        if response.mimetype != None:
+            lines.append("Content-Type: " + response.mimetype)
+        for name, value in response.headers:
+            lines.append("{}: {}".format(name, value))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if not headOnly:
+            if isinstance(response.body, FileBody):
+                # Straight from the page cache to the socket, with os.sendfile where the loop supports it
+                await writer.drain()
+                with open(response.body.path, "rb") as fd:
+                    await asyncio.get_running_loop().sendfile(writer.transport, fd, response.body.offset, response.body.count)
+            elif stream:
+                await self._sendStream(writer, response.body.chunks, chunked)
+                return
+            else:
+                writer.write(response.body)
+        # Wait for slow clients to take the data instead of buffering without limit
+        await writer.drain()
+
+    async def _sendStream(self, writer, chunks, chunked):
+        """ Write each chunk as soon as it is produced. Chunks of synchronous iterables are produced in the worker threads.
+            The headers are already out, so if producing a chunk fails the error is logged and the connection is closed
+            without ending the body, which the client sees as a truncated response """
+        try:
+            if hasattr(chunks, "__aiter__"):
+                try:
+                    async for chunk in chunks:
+                        await _writeChunk(writer, chunk, chunked)
+                finally:
+                    # Stops the work behind the chunks straight away if the client went away
+                    if hasattr(chunks, "aclose"):
+                        await chunks.aclose()
+            else:
+                iterator = iter(chunks)
+                pending = None
+                try:
+                    while True:
+                        pending = self._executor.submit(next, iterator, None)
+                        chunk = await asyncio.wrap_future(pending)
+                        if chunk == None:
+                            break
+                        await _writeChunk(writer, chunk, chunked)
+                finally:
+                    # Stops the work behind the chunks if the client went away, as aclose does above
+                    _closeIterator(iterator, pending)
+        except ConnectionError:
+            raise
+        except Exception:
+            traceback.print_exc()
+            raise ConnectionAbortedError("Streamed response failed")
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def _closeIterator(iterator, pending):
+    """ Close a generator once the call producing its current chunk (pending, a concurrent Future or None) has returned,
+        as a running generator can't be closed """
+    close = getattr(iterator, "close", None)
+    if close == None:
+        return
+    if pending == None or pending.done():
+        close()
+    else:
+        pending.add_done_callback(lambda _: close())
+
+
+async def _writeChunk(writer, chunk, chunked):
+    if len(chunk) == 0:
+        # An empty chunk would end a chunked body
+        return
+    if chunked:
+        writer.write(b"%x\r\n" % len(chunk) + chunk + b"\r\n")
+    else:
+        writer.write(chunk)
+    await writer.drain()
+
+
+def _parseHead(head):
+    """ Split a request head into its method, target, HTTP version and lowercased headers """
+    try:
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise _BadRequest(400, "Bad request line")
+    if version not in ("HTTP/1.0", "HTTP/1.1"):
+        raise _BadRequest(505, "HTTP version not supported")
+
+    headers = dict()
+    for line in lines[1:]:
+        if line == "":
+            continue
+        name, separator, value = line.partition(":")
+        if separator == "":
+            raise _BadRequest(400, "Bad header line")
+        headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+async def _discardBody(reader, headers):
+    """ Skip a request body so the next request on the connection can be read """
+    if "transfer-encoding" in headers:
+        raise _BadRequest(501, "Chunked request bodies are not supported")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise _BadRequest(400, "Bad Content-Length")
+    if length > 0:
+        await reader.readexactly(length)
@@ -1,14 +1,213 @@
 #!/usr/bin/env python3
+from email.utils import formatdate, parsedate_to_datetime
+from os.path import dirname, realpath
+from hashlib import sha1
+import shutil
+import gzip
+import re
 import os
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Cache-Control max-age, in seconds, of files which may change between releases, and of files which never do (fonts, images)
+DEFAULT_MAX_AGE = 60 * 60
+LONG_MAX_AGE = 365 * 24 * 60 * 60
+
+# Compressed variants are only kept if they save at least this fraction of the file
+MIN_COMPRESSION_SAVING = 0.1
+
+# Files larger than this aren't held in memory. They, and their compressed variants, are sent from disk with sendfile
+ZERO_COPY_THRESHOLD = 64 * 1024
+# Where compressed variants of large files are kept, named after the hash of the file
+VARIANTS_DIR = dirname(dirname(realpath(__file__))) + "/cache/static"
+_CHUNK_SIZE = 256 * 1024
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/octet-stream", "image/svg+xml", "font/")
+
 
 _fileCache = dict()
 
 
+class RangeNotSatisfiable(Exception):
+    """ Raised when a Range header asks for bytes past the end of a file """
+    pass
+
+
+class FileBody:
+    """ A response body sent straight from part of a file on disk, instead of from memory """
+    def __init__(self, path, offset, count):
+        self.path = path
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+
+def sliceBody(body, start, stop):
+    """ Get bytes start to stop of a body held in memory or on disk """
+    if isinstance(body, FileBody):
+        return FileBody(body.path, body.offset + start, stop - start)
+    return body[start:stop]
+
+
 class ServerFile:
-    def __init__(self, mimetype, bytebuf):
+    def __init__(self, mimetype, bytebuf, mtime = None, maxAge = DEFAULT_MAX_AGE, path = None):
+        """ Constructor. The file is held in memory as bytebuf or, if bytebuf is None, sent from path on disk.
+            Compressed variants and the ETag are computed here, once """
         self.mimetype = mimetype
         self.bytebuf = bytebuf
+        self.maxAge = maxAge
+        self.lastModified = formatdate(mtime, usegmt=True) if mtime != None else None
+        self._mtime = int(mtime) if mtime != None else None
+
+        if bytebuf != None:
+            digest = sha1(bytebuf).hexdigest()
+            identity = bytebuf
+        else:
+            digest = _hashFile(path)
+            identity = FileBody(path, 0, os.path.getsize(path))
+        self.etag = '"{}"'.format(digest[:20])
+
+        # Content-Encoding to (ETag, body). Each encoding gets its own strong ETag, as they are different bytes
+        self.variants = {"identity": (self.etag, identity)}
+        if mimetype.startswith(_COMPRESSIBLE_TYPES):
+            if bytebuf != None:
+                self._addVariant("gzip", gzip.compress(bytebuf, 9, mtime=0))
+                if brotli != None:
+                    self._addVariant("br", brotli.compress(bytebuf, quality=11))
+            else:
+                self._addVariant("gzip", _compressFile(path, digest, "gzip"))
+                if brotli != None:
+                    self._addVariant("br", _compressFile(path, digest, "br"))
+
+    def _addVariant(self, encoding, body):
+        if len(body) <= len(self.variants["identity"][1]) * (1 - MIN_COMPRESSION_SAVING):
+            self.variants[encoding] = (self.etag[:-1] + "-" + encoding + '"', body)
+
+    def negotiate(self, acceptEncoding):
+        """ Pick the smallest variant the client accepts. Returns (Content-Encoding, ETag, body) """
+        accepted = _parseAcceptEncoding(acceptEncoding)
+        best = "identity"
+        for encoding, (_, body) in self.variants.items():
+            quality = accepted.get(encoding, accepted.get("*", 0))
+            if quality > 0 and len(body) < len(self.variants[best][1]):
+                best = encoding
+        etag, body = self.variants[best]
+        return best, etag, body
+
+    def isNotModified(self, ifNoneMatch, ifModifiedSince):
+        """ Whether a conditional GET's validators match this file, so a 304 response can be sent """
+        if ifNoneMatch != None:
+            return etagMatches(ifNoneMatch, {etag for etag, _ in self.variants.values()})
+        if ifModifiedSince != None and self._mtime != None:
+            try:
+                return int(parsedate_to_datetime(ifModifiedSince).timestamp()) >= self._mtime
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def rangeApplies(self, ifRange):
+        """ Whether a Range header should be honoured given the request's If-Range header """
+        # If-Range uses strong comparison, and ranges are only served from the uncompressed file
+        return ifRange == None or ifRange.strip() == self.etag or (self.lastModified != None and ifRange.strip() == self.lastModified)
+
+    def cacheHeaders(self, etag, encoding):
+        """ Get the validator and caching headers for a variant, as (name, value) pairs """
+        headers = [("ETag", etag), ("Cache-Control", "public, max-age={}".format(self.maxAge)), ("Accept-Ranges", "bytes")]
+        if self.lastModified != None:
+            headers.append(("Last-Modified", self.lastModified))
+        if len(self.variants) > 1:
+            headers.append(("Vary", "Accept-Encoding"))
+        if encoding != "identity":
+            headers.append(("Content-Encoding", encoding))
+        return headers
+
+
+def etagMatches(ifNoneMatch, etags):
+    """ Whether an If-None-Match header matches any of a collection of ETags """
+    if ifNoneMatch.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so weak tags match too
+    for tag in ifNoneMatch.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in etags:
+            return True
+    return False
+
+
+def _parseAcceptEncoding(acceptEncoding):
+    """ Parse an Accept-Encoding header into an encoding to quality dictionary. identity is acceptable unless refused """
+    accepted = {"identity": 1}
+    for item in (acceptEncoding or "").split(","):
+        parts = item.strip().split(";")
+        encoding = parts[0].strip().lower()
+        if encoding == "":
+            continue
+        quality = 1
+        for parameter in parts[1:]:
+            name, _, value = parameter.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        accepted[encoding] = quality
+    return accepted
+
+
+def parseRange(rangeHeader, size):
+    """ Parse a single byte range Range header into (start, stop). Returns None for headers which should be ignored,
+        such as multiple ranges, and raises RangeNotSatisfiable if the range is past the end of the file """
+    match = _RANGE_RE.match(rangeHeader.strip())
+    if match == None or match.group(1) + match.group(2) == "":
+        return None
+    if match.group(1) == "":
+        # Suffix range: the last N bytes
+        suffix = int(match.group(2))
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - suffix), size
+    start = int(match.group(1))
+    if start >= size:
+        raise RangeNotSatisfiable()
+    stop = int(match.group(2)) + 1 if match.group(2) != "" else size
+    if stop <= start:
+        return None
+    return start, min(stop, size)
+
+
+def _hashFile(path):
+    digest = sha1()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _compressFile(path, digest, encoding):
+    """ Get a FileBody of a compressed copy of a file, compressing it into VARIANTS_DIR unless that was done before """
+    variantPath = "{}/{}.{}".format(VARIANTS_DIR, digest, encoding)
+    if not os.path.isfile(variantPath):
+        os.makedirs(VARIANTS_DIR, exist_ok=True)
+        tempPath = "{}.{}.tmp".format(variantPath, os.getpid())
+        with open(path, "rb") as source, open(tempPath, "wb") as target:
+            if encoding == "gzip":
+                with gzip.GzipFile(fileobj=target, mode="wb", compresslevel=9, mtime=0) as compressed:
+                    shutil.copyfileobj(source, compressed, _CHUNK_SIZE)
+            else:
+                compressor = brotli.Compressor(quality=11)
+                for chunk in iter(lambda: source.read(_CHUNK_SIZE), b""):
+                    target.write(compressor.process(chunk))
+                target.write(compressor.finish())
+        os.replace(tempPath, variantPath)
+    return FileBody(variantPath, 0, os.path.getsize(variantPath))
 
 
 def isFileInCache(key):
@@ -19,17 +218,16 @@ def getFileFromCache(key):
     return _fileCache[key]
 
 
-def cacheFile(key, path, mimetype):
+def cacheFile(key, path, mimetype, maxAge = DEFAULT_MAX_AGE):
     print("Caching file '{}' as '{}' with mimetype '{}'...".format(path, key, mimetype))
     if not os.path.isfile(path):
         raise ValueError("File '{}' does not exist!".format(path))
-    
-    filebuf = bytearray()
+
+    # Large files stay on disk and are sent from the page cache
+    if os.path.getsize(path) > ZERO_COPY_THRESHOLD:
+        _fileCache[key] = ServerFile(mimetype, None, os.path.getmtime(path), maxAge, path)
+        return
+
     with open(path, "rb") as fd:
-        while True:
-            buf = fd.read()
-            if len(buf) == 0:
-                break
-            filebuf += bytearray(buf)
-    
-    _fileCache[key] = ServerFile(mimetype, bytes(filebuf))
+        filebuf = fd.read()
+    _fileCache[key] = ServerFile(mimetype, filebuf, os.path.getmtime(path), maxAge)
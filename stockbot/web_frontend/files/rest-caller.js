@@ -10,7 +10,7 @@ function doQuery() {
             jsonResponse = JSON.parse(xhttp.responseText);
             
             // Add to answer list
-            addAnswer(jsonResponse.response, jsonResponse.image);
+            addAnswer(jsonResponse.response, jsonResponse.imageURL);
         }
     };
     xhttp.open("GET", "/api/query?query=" + encodeURIComponent(queryText), true);
@@ -46,17 +46,17 @@ function getMetrics() {
     xhttp.send();
 }
 
-function addAnswer(text, imageBase64) {
+function addAnswer(text, imageURL) {
     // Create answer box
     newDiv = document.createElement("div");
     newDiv.className = "answerBox";
     newDiv.textContent = text;
     
-    if(imageBase64 !== null) {
+    if(imageURL !== null) {
         newBreak = document.createElement("br");
         newDiv.appendChild(newBreak);
         newImg = document.createElement("img");
-        newImg.setAttribute('src', 'data:image/png;base64,' + imageBase64);
+        newImg.setAttribute('src', imageURL);
         newDiv.appendChild(newImg);
     }
     
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 from ..metrics import getMetrics
+from ..qrcache import qrCodeCache
+from ..responsecache import responseCache
+from ..symbolindex import symbolIndex
+from ..quota import alphaVantageQuota
+from .imageStore import imageStore
 
 
-def getStats(_, queryString):
+def getStats(queryHandler, queryString):
     apiCalls = getMetrics()
-    return {"apiCalls": apiCalls}
+    return {"apiCalls": apiCalls, "qrCache": qrCodeCache.getStats(), "responseCache": responseCache.getStats(), "symbolIndex": symbolIndex.getStats(), "alphaVantageQuota": alphaVantageQuota.getStats(), "warmUp": queryHandler.warmer.getStats() if getattr(queryHandler, "warmer", None) != None else None, "imageStore": imageStore.getStats()}
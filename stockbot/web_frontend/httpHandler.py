@@ -1,77 +1,52 @@
 #!/usr/bin/env python3
 from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
-import json
-import re
-from .apiHandlers import apiHandlers
-from .restError import RESTError
-from .fileCacher import *
-
-apiPathRegex = re.compile(r'^/api/([^/]*)$')
+import traceback
+from .routes import handleGET, StreamBody
+from .fileCacher import FileBody
 
 
 class HTTPApiHandler(BaseHTTPRequestHandler):
     queryHandler = None
-    
-    def _serveFile(self, path):
-        if path == '/':
-            path = '/index.html'
-        
-        self.log_message('Serving file "{}"'.format(path))
-        if isFileInCache(path):
-            thisFile = getFileFromCache(path)
-            self.send_response(200)
-            self.send_header("Content-Type", thisFile.mimetype)
-            self.end_headers()
-            self.wfile.write(thisFile.bytebuf)
-        else:
-            notFoundFile = getFileFromCache(None)
-            self.log_message("File missing. Sending 404 page...")
-            self.send_response(404)
-            self.send_header("Content-Type", notFoundFile.mimetype)
-            self.end_headers()
-            self.wfile.write(notFoundFile.bytebuf)
 
     def do_GET(self):
         try:
-            # Normalise the path and extract query parameters
-            processed = urlparse(self.path)
-            normalPath = processed.path
-            queries = parse_qs(processed.query)
-            
-            # Serve the request
-            apiMatch = re.match(apiPathRegex, normalPath)
-            if apiMatch != None:
-                # Doing a REST API call
-                callName = apiMatch.group(1)
-                if callName in apiHandlers.keys():
-                    self.log_message('Serving REST API call "{}"'.format(callName))
-                    try:
-                        result = apiHandlers[callName](HTTPApiHandler.queryHandler, queries)
-                    except RESTError as e:
-                        self.send_response(403, "REST API call failed")
-                        self.send_header("Content-Type", "application/json")
-                        self.end_headers()
-                        
-                        errorDict = {
-                            'code': e.code,
-                            'message': e.message
-                        }
-                        
-                        json.dump(errorDict, self.wfile)
-                    else:
-                        self.send_response(200)
-                        self.send_header("Content-Type", "application/json")
-                        self.end_headers()
-                        self.wfile.write(json.dumps(result).encode("utf-8"))
-                else:
-                    responseMessage = 'Unknown REST API call "{}"'.format(callName)
-                    self.log_message(responseMessage)
-                    self.send_response(404, responseMessage)
-                    self.end_headers()
+            headers = {name.lower(): value for name, value in self.headers.items()}
+            response = handleGET(HTTPApiHandler.queryHandler, self.path, headers, self.log_message)
+            self.send_response(response.status, response.reason)
+            if response.mimetype != None:
+                self.send_header("Content-Type", response.mimetype)
+            for name, value in response.headers:
+                self.send_header(name, value)
+            if isinstance(response.body, StreamBody):
+                # The length isn't known up front, so the end of the body is marked by closing the connection
+                self.close_connection = True
+                self.send_header("Connection", "close")
+            elif response.status != 304:
+                self.send_header("Content-Length", str(len(response.body)))
+            self.end_headers()
+            if isinstance(response.body, FileBody):
+                # Straight from the page cache to the socket
+                with open(response.body.path, "rb") as fd:
+                    self.connection.sendfile(fd, response.body.offset, response.body.count)
+            elif isinstance(response.body, StreamBody):
+                self._sendStream(response.body.chunks)
             else:
-                # Serving a file
-                self._serveFile(normalPath)
+                self.wfile.write(response.body)
         except:
             self.send_response_only(500)
             raise
+
+    def _sendStream(self, chunks):
+        """ Write each chunk as soon as it is produced. The headers are already out, so an error can't become a 500
+            response; it is logged and the connection is closed, which the client sees as a truncated body """
+        try:
+            for chunk in chunks:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except Exception:
+            self.log_error("Streamed response failed:\n%s", traceback.format_exc())
+            self.close_connection = True
+        finally:
+            # Stops the work behind the chunks straight away if the client went away
+            if hasattr(chunks, "close"):
+                chunks.close()
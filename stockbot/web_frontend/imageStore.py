@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+from os.path import dirname, realpath
+from collections import OrderedDict
+from threading import Lock
+from hashlib import sha256
+from time import time
+import os
+
+
+# Where images are shared between worker processes, and how long, in seconds, shared images are kept after they were last stored
+SHARED_IMAGES_DIR = dirname(dirname(realpath(__file__))) + "/cache/images"
+SHARED_IMAGE_MAX_AGE = 60 * 60
+# Expired shared images are deleted every this many stores
+_PRUNE_INTERVAL = 256
+
+
+class ImageStore:
+    """ A bounded LRU store of PNG images, keyed on the SHA-256 of their bytes so identical images share one URL """
+    def __init__(self, maxBytes = 32 * 1024 * 1024, maxImages = 4096):
+        """ Constructor. Keeps at most maxImages images and maxBytes bytes of them """
+        self.maxBytes = maxBytes
+        self.maxImages = maxImages
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        self._directory = None
+        self._maxAge = SHARED_IMAGE_MAX_AGE
+        self._stores = 0
+
+    def enableSharing(self, directory = SHARED_IMAGES_DIR, maxAge = SHARED_IMAGE_MAX_AGE):
+        """ Also keep images in a directory, so worker processes can serve images stored by other workers.
+            Images there are deleted maxAge seconds after they were last stored """
+        os.makedirs(directory, exist_ok=True)
+        self._maxAge = maxAge
+        self._directory = directory
+
+    def _sharedPath(self, digest):
+        return "{}/{}.png".format(self._directory, digest)
+
+    def _share(self, digest, pngBytes):
+        """ Write an image to the shared directory, or refresh its time if it is already there """
+        path = self._sharedPath(digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Write a temporary file and rename it, so other workers never read a partial image
+            tempPath = "{}.{}.tmp".format(path, os.getpid())
+            with open(tempPath, "wb") as fd:
+                fd.write(pngBytes)
+            os.replace(tempPath, path)
+        self._stores += 1
+        if self._stores % _PRUNE_INTERVAL == 0:
+            self._prune()
+
+    def _prune(self):
+        """ Delete shared images which weren't stored for maxAge seconds """
+        expired = time() - self._maxAge
+        for entry in os.scandir(self._directory):
+            try:
+                if entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # Another worker deleted it first
+                pass
+
+    def _loadShared(self, digest):
+        """ Get an image another worker stored, or None """
+        try:
+            with open(self._sharedPath(digest), "rb") as fd:
+                return fd.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, pngBytes):
+        """ Store an image and get its hash """
+        digest = sha256(pngBytes).hexdigest()
+        self._store(digest, pngBytes)
+        if self._directory != None:
+            self._share(digest, pngBytes)
+        return digest
+
+    def _store(self, digest, pngBytes):
+        with self._lock:
+            if digest in self._images:
+                self._images.move_to_end(digest)
+                return
+            self._images[digest] = pngBytes
+            self._size += len(pngBytes)
+            while len(self._images) > self.maxImages or (self._size > self.maxBytes and len(self._images) > 1):
+                _, evicted = self._images.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get(self, digest):
+        """ Get an image's bytes from its hash, or None if it isn't stored (any more) """
+        with self._lock:
+            pngBytes = self._images.get(digest)
+            if pngBytes != None:
+                self._images.move_to_end(digest)
+                self.hits += 1
+                return pngBytes
+
+        pngBytes = self._loadShared(digest) if self._directory != None else None
+        with self._lock:
+            if pngBytes == None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._store(digest, pngBytes)
+        return pngBytes
+
+    def getStats(self):
+        """ Get hit/miss counters and occupancy as a dictionary """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._images),
+                "bytes": self._size,
+                "maxBytes": self.maxBytes
+            }
+
+
+imageStore = ImageStore()
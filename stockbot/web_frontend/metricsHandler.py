@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+from ..instrumentation import instrumentation
+from ..metrics import getMetrics
+from .rawResponse import RawResponse
+from .restError import RESTError
+
+
+def metrics(_, queries):
+    outputFormat = queries["format"][0] if "format" in queries.keys() else "json"
+    if outputFormat == "json":
+        result = instrumentation.toDict()
+        result["queries"] = getMetrics()
+        return result
+    elif outputFormat == "prometheus":
+        text = instrumentation.toPrometheus()
+        text += "# TYPE stockbot_queries_total counter\nstockbot_queries_total {}\n".format(getMetrics())
+        return RawResponse("text/plain; version=0.0.4; charset=utf-8", text.encode("utf-8"))
+    else:
+        raise RESTError(1, "Unknown metrics format '{}'. Use 'json' or 'prometheus'".format(outputFormat))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import json
+from .restError import RESTError
+from .rawResponse import StreamResponse
+from ..predict import predict_stream, apredict_stream
+from ..quota import BACKGROUND
+
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+# Symbols per call. Each one may cost an upstream call, so large lists are better split across calls
+MAX_SYMBOLS = 100
+# Bulk calls fetch at background priority, so they can't use up the quota reserved for chat queries
+PRIORITY = BACKGROUND
+
+
+def _symbols(queries):
+    """ Get the symbols of a call, given as symbols=A,B,C and/or repeated symbol parameters """
+    symbols = [symbol.strip() for value in queries.get("symbols", []) for symbol in value.split(",")]
+    symbols += [symbol.strip() for symbol in queries.get("symbol", [])]
+    symbols = [symbol for symbol in symbols if symbol != ""]
+    if len(symbols) == 0:
+        raise RESTError(0, "Query parameter 'symbols' missing")
+    if len(symbols) > MAX_SYMBOLS:
+        raise RESTError(2, "At most {} symbols can be predicted for per call".format(MAX_SYMBOLS))
+    return symbols
+
+
+def _line(result):
+    return (json.dumps(result) + "\n").encode("utf-8")
+
+
+def predict(queryHandler, queries):
+    """ Stream a JSON line per symbol as its prediction completes """
+    results = predict_stream(queryHandler.predictor, _symbols(queries), PRIORITY)
+    return StreamResponse(NDJSON_MIMETYPE, (_line(result) for result in results))
+
+
+async def apredict(queryHandler, queries):
+    symbols = _symbols(queries)
+
+    async def lines():
+        async for result in apredict_stream(queryHandler.predictor, symbols, queryHandler.executor, PRIORITY):
+            yield _line(result)
+    return StreamResponse(NDJSON_MIMETYPE, lines())
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
-from io import BytesIO
 from base64 import b64encode
+from .restError import RESTError
+from .imageStore import imageStore
 
 
 def query(queryHandler, queries):
@@ -8,13 +9,26 @@ def query(queryHandler, queries):
         raise RESTError(0, "Query parameter 'query' missing")
     
     answer, image = queryHandler.queryChatbot(queries["query"][0])
-    
-    # Encode image as base64
+    return _queryResult(answer, image, queries)
+
+
+async def aquery(queryHandler, queries):
+    if "query" not in queries.keys():
+        raise RESTError(0, "Query parameter 'query' missing")
+
+    answer, image = await queryHandler.aqueryChatbot(queries["query"][0])
+    return _queryResult(answer, image, queries)
+
+
+def _queryResult(answer, image, queries):
+    # Images are fetched separately from a cacheable URL. Clients which want the PNG inline as base64 pass image=base64
     if image == None:
-        imageBase64 = None
+        return {"response": answer, "image": None, "imageURL": None}
+
+    imageURL = "/api/image/{}.png".format(imageStore.put(image))
+    if queries.get("image", [None])[0] == "base64":
+        imageBase64 = b64encode(image).decode("utf-8")
     else:
-        byteBuffer = BytesIO()
-        image.save(byteBuffer, format='PNG')
-        imageBase64 = b64encode(byteBuffer.getvalue()).decode("utf-8")
+        imageBase64 = None
 
-    return {"response": answer, "image": imageBase64}
+    return {"response": answer, "image": imageBase64, "imageURL": imageURL}
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+
+class RawResponse:
+    """ Returned by REST API handlers to send a body as-is instead of as JSON """
+    def __init__(self, mimetype, bytebuf):
+        self.mimetype = mimetype
+        self.bytebuf = bytebuf
+
+
+class StreamResponse:
+    """ Returned by REST API handlers to send a body in chunks as they are produced, instead of all at once.
+        chunks is an iterable of bytes, or an async iterable for coroutine handlers """
+    def __init__(self, mimetype, chunks):
+        self.mimetype = mimetype
+        self.chunks = chunks
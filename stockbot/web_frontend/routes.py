@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+from urllib.parse import urlparse, parse_qs
+import asyncio
+import json
+import re
+from .apiHandlers import apiHandlers, asyncApiHandlers
+from .restError import RESTError
+from .rawResponse import RawResponse, StreamResponse
+from .fileCacher import *
+from .imageStore import imageStore
+
+apiPathRegex = re.compile(r'^/api/([^/]*)$')
+imagePathRegex = re.compile(r'^/api/image/([0-9a-f]{64})\.png$')
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class Response:
+    """ A response to a request, independent of the server sending it. headers is a list of extra (name, value) pairs """
+    def __init__(self, status, mimetype = None, body = b"", reason = None, headers = None):
+        self.status = status
+        self.mimetype = mimetype
+        self.body = body
+        self.reason = reason
+        self.headers = headers if headers != None else []
+
+
+class StreamBody:
+    """ A response body of unknown length, sent chunk by chunk as chunks (an iterable or async iterable of bytes) yields them """
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+
+def _parseTarget(target):
+    """ Split a request target into its path and query parameters """
+    processed = urlparse(target)
+    return processed.path, parse_qs(processed.query)
+
+
+def _fileResponse(path, headers, log):
+    if path == '/':
+        path = '/index.html'
+
+    log('Serving file "{}"'.format(path))
+    if isFileInCache(path):
+        thisFile = getFileFromCache(path)
+        encoding, etag, body = thisFile.negotiate(headers.get("accept-encoding"))
+        if thisFile.isNotModified(headers.get("if-none-match"), headers.get("if-modified-since")):
+            return Response(304, headers=thisFile.cacheHeaders(etag, encoding))
+
+        rangeHeader = headers.get("range")
+        if rangeHeader != None and thisFile.rangeApplies(headers.get("if-range")):
+            # Ranges are served from the uncompressed file
+            encoding, etag, body = thisFile.negotiate("identity")
+            try:
+                byteRange = parseRange(rangeHeader, len(body))
+            except RangeNotSatisfiable:
+                return Response(416, headers=[("Content-Range", "bytes */{}".format(len(body)))])
+            if byteRange != None:
+                start, stop = byteRange
+                rangeHeaders = thisFile.cacheHeaders(etag, encoding) + [("Content-Range", "bytes {}-{}/{}".format(start, stop - 1, len(body)))]
+                return Response(206, thisFile.mimetype, sliceBody(body, start, stop), headers=rangeHeaders)
+
+        return Response(200, thisFile.mimetype, body, headers=thisFile.cacheHeaders(etag, encoding))
+    else:
+        notFoundFile = getFileFromCache(None)
+        log("File missing. Sending 404 page...")
+        # The page may be held on disk, so its body comes from the variants like any other file's
+        encoding, _, body = notFoundFile.negotiate(headers.get("accept-encoding"))
+        notFoundHeaders = [("Vary", "Accept-Encoding")] if len(notFoundFile.variants) > 1 else []
+        if encoding != "identity":
+            notFoundHeaders.append(("Content-Encoding", encoding))
+        return Response(404, notFoundFile.mimetype, body, headers=notFoundHeaders)
+
+
+def _resultResponse(result):
+    if isinstance(result, RawResponse):
+        return Response(200, result.mimetype, result.bytebuf)
+    if isinstance(result, StreamResponse):
+        return Response(200, result.mimetype, StreamBody(result.chunks), headers=[("Cache-Control", "no-store")])
+    return Response(200, "application/json", json.dumps(result).encode("utf-8"))
+
+
+def _restErrorResponse(e):
+    errorDict = {
+        'code': e.code,
+        'message': e.message
+    }
+    return Response(403, "application/json", json.dumps(errorDict).encode("utf-8"), "REST API call failed")
+
+
+def _imageResponse(digest, headers, log):
+    log('Serving image "{}"'.format(digest))
+    etag = '"{}"'.format(digest)
+    imageHeaders = [("ETag", etag), ("Cache-Control", IMAGE_CACHE_CONTROL)]
+    ifNoneMatch = headers.get("if-none-match")
+    if ifNoneMatch != None and etagMatches(ifNoneMatch, (etag,)):
+        return Response(304, headers=imageHeaders)
+    pngBytes = imageStore.get(digest)
+    if pngBytes == None:
+        return Response(404, reason="Image not found (it may have expired)")
+    return Response(200, "image/png", pngBytes, headers=imageHeaders)
+
+
+def _unknownCallResponse(callName, log):
+    responseMessage = 'Unknown REST API call "{}"'.format(callName)
+    log(responseMessage)
+    return Response(404, reason=responseMessage)
+
+
+def handleGET(queryHandler, target, headers, log):
+    """ Serve a GET request for a static file or REST API call. headers is a dictionary of request headers with lowercase
+        names, and log is called with messages to log """
+    path, queries = _parseTarget(target)
+    imageMatch = re.match(imagePathRegex, path)
+    if imageMatch != None:
+        return _imageResponse(imageMatch.group(1), headers, log)
+    apiMatch = re.match(apiPathRegex, path)
+    if apiMatch == None:
+        return _fileResponse(path, headers, log)
+
+    callName = apiMatch.group(1)
+    if callName not in apiHandlers.keys():
+        return _unknownCallResponse(callName, log)
+
+    log('Serving REST API call "{}"'.format(callName))
+    try:
+        return _resultResponse(apiHandlers[callName](queryHandler, queries))
+    except RESTError as e:
+        return _restErrorResponse(e)
+
+
+async def ahandleGET(queryHandler, target, headers, log, executor):
+    """ Same as handleGET, for event loops. Calls with a coroutine handler run on the loop; the others run in executor """
+    path, queries = _parseTarget(target)
+    imageMatch = re.match(imagePathRegex, path)
+    if imageMatch != None:
+        return _imageResponse(imageMatch.group(1), headers, log)
+    apiMatch = re.match(apiPathRegex, path)
+    if apiMatch == None:
+        return _fileResponse(path, headers, log)
+
+    callName = apiMatch.group(1)
+    if callName not in apiHandlers.keys():
+        return _unknownCallResponse(callName, log)
+
+    log('Serving REST API call "{}"'.format(callName))
+    try:
+        if callName in asyncApiHandlers.keys():
+            result = await asyncApiHandlers[callName](queryHandler, queries)
+        else:
+            result = await asyncio.get_running_loop().run_in_executor(executor, apiHandlers[callName], queryHandler, queries)
+        return _resultResponse(result)
+    except RESTError as e:
+        return _restErrorResponse(e)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+from multiprocessing.connection import wait
+from time import monotonic
+import multiprocessing
+import traceback
+import atexit
+import signal
+import socket
+import sys
+
+
+# A worker which exits sooner than this after starting is taken to be broken, instead of restarted forever
+MIN_WORKER_UPTIME = 5
+# Seconds workers get to run their exit handlers (e.g. flushing metrics) when stopped, before they are killed
+WORKER_STOP_TIMEOUT = 10
+
+
+def listeningSocket(host, port, backlog = 1024):
+    """ Bind a TCP socket for worker processes to share. It is non-blocking, so a worker which loses the race for
+        a connection gets an error from accept instead of blocking in it """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class WorkerPool:
+    """ Pre-forked worker processes, each running serve(sock, index) to serve connections from the same listening socket.
+        The kernel hands each connection to one of them, so CPU-bound work such as QR encoding runs on as many cores as
+        there are workers and cores instead of taking turns on the GIL. Workers which crash are restarted """
+    def __init__(self, serve, processes, sock):
+        """ Constructor. Anything the workers should share copy-on-write, such as cached static files, should be loaded
+            before start; threads and connections should be made in serve, as forking doesn't copy threads """
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("Worker processes need fork, which this platform doesn't have")
+        self.serve = serve
+        self.processes = processes
+        self.sock = sock
+        self.restarts = 0
+        self._context = multiprocessing.get_context("fork")
+        # Worker index to (process, start time)
+        self._workers = dict()
+
+    def _startWorker(self, index):
+        process = self._context.Process(target=_runWorker, args=(self.serve, self.sock, index), name="Worker-{}".format(index), daemon=True)
+        process.start()
+        self._workers[index] = (process, monotonic())
+
+    def start(self):
+        """ Fork the workers """
+        for index in range(self.processes):
+            self._startWorker(index)
+
+    def serveForever(self):
+        """ Start the workers if needed, and restart any which exit until interrupted or terminated, then stop them.
+            Raises RuntimeError if a worker exits straight after starting """
+        # Stop the workers too when this process is told to terminate
+        signal.signal(signal.SIGTERM, _exitOnSignal)
+        if len(self._workers) == 0:
+            self.start()
+        try:
+            self._supervise()
+        finally:
+            self.close()
+
+    def _supervise(self):
+        while True:
+            wait([process.sentinel for process, _ in self._workers.values()])
+            for index, (process, started) in list(self._workers.items()):
+                if process.is_alive():
+                    continue
+                process.join()
+                if monotonic() - started < MIN_WORKER_UPTIME:
+                    raise RuntimeError("Worker {} exited straight after starting, with code {}".format(index, process.exitcode))
+                print("Worker {} exited with code {}, restarting it".format(index, process.exitcode))
+                self.restarts += 1
+                self._startWorker(index)
+
+    def close(self):
+        """ Stop the workers and the listening socket. Does nothing if they were already stopped """
+        for process, _ in self._workers.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = monotonic() + WORKER_STOP_TIMEOUT
+        for index, (process, _) in self._workers.items():
+            process.join(max(0, deadline - monotonic()))
+            if process.is_alive():
+                print("Worker {} didn't stop in time, killing it".format(index))
+                process.kill()
+                process.join()
+        self._workers.clear()
+        self.sock.close()
+
+
+def _exitOnSignal(signum, frame):
+    sys.exit(0)
+
+
+def _runWorker(serve, sock, index):
+    # SIGTERM unwinds serve like Ctrl-C does, so exit handlers run
+    signal.signal(signal.SIGTERM, _exitOnSignal)
+    try:
+        serve(sock, index)
+    except (KeyboardInterrupt, SystemExit):
+        # The whole process group gets Ctrl-C; the parent reports stopping
+        pass
+    except Exception:
+        traceback.print_exc()
+        raise SystemExit(1)
+    finally:
+        # Forked processes leave with os._exit, which skips atexit handlers such as the final metrics flush
+        atexit._run_exitfuncs()